@@ -81,7 +81,7 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'reagents.authentication.JWTClaimsAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAdminUser',
@@ -101,6 +101,7 @@ if not DEBUG:
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=8),
     'UPDATE_LAST_LOGIN': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'reagents.serializers.TokenObtainPairSerializer',
 }
 
 DRF_STANDARDIZED_ERRORS = {'EXCEPTION_HANDLER_CLASS': 'reagents.exceptions.DrfExceptionHandler'}
@@ -143,6 +144,31 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# "default" keeps the versions of the cached data and must be shared by all processes of the application
+# (see `reagents.cache`). It's a LocMem cache of the process unless a shared backend is given with CACHE_BACKEND
+# and CACHE_LOCATION, e.g. `django.core.cache.backends.redis.RedisCache` and `redis://127.0.0.1:6379`.
+# The claims of access tokens are trusted only with a shared backend (see `reagents.authentication`), so by default
+# every request loads its user from the database.
+# "local" keeps the cached values in every process.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'shared'),
+        'KEY_PREFIX': 'lab_flow',
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'local',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -44,12 +44,15 @@ router.register(r'laboratories', views.LaboratoryViewSet)
 router.register(r'personal-reagents', views.PersonalReagentViewSet, basename="personal_reagents")
 router.register(r'notifications', views.NotificationViewSet, basename="notifications")
 router.register(r'reagent-requests', views.ReagentRequestViewSet)
+router.register(r'report-jobs', views.ReportJobViewSet)
 
 urlpatterns = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('', include(router.urls)),
     path('user-manual/', views.UserManualView.as_view(), name='user_manual'),
+    path('reference-data/', views.ReferenceDataView.as_view(), name='reference_data'),
+    path('versions/', views.VersionsView.as_view(), name='versions'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 if settings.DEBUG:
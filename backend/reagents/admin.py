@@ -18,3 +18,4 @@ admin.site.register(models.Reagent)
 admin.site.register(models.ProjectProcedure)
 admin.site.register(models.PersonalReagent)
 admin.site.register(models.ReagentRequest)
+admin.site.register(models.ReportJob)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ReagentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reagents'
+
+    def ready(self):
+        from reagents import checks, signals  # pylint: disable=import-outside-toplevel,unused-import
@@ -0,0 +1,103 @@
+"""JWT authentication without a query for the user.
+
+The tokens carry the fields of the user which the permissions need (see `USER_CLAIMS`), so the user is built
+from them instead of being loaded from the database. The other fields are deferred and loaded when accessed.
+Every change of a user (except logins, which only update `last_login`) revokes the claims of the tokens issued
+before it, and then the user is loaded from the database as usual until a new token is obtained.
+
+The time of the revocation is kept in `User.claims_revoked_at` and copied to the shared cache, which is checked
+for every request. The claims are trusted only if the cache has it, so a user whose revocation has been evicted
+from the cache (or hasn't been cached yet) is loaded from the database, which caches it again. Without a shared
+cache (e.g. the default LocMem one, which every process has its own) the claims are never trusted.
+"""
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import aware_utcnow, datetime_to_epoch
+
+from reagents import cache, models
+
+USER_CLAIMS = ["is_active", "is_staff", "lab_roles"]
+# The time when the claims were read from the database, the access tokens copy it from their refresh token
+CLAIMS_ISSUED_AT_CLAIM = "claims_iat"
+
+
+class RefreshToken(tokens.RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        token.set_iat(claim=CLAIMS_ISSUED_AT_CLAIM, at_time=token.current_time)
+        return token
+
+
+def get_revocation_key(user_id):
+    return f"user_claims_revocation:{user_id}"
+
+
+def cache_revocations(revocations, only_missing=False):
+    """Cache the times of the revocations (user id -> datetime or `None` if the claims have never been revoked).
+    A refresh token is the oldest source of the claims, so they are kept only as long as it's valid."""
+    shared_cache = cache.get_shared_cache()
+    timeout = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+    for user_id, revoked_at in revocations.items():
+        value = datetime_to_epoch(revoked_at) if revoked_at is not None else 0
+        if only_missing:
+            # Doesn't overwrite a revocation cached after the user was loaded
+            shared_cache.add(get_revocation_key(user_id), value, timeout)
+        else:
+            shared_cache.set(get_revocation_key(user_id), value, timeout)
+
+
+def store_revocations(user_ids):
+    revoked_at = aware_utcnow()
+    models.User.objects.filter(id__in=user_ids).update(claims_revoked_at=revoked_at)
+    cache_revocations({user_id: revoked_at for user_id in user_ids})
+
+
+def revoke_claims(user_ids):
+    """Revoke the claims of the tokens issued so far. Other processes read the old user until the change is
+    committed, so the claims of the tokens they issue in the meantime are revoked again after the commit."""
+    store_revocations(user_ids)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: store_revocations(user_ids))
+
+
+def are_claims_trusted(user_id, claims_issued_at):
+    if not cache.is_shared_cache_configured():
+        return False
+    revoked_at = cache.get_shared_cache().get(get_revocation_key(user_id))
+    # Also revoked in the same second, the times have a resolution of seconds
+    return revoked_at is not None and claims_issued_at > revoked_at
+
+
+class JWTClaimsAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        claims_issued_at = validated_token.get(CLAIMS_ISSUED_AT_CLAIM)
+        if (
+            user_id is None or claims_issued_at is None or any(claim not in validated_token for claim in USER_CLAIMS)
+            or not are_claims_trusted(user_id, claims_issued_at)
+        ):
+            user = super().get_user(validated_token)
+            if cache.is_shared_cache_configured():
+                cache_revocations({user.id: user.claims_revoked_at}, only_missing=True)
+            return user
+
+        if not validated_token["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        values = {"id": user_id, **{claim: validated_token[claim] for claim in USER_CLAIMS}}
+        fields = [
+            field for field in models.User._meta.concrete_fields  # pylint: disable=protected-access
+            if field.attname in values
+        ]
+        return models.User.from_db(
+            DEFAULT_DB_ALIAS, [field.attname for field in fields], [values[field.attname] for field in fields]
+        )
@@ -0,0 +1,90 @@
+"""Namespaced caching with version-aware invalidation.
+
+Two caches are configured (see `CACHES` in the settings):
+    - "default" is shared by all processes of the application when a shared backend is configured,
+      it keeps the versions of the namespaces,
+    - "local" is a LocMem cache of the process, it keeps the cached values.
+The version is a part of the keys of the values, so changing it in the shared cache makes the values cached
+by every process unreachable at once. They are generated again with the new version and the old ones expire.
+"""
+
+import hashlib
+import json
+import uuid
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+SHARED_CACHE_ALIAS = "default"
+LOCAL_CACHE_ALIAS = "local"
+
+
+def get_shared_cache():
+    return caches[SHARED_CACHE_ALIAS]
+
+
+def get_local_cache():
+    return caches[LOCAL_CACHE_ALIAS]
+
+
+def is_shared_cache_configured():
+    """Whether "default" is shared by all processes, a LocMem cache belongs to a single process."""
+    return not isinstance(get_shared_cache(), LocMemCache)
+
+
+def make_version(*parts):
+    """Return a version which changes with any of the JSON serializable parts, e.g. the change versions of models."""
+    return hashlib.md5(
+        json.dumps(parts, sort_keys=True, default=str).encode(), usedforsecurity=False
+    ).hexdigest()
+
+
+class Namespace:
+    """A group of cached values which are invalidated together.
+
+    The values are kept under `<name>:<version>:<key>`. The version is either the own version of the namespace,
+    changed by `invalidate()`, or the one given to `get_or_set()` for values which depend on versions kept elsewhere.
+    The timeout only covers the changes made without invalidating the namespace.
+    """
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+
+    @property
+    def version_key(self):
+        return f"{self.name}:version"
+
+    def get_version(self):
+        shared_cache = get_shared_cache()
+        version = shared_cache.get(self.version_key)
+        if version is None:
+            shared_cache.add(self.version_key, uuid.uuid4().hex, None)
+            version = shared_cache.get(self.version_key)
+        return version
+
+    def change_version(self):
+        get_shared_cache().set(self.version_key, uuid.uuid4().hex, None)
+
+    def invalidate(self):
+        """Invalidate all values of the namespace at once by changing its version now and once more after
+        the current transaction is committed (like `versions.bump_versions()`), so that a value generated
+        from the data from before the commit isn't kept with the new version."""
+        self.change_version()
+        transaction.on_commit(self.change_version)
+
+    def make_key(self, key, version=None):
+        if version is None:
+            version = self.get_version()
+        return f"{self.name}:{version}:{key}"
+
+    def get_or_set(self, key, generate, *args, version=None):
+        """Return the value cached under `key` or generate and cache it with `generate(*args)`."""
+        key = self.make_key(key, version)
+        local_cache = get_local_cache()
+        value = local_cache.get(key)
+        if value is None:
+            value = generate(*args)
+            local_cache.set(key, value, self.timeout)
+        return value
@@ -0,0 +1,26 @@
+from django.core.checks import Tags, Warning, register  # pylint: disable=redefined-builtin
+from django.db import connections
+
+from reagents import filters, models
+
+
+@register(Tags.database)
+def check_trigram_indexes(app_configs, databases=None, **kwargs):  # pylint: disable=unused-argument
+    """The trigram indexes aren't created by the migrations if the server doesn't provide pg_trgm."""
+    if not databases or "default" not in databases:
+        return []
+
+    connection = connections["default"]
+    if models.Reagent._meta.db_table not in connection.introspection.table_names():  # pylint: disable=protected-access
+        # Not migrated yet
+        return []
+
+    if missing_indexes := filters.get_missing_trigram_indexes(connection):
+        return [
+            Warning(
+                f"The search indexes are missing: {', '.join(index.name for _, index in missing_indexes)}.",
+                hint="Install the PostgreSQL contrib package and run `python manage.py create_search_indexes`.",
+                id="reagents.W001",
+            )
+        ]
+    return []
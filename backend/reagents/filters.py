@@ -1,6 +1,177 @@
+import operator
+
+from functools import reduce
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.core.exceptions import ValidationError
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Upper
+
 from django_filters import rest_framework as filters
+from django_filters.fields import ModelMultipleChoiceField, MultipleChoiceField
+
+from rest_framework.filters import SearchFilter
+
+from reagents import cache, models
+
+
+class TrigramSearchFilter(SearchFilter):
+    """`SearchFilter` whose conditions can use the trigram GIN indexes on `UPPER(field)`
+    (`icontains` is translated to `UPPER(field::text) LIKE UPPER(%term%)`).
+    A condition on a field of a related model becomes a subquery on that model instead of a condition on joined rows,
+    so that the index of the related table is used.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+        if not search_fields or not search_terms:
+            return queryset
+
+        search_field_models = [
+            self.get_search_field_model(queryset.model, search_field) for search_field in search_fields
+        ]
+        if any(model is None for model in search_field_models):
+            return super().filter_queryset(request, queryset, view)
+
+        for search_term in search_terms:
+            queryset = queryset.filter(reduce(operator.or_, [
+                self.get_search_condition(search_field, related_model, search_term)
+                for search_field, related_model in zip(search_fields, search_field_models)
+            ]))
+
+        return queryset
+
+    def get_search_field_model(self, model, search_field):
+        """Return the model of the searched field or `None` if the field isn't supported
+        (it has a lookup prefix or it's reached through a relation to many objects)."""
+        if search_field[0] in self.lookup_prefixes:
+            return None
+
+        for relation in search_field.split(LOOKUP_SEP)[:-1]:
+            field = model._meta.get_field(relation)  # pylint: disable=protected-access
+            if not (field.many_to_one or field.one_to_one) or not field.concrete:
+                return None
+            model = field.related_model
+
+        return model
+
+    @staticmethod
+    def get_search_condition(search_field, related_model, search_term):
+        *relations, field_name = search_field.split(LOOKUP_SEP)
+        condition = {f"{field_name}__icontains": search_term}
+        if not relations:
+            return Q(**condition)
+
+        return Q(**{
+            f"{LOOKUP_SEP.join(relations)}__in": related_model._default_manager.filter(  # pylint: disable=protected-access
+                **condition
+            ).values("pk"),
+        })
+
+
+# The trigram indexes used by `TrigramSearchFilter`. They need pg_trgm (a part of the PostgreSQL contrib package),
+# so they aren't a part of the models. The migrations create them when the server provides the extension,
+# otherwise they are created by `python manage.py create_search_indexes` (see the `reagents.W001` check).
+TRIGRAM_INDEXES = [
+    (model, GinIndex(OpClass(Upper(field_name), name="gin_trgm_ops"), name=index_name))
+    for model, field_name, index_name in [
+        (models.Producer, "abbreviation", "producer_abbrev_trgm_idx"),
+        (models.Reagent, "name", "reagent_name_trgm_idx"),
+        (models.Reagent, "catalog_no", "reagent_catalog_no_trgm_idx"),
+        (models.SafetyInstruction, "name", "safety_instr_name_trgm_idx"),
+        (models.User, "username", "user_username_trgm_idx"),
+    ]
+]
+
+
+def get_missing_trigram_indexes(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE indexname = ANY(%s)",
+            [[index.name for _, index in TRIGRAM_INDEXES]],
+        )
+        existing_index_names = {index_name for index_name, in cursor.fetchall()}
+    return [(model, index) for model, index in TRIGRAM_INDEXES if index.name not in existing_index_names]
 
-from reagents import models
+
+def create_trigram_indexes(connection):
+    """Create the extension and the missing indexes, can be run again. Return the created indexes."""
+    missing_indexes = get_missing_trigram_indexes(connection)
+    with connection.schema_editor() as schema_editor:
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for model, index in missing_indexes:
+            schema_editor.add_index(model, index)
+    return missing_indexes
+
+
+# Invalidated by signals (see `reagents.signals`) and after bulk changes (see `views.invalidate_statistics_and_facets`)
+FACETS_CACHE = cache.Namespace("facets", timeout=60 * 60)
+
+
+def invalidate_facets():
+    FACETS_CACHE.invalidate()
+
+
+def get_cached_facets(name, generate_facets, *args):
+    return FACETS_CACHE.get_or_set(name, generate_facets, *args)
+
+
+class AnyValueMultipleChoiceField(MultipleChoiceField):
+    """`MultipleChoiceField` which accepts any values, so they don't have to be known in advance."""
+
+    def valid_value(self, value):  # pylint: disable=unused-argument
+        return True
+
+
+class AnyValueMultipleFilter(filters.MultipleChoiceFilter):
+    """Like `AllValuesMultipleFilter`, but the values aren't validated against the distinct values of the field
+    in the whole table, so they aren't queried every time the filterset is used.
+    A value which doesn't exist matches no objects."""
+    field_class = AnyValueMultipleChoiceField
+
+
+class ModelIdMultipleChoiceField(ModelMultipleChoiceField):
+    """Like `ModelMultipleChoiceField`, but the submitted primary keys are validated with one `values_list` query
+    and a list of them is returned instead of a queryset of model instances."""
+
+    def _check_values(self, value):
+        key = self.to_field_name or "pk"
+        try:
+            value = frozenset(value)
+        except TypeError as exception:
+            raise ValidationError(self.error_messages["invalid_list"], code="invalid_list") from exception
+        for pk in value:
+            try:
+                self.queryset.filter(**{key: pk})
+            except (ValueError, TypeError) as exception:
+                raise ValidationError(
+                    self.error_messages["invalid_pk_value"], code="invalid_pk_value", params={"pk": pk}
+                ) from exception
+
+        pks = list(self.queryset.filter(**{f"{key}__in": value}).values_list(key, flat=True))
+        existing = {str(pk) for pk in pks}
+        for val in value:
+            if str(val) not in existing:
+                raise ValidationError(
+                    self.error_messages["invalid_choice"], code="invalid_choice", params={"value": val}
+                )
+        return pks
+
+
+class ModelIdMultipleChoiceFilter(filters.ModelMultipleChoiceFilter):
+    """`ModelMultipleChoiceFilter` which doesn't instantiate the related objects.
+    The values are validated with a single existence query and the queryset is filtered with one `__in` lookup
+    instead of an OR of equality conditions."""
+    field_class = ModelIdMultipleChoiceField
+
+    def filter(self, qs, value):
+        if not value or self.conjoined or self.lookup_expr != "exact":
+            return super().filter(qs, value)
+
+        qs = self.get_method(qs)(**{f"{self.field_name}__in": value})
+        return qs.distinct() if self.distinct else qs
 
 
 class ReagentFilter(filters.FilterSet):
@@ -29,19 +200,19 @@ class ReagentHistoricalRecordsFilter(ReagentFilter):
 
 
 class PersonalReagentFilter(filters.FilterSet):
-    laboratory = filters.ModelMultipleChoiceFilter(queryset=models.Laboratory.objects.all())
-    project_procedure = filters.ModelMultipleChoiceFilter(queryset=models.ProjectProcedure.objects.all())
-    main_owner = filters.ModelMultipleChoiceFilter(queryset=models.User.objects.all())
-    reagent = filters.ModelMultipleChoiceFilter(queryset=models.Reagent.objects.all())
-    room = filters.AllValuesMultipleFilter()
-    detailed_location = filters.AllValuesMultipleFilter()
-    type = filters.ModelMultipleChoiceFilter(field_name="reagent__type", queryset=models.ReagentType.objects.all())
-    producer = filters.ModelMultipleChoiceFilter(field_name="reagent__producer", queryset=models.Producer.objects.all())
-    clp_classification = filters.ModelMultipleChoiceFilter(
-        field_name="reagent__hazard_statements__clp_classification",
-        queryset=models.ClpClassification.objects.all()
+    laboratory = ModelIdMultipleChoiceFilter(queryset=models.Laboratory.objects.all())
+    project_procedure = ModelIdMultipleChoiceFilter(queryset=models.ProjectProcedure.objects.all())
+    main_owner = ModelIdMultipleChoiceFilter(queryset=models.User.objects.all())
+    reagent = ModelIdMultipleChoiceFilter(queryset=models.Reagent.objects.all())
+    room = AnyValueMultipleFilter()
+    detailed_location = AnyValueMultipleFilter()
+    type = ModelIdMultipleChoiceFilter(field_name="reagent__type", queryset=models.ReagentType.objects.all())
+    producer = ModelIdMultipleChoiceFilter(field_name="reagent__producer", queryset=models.Producer.objects.all())
+    clp_classification = ModelIdMultipleChoiceFilter(
+        queryset=models.ClpClassification.objects.all(),
+        method="filter_clp_classification",
     )
-    cas_no = filters.AllValuesMultipleFilter(field_name="reagent__cas_no")
+    cas_no = AnyValueMultipleFilter(field_name="reagent__cas_no")
     is_usage_record_required = filters.BooleanFilter(field_name="reagent__is_usage_record_required")
     is_validated_by_admin = filters.BooleanFilter(field_name="reagent__is_validated_by_admin")
 
@@ -79,6 +250,17 @@ class PersonalReagentFilter(filters.FilterSet):
         ),
     )
 
+    @staticmethod
+    def filter_clp_classification(queryset, name, value):  # pylint: disable=unused-argument
+        """Filtering with `EXISTS` instead of joining the hazard statements of the reagents
+        doesn't multiply the rows, so no `DISTINCT` is needed."""
+        if not value:
+            return queryset
+        return queryset.filter(Exists(models.HazardStatement.objects.filter(
+            reagent=OuterRef("reagent"),
+            clp_classification__in=value,
+        )))
+
     class Meta:
         model = models.PersonalReagent
         fields = [
@@ -1,14 +1,21 @@
+import csv
+import datetime
 import os
 import io
+import tempfile
 
 from collections import defaultdict
+from itertools import chain, islice
+from xml.sax.saxutils import escape
 
 from django.db.models import Count, F
 from django.db.models.functions import ExtractYear
 from django.utils import timezone
 
+from openpyxl import Workbook
+
 from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
 from reportlab.pdfbase import pdfmetrics
@@ -16,7 +23,20 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
 
-from reagents.models import HazardStatement, PersonalReagent
+from reagents import cache, versions
+from reagents.models import (
+    ClpClassification,
+    Concentration,
+    HazardStatement,
+    Laboratory,
+    PersonalReagent,
+    PrecautionaryStatement,
+    Producer,
+    PurityQuality,
+    ReagentType,
+    StorageCondition,
+    Unit,
+)
 
 REGULAR_FONT = "REGULAR_FONT"
 pdfmetrics.registerFont(TTFont(REGULAR_FONT, os.environ[REGULAR_FONT]))
@@ -32,10 +52,57 @@ STYLES = getSampleStyleSheet()
 MARGIN = 0.98 * inch
 HEADER_AND_FOOTER_HEIGHT = 0.49 * inch
 
+REPORT_TABLE_CHUNK_SIZE = 100
+# The widths of the columns are computed from the first rows only, the rest is streamed into the tables
+REPORT_COLUMN_WIDTHS_SAMPLE_SIZE = 1000
+REPORT_CELL_PADDING = 12  # The default left and right padding of a table cell
+
 
 # REPORTS
 
-class UsageRecordCanvas(Canvas):  # pylint: disable=abstract-method
+class PageCountCanvas(Canvas):  # pylint: disable=abstract-method
+    """A canvas which draws "Strona X z Y" without keeping the pages in memory until the number of pages is known.
+    Every page refers to its own form XObject with the whole text, which is defined in `save()`,
+    so the text can be aligned right whatever the number of pages is.
+    """
+    page_count_font_size = 5
+
+    @staticmethod
+    def get_page_number_form(page_number):
+        return f"page_number_{page_number}"
+
+    def draw_page_number(self, x, y):
+        """Draw "Strona X z Y" aligned right to `x`."""
+        self.saveState()
+        self.translate(x, y)
+        self.doForm(self.get_page_number_form(self._pageNumber))
+        self.restoreState()
+
+    def save(self):
+        """Define the forms with the page numbers."""
+        if len(self._code):
+            self.showPage()
+
+        page_count = self._pageNumber - 1
+        for page_number in range(1, page_count + 1):
+            text = f"Strona {page_number} z {page_count}"
+            width = pdfmetrics.stringWidth(text, REGULAR_FONT, self.page_count_font_size)
+            # The text ends at the origin of the form, which is placed at `x`
+            self.beginForm(
+                self.get_page_number_form(page_number),
+                lowerx=-width,
+                lowery=-self.page_count_font_size,
+                upperx=0,
+                uppery=self.page_count_font_size,
+            )
+            self.setFont(REGULAR_FONT, self.page_count_font_size)
+            self.drawRightString(0, 0, text)
+            self.endForm()
+
+        super().save()
+
+
+class UsageRecordCanvas(PageCountCanvas):  # pylint: disable=abstract-method
     """http://code.activestate.com/recipes/546511-page-x-of-y-with-reportlab/
     http://code.activestate.com/recipes/576832/
     http://www.blog.pythonlibrary.org/2013/08/12/reportlab-how-to-add-page-numbers/
@@ -43,33 +110,19 @@ class UsageRecordCanvas(Canvas):  # pylint: disable=abstract-method
     Modified for more footer information.
     """
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.pages = []
+    page_count_font_size = 10
 
     def showPage(self):
-        """On a page break, add information to the list."""
-        self.pages.append(dict(self.__dict__))
-        self._startPage()
-
-    def save(self):
-        """Add the footer to each page."""
-        page_count = len(self.pages)
-
-        for page in self.pages:
-            self.__dict__.update(page)
-            self.draw_footer(page_count)
-            super().showPage()
-
-        super().save()
+        """Add the footer before the page break."""
+        self.draw_footer()
+        super().showPage()
 
-    def draw_footer(self, page_count):
+    def draw_footer(self):
         """Add the footer."""
 
         # In the template these two are not horizontally aligned. We change that here for better visual effect.
         # The font size stays the same.
-        self.setFont(REGULAR_FONT, 10)
-        self.drawRightString(A4[0] - MARGIN, HEADER_AND_FOOTER_HEIGHT, f"Strona {self._pageNumber} z {page_count}")
+        self.draw_page_number(A4[0] - MARGIN, HEADER_AND_FOOTER_HEIGHT)
 
         self.setFont(ITALIC_FONT, 11)
         self.drawString(MARGIN, HEADER_AND_FOOTER_HEIGHT, "* Niepotrzebne skreślić")
@@ -168,45 +221,34 @@ def generate_usage_record(personal_reagent, num_of_entries):
     return io_buffer
 
 
-class ReportCanvas(Canvas):  # pylint: disable=abstract-method
+class ReportCanvas(PageCountCanvas):  # pylint: disable=abstract-method
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.pages = []
+        self.generation_date = timezone.localtime(timezone.now()).strftime("%Y-%m-%d, %H:%M:%S")
 
     def showPage(self):
-        """On a page break, add information to the list."""
-        self.pages.append(dict(self.__dict__))
-        self._startPage()
-
-    def save(self):
-        """Add the header and the footer to each page."""
-        page_count = len(self.pages)
-
-        for page in self.pages:
-            self.__dict__.update(page)
-            self.draw_header_and_footer(page_count)
-            super().showPage()
-
-        super().save()
+        """Add the header and the footer before the page break."""
+        self.draw_header_and_footer()
+        super().showPage()
 
-    def draw_header_and_footer(self, page_count):
+    def draw_header_and_footer(self):
         """Add the header and the footer."""
         self.setFont(REGULAR_FONT, 5)
 
         self.drawString(MARGIN, A4[0] - HEADER_AND_FOOTER_HEIGHT, 60 * ".")
         self.drawString(MARGIN, A4[0] - HEADER_AND_FOOTER_HEIGHT - 15, "Podpis")
 
-        self.drawRightString(
-            A4[1] - MARGIN,
-            A4[0] - HEADER_AND_FOOTER_HEIGHT,
-            timezone.localtime(timezone.now()).strftime("%Y-%m-%d, %H:%M:%S")
-        )
+        self.drawRightString(A4[1] - MARGIN, A4[0] - HEADER_AND_FOOTER_HEIGHT, self.generation_date)
+
+        self.draw_page_number(A4[1] - MARGIN, HEADER_AND_FOOTER_HEIGHT)
+
 
-        self.drawRightString(A4[1] - MARGIN, HEADER_AND_FOOTER_HEIGHT, f"Strona {self._pageNumber} z {page_count}")
+def get_clp_classifications_repr(reagent):
+    return ", ".join(clp_classification["repr"] for clp_classification in reagent.clp_classifications)
 
 
 def generate_sanepid_pip_report_data(personal_reagents_queryset):
-    report_data = [[
+    yield [
         "Lp.",
         "Nazwa odczynnika",
         "Producent (marka)",
@@ -216,14 +258,11 @@ def generate_sanepid_pip_report_data(personal_reagents_queryset):
         "Data przyjęcia/zakupu",
         "Klasyfikacja CLP",
         "Nr instrukcji bezpieczeństwa",
-    ]]
+    ]
     for idx, personal_reagent in enumerate(personal_reagents_queryset, 1):
         reagent = personal_reagent.reagent
-        clp_classifications = {}
-        for hazard_statement in reagent.hazard_statements.all():
-            clp_classifications[str(hazard_statement.clp_classification)] = None
-        clp_classifications = ", ".join(clp_classifications.keys())
-        report_data.append([
+        clp_classifications = get_clp_classifications_repr(reagent)
+        yield [
             idx,
             reagent.name,
             reagent.producer.abbreviation,
@@ -233,13 +272,11 @@ def generate_sanepid_pip_report_data(personal_reagents_queryset):
             personal_reagent.receipt_purchase_date,
             clp_classifications,
             personal_reagent.reagent.safety_instruction.name,
-        ])
-
-    return report_data
+        ]
 
 
 def generate_lab_manager_report_data(personal_reagents_queryset):
-    report_data = [[
+    yield [
         "Lp.",
         "Nazwa odczynnika",
         "Producent (marka)",
@@ -251,14 +288,11 @@ def generate_lab_manager_report_data(personal_reagents_queryset):
         "Klasyfikacja CLP",
         "Nr instrukcji bezpieczeństwa",
         "Rodzaj odczynnika",
-    ]]
+    ]
     for idx, personal_reagent in enumerate(personal_reagents_queryset, 1):
         reagent = personal_reagent.reagent
-        clp_classifications = {}
-        for hazard_statement in reagent.hazard_statements.all():
-            clp_classifications[str(hazard_statement.clp_classification)] = None
-        clp_classifications = ", ".join(clp_classifications.keys())
-        report_data.append([
+        clp_classifications = get_clp_classifications_repr(reagent)
+        yield [
             idx,
             reagent.name,
             reagent.producer.abbreviation,
@@ -270,13 +304,11 @@ def generate_lab_manager_report_data(personal_reagents_queryset):
             clp_classifications,
             reagent.safety_instruction.name,
             reagent.type,
-        ])
-
-    return report_data
+        ]
 
 
 def generate_projects_procedures_report_data(personal_reagents_queryset):
-    report_data = [[
+    yield [
         "Lp.",
         "Projekt / procedura",
         "Nazwa odczynnika",
@@ -288,14 +320,11 @@ def generate_projects_procedures_report_data(personal_reagents_queryset):
         "Data przyjęcia/zakupu",
         "Data ważności",
         "Klasyfikacja CLP",
-    ]]
+    ]
     for idx, personal_reagent in enumerate(personal_reagents_queryset, 1):
         reagent = personal_reagent.reagent
-        clp_classifications = {}
-        for hazard_statement in reagent.hazard_statements.all():
-            clp_classifications[str(hazard_statement.clp_classification)] = None
-        clp_classifications = ", ".join(clp_classifications.keys())
-        report_data.append([
+        clp_classifications = get_clp_classifications_repr(reagent)
+        yield [
             idx,
             personal_reagent.project_procedure,
             reagent.name,
@@ -307,13 +336,11 @@ def generate_projects_procedures_report_data(personal_reagents_queryset):
             personal_reagent.receipt_purchase_date,
             personal_reagent.expiration_date,
             clp_classifications,
-        ])
-
-    return report_data
+        ]
 
 
 def generate_all_personal_reagents_report_data(personal_reagents_queryset):
-    report_data = [[
+    yield [
         "Lp.",
         "Nazwa\n"
         "odczynnika",
@@ -345,18 +372,15 @@ def generate_all_personal_reagents_report_data(personal_reagents_queryset):
         "karta\n"
         "rozchodu",
         "Uwagi użytkownika",
-    ]]
+    ]
     for idx, personal_reagent in enumerate(personal_reagents_queryset, 1):
         reagent = personal_reagent.reagent
-        clp_classifications = {}
-        for hazard_statement in reagent.hazard_statements.all():
-            clp_classifications[str(hazard_statement.clp_classification)] = None
-        clp_classifications = ", ".join(clp_classifications.keys())
+        clp_classifications = get_clp_classifications_repr(reagent)
         is_usage_record_generated = "Nie dotyczy"
         if reagent.is_usage_record_required:
             is_usage_record_generated = "Tak" if personal_reagent.is_usage_record_generated else "Nie"
 
-        report_data.append([
+        yield [
             idx,
             reagent.name,
             reagent.producer.abbreviation,
@@ -376,13 +400,11 @@ def generate_all_personal_reagents_report_data(personal_reagents_queryset):
             "Tak" if reagent.is_usage_record_required else "Nie",
             is_usage_record_generated,
             personal_reagent.user_comment,
-        ])
-
-    return report_data
+        ]
 
 
 def generate_personal_view_report_data(personal_reagents_queryset):
-    report_data = [[
+    yield [
         "Lp.",
         "Nazwa\n"
         "odczynnika",
@@ -420,31 +442,18 @@ def generate_personal_view_report_data(personal_reagents_queryset):
         "rozchodu",
         "Uwagi\n"
         "użytkownika",
-    ]]
+    ]
     for idx, personal_reagent in enumerate(personal_reagents_queryset, 1):
         reagent = personal_reagent.reagent
-        hazard_statements = reagent.hazard_statements.all()
-        h_codes = ",\n".join(map(lambda x: x.code, hazard_statements))
-        p_codes = ",\n".join(map(lambda x: x.code, reagent.precautionary_statements.all()))
-        clp_classifications = {}
-        for hazard_statement in hazard_statements:
-            clp_classifications[str(hazard_statement.clp_classification)] = None
-        clp_classifications = ", ".join(clp_classifications.keys())
-
-        signal_word = ""
-        signal_words = map(lambda x: x.signal_word, hazard_statements)
-        for sw in signal_words:
-            if sw == HazardStatement.DANGER:
-                signal_word = sw
-                break
-            if sw == HazardStatement.WARNING:
-                signal_word = sw
+        h_codes = ",\n".join(reagent.hazard_statement_codes)
+        p_codes = ",\n".join(reagent.precautionary_statement_codes)
+        clp_classifications = get_clp_classifications_repr(reagent)
 
         is_usage_record_generated = "Nie dotyczy"
         if reagent.is_usage_record_required:
             is_usage_record_generated = "Tak" if personal_reagent.is_usage_record_generated else "Nie"
 
-        report_data.append([
+        yield [
             idx,
             reagent.name,
             reagent.producer.abbreviation,
@@ -457,7 +466,7 @@ def generate_personal_view_report_data(personal_reagents_queryset):
             h_codes,
             p_codes,
             clp_classifications,
-            signal_word,
+            reagent.signal_word,
             personal_reagent.receipt_purchase_date,
             personal_reagent.opening_date,
             personal_reagent.expiration_date,
@@ -468,14 +477,87 @@ def generate_personal_view_report_data(personal_reagents_queryset):
             "Tak" if reagent.is_usage_record_required else "Nie",
             is_usage_record_generated,
             personal_reagent.user_comment,
-        ])
+        ]
+
+
+class ReportDocTemplate(SimpleDocTemplate):
+    """Takes the tables from an iterator while the document is being built,
+    so that only the table which is being laid out is kept in memory."""
+
+    def __init__(self, *args, tables, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tables = tables
+
+    def filterFlowables(self, flowables):
+        # `None` at the end of the story stands for the tables which haven't been taken yet
+        if flowables[0] is None and (table := next(self.tables, None)) is not None:
+            flowables.insert(0, table)
+
+
+def get_report_value_width(value, font_name, data_font_size):
+    if value is None:
+        return REPORT_CELL_PADDING
+    return max(
+        pdfmetrics.stringWidth(line, font_name, data_font_size) for line in str(value).split("\n")
+    ) + REPORT_CELL_PADDING
+
+
+def get_report_column_widths(header, rows, data_font_size):
+    """Compute the widths of the columns the way ReportLab does for a single table with the given rows,
+    so that the columns of all the tables line up."""
+    column_widths = [get_report_value_width(value, BOLD_FONT, data_font_size) for value in header]
+    for row in rows:
+        for idx, value in enumerate(row):
+            column_widths[idx] = max(column_widths[idx], get_report_value_width(value, REGULAR_FONT, data_font_size))
+
+    return column_widths
+
+
+def wrap_wide_values(rows, column_widths, data_font_size):
+    """Put the values wider than their columns (computed from a sample of the rows) into paragraphs,
+    which break them into lines within the cells instead of overflowing them."""
+    style = ParagraphStyle("ReportCell", fontName=REGULAR_FONT, fontSize=data_font_size, leading=data_font_size * 1.2)
+    for row in rows:
+        yield [
+            Paragraph(escape(str(value)).replace("\n", "<br/>"), style)
+            if get_report_value_width(value, REGULAR_FONT, data_font_size) > column_width else value
+            for value, column_width in zip(row, column_widths)
+        ]
+
 
-    return report_data
+def generate_report_tables(header, rows, column_widths, data_font_size):
+    """Split the rows into tables of `REPORT_TABLE_CHUNK_SIZE` rows with the header.
+    Splitting one huge table across pages takes time which grows faster than the number of rows."""
+    report_data_table_style = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("0xF2F2F2")),  # "Gray" background for the first row
+        ("GRID", (0, 0), (-1, -1), 1, colors.black),  # Add a border to all cells
+        ("FONTNAME", (0, 0), (-1, 0), BOLD_FONT),  # Bold text in the first row
+        ("FONTNAME", (0, 1), (-1, -1), REGULAR_FONT),  # Standard font in the rest
+        ("FONTSIZE", (0, 0), (-1, -1), data_font_size),  # Font size indicated by `data_font_size`
+    ])
+
+    rows = iter(rows)
+    chunk = list(islice(rows, REPORT_TABLE_CHUNK_SIZE))
+    # A table with the header only if there are no rows
+    while True:
+        report_data_table = Table([header, *chunk], colWidths=column_widths, repeatRows=1)
+        report_data_table.setStyle(report_data_table_style)
+        yield report_data_table
+        chunk = list(islice(rows, REPORT_TABLE_CHUNK_SIZE))
+        if not chunk:
+            break
 
 
 def generate_report(report_header, requester, report_data, data_font_size):
+    """`report_data` is an iterable of rows, the first of which is the header."""
+    report_data = iter(report_data)
+    header = next(report_data)
+    sample = list(islice(report_data, REPORT_COLUMN_WIDTHS_SAMPLE_SIZE))
+    column_widths = get_report_column_widths(header, sample, data_font_size)
+    rows = chain(sample, wrap_wide_values(report_data, column_widths, data_font_size))
+
     io_buffer = io.BytesIO()
-    pdf_doc = SimpleDocTemplate(
+    pdf_doc = ReportDocTemplate(
         io_buffer,
         pagesize=(A4[1], A4[0]),
         title=report_header,
@@ -485,6 +567,7 @@ def generate_report(report_header, requester, report_data, data_font_size):
         rightMargin=MARGIN,
         topMargin=MARGIN,
         bottomMargin=MARGIN,
+        tables=generate_report_tables(header, rows, column_widths, data_font_size),
     )
 
     title_style = STYLES["Title"]
@@ -492,24 +575,107 @@ def generate_report(report_header, requester, report_data, data_font_size):
     title_style.fontSize = 15
     title = Paragraph(report_header, title_style)
 
-    report_data_table = Table(report_data, repeatRows=1)
+    pdf_doc.build([title, None], canvasmaker=ReportCanvas)
+
+    return io_buffer
+
+
+# EXPORTS
+
+class EchoBuffer:
+    """A file-like object which returns what is written to it instead of storing it,
+    so rows formatted by `csv.writer` can be yielded one by one."""
+
+    def write(self, value):
+        return value
 
-    report_data_table_style = TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("0xF2F2F2")),  # "Gray" background for the first row
-        ("GRID", (0, 0), (-1, -1), 1, colors.black),  # Add a border to all cells
-        ("FONTNAME", (0, 0), (-1, 0), BOLD_FONT),  # Bold text in the first row
-        ("FONTNAME", (0, 1), (-1, -1), REGULAR_FONT),  # Standard font in the rest
-        ("FONTSIZE", (0, 0), (-1, -1), data_font_size),  # Font size indicated by `data_font_size`
-    ])
-    report_data_table.setStyle(report_data_table_style)
 
-    pdf_doc.build([title, report_data_table], canvasmaker=ReportCanvas)
+def get_export_value(value):
+    """Keep numbers and dates for the spreadsheets, the rest is exported as single-line text."""
+    if value is None:
+        return ""
+    if isinstance(value, (int, float, datetime.date)):
+        return value
+    return str(value).replace("\n", " ")
+
+
+def generate_csv_report(report_data):
+    """`report_data` is an iterable of rows, the first of which is the header. Yield the lines of the CSV file."""
+    writer = csv.writer(EchoBuffer())
+    # The BOM lets spreadsheets detect the UTF-8 encoding
+    yield "\ufeff"
+    for row in report_data:
+        yield writer.writerow([get_export_value(value) for value in row])
+
+
+def generate_xlsx_report(report_header, requester, report_data):
+    """`report_data` is an iterable of rows, the first of which is the header.
+    The rows are written by a write-only workbook, which doesn't keep them in memory,
+    and the file is stored in a temporary file."""
+    workbook = Workbook(write_only=True)
+    workbook.properties.title = report_header
+    workbook.properties.creator = str(requester)
+    worksheet = workbook.create_sheet(title="Raport")
+    for row in report_data:
+        worksheet.append([get_export_value(value) for value in row])
+
+    io_buffer = tempfile.TemporaryFile()
+    workbook.save(io_buffer)
 
     return io_buffer
 
 
+# REFERENCE DATA
+
+# Name -> (model, field used as the representation) of the dictionaries used in the forms
+REFERENCE_DATA = {
+    "reagent_types": (ReagentType, "type"),
+    "producers": (Producer, "abbreviation"),
+    "concentrations": (Concentration, "concentration"),
+    "units": (Unit, "unit"),
+    "purities_qualities": (PurityQuality, "purity_quality"),
+    "storage_conditions": (StorageCondition, "storage_condition"),
+    "laboratories": (Laboratory, "laboratory"),
+    "clp_classifications": (ClpClassification, "clp_classification"),
+    "hazard_statements": (HazardStatement, "code"),
+    "precautionary_statements": (PrecautionaryStatement, "code"),
+}
+
+REFERENCE_DATA_CACHE = cache.Namespace("reference_data", timeout=60 * 60)
+
+
+def get_reference_data_version():
+    """The version changes with the change version of any of the models (see `reagents.versions`)."""
+    return cache.make_version(versions.get_versions([model for model, _ in REFERENCE_DATA.values()]))
+
+
+def generate_reference_data():
+    return {
+        name: [
+            {"id": obj_id, "repr": obj_repr}
+            for obj_id, obj_repr in model.objects.order_by("id").values_list("id", repr_field_name)
+        ] for name, (model, repr_field_name) in REFERENCE_DATA.items()
+    }
+
+
+def get_cached_reference_data(version):
+    return REFERENCE_DATA_CACHE.get_or_set("all", generate_reference_data, version=version)
+
+
 # STATISTICS
 
+# Invalidated by signals (see `reagents.signals`) and after bulk changes (see `views.invalidate_statistics_and_facets`)
+STATISTICS_CACHE = cache.Namespace("statistics", timeout=60 * 60)
+
+
+def invalidate_statistics():
+    STATISTICS_CACHE.invalidate()
+
+
+def get_cached_statistics(name, generate_statistics, *args):
+    return STATISTICS_CACHE.get_or_set(name, generate_statistics, *args)
+
+
 def generate_lab_worker_statistics(user_personal_reagents, user):
     worker_personal_reagents = user_personal_reagents.values(
         reagent_name=F("reagent__name"), catalog_no=F("reagent__catalog_no")
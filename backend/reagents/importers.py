@@ -0,0 +1,252 @@
+"""Bulk import of the reagent catalogue. Every line of the file is a reagent with its dictionary values
+given by their names (or codes), which are resolved in batches and created when they don't exist yet."""
+
+import codecs
+import csv
+import json
+
+from itertools import islice
+
+from simple_history.utils import bulk_create_with_history
+
+from reagents import models, serializers, versions
+
+
+def read_csv_rows(file):
+    """Yield the lines of a CSV file (with a header) one by one, without loading the whole file into memory."""
+    yield from csv.DictReader(codecs.iterdecode(file, "utf-8-sig"))
+
+
+def read_json_lines_rows(file):
+    """Yield the objects of a JSON Lines file (an object per line) one by one,
+    without loading the whole file into memory."""
+    for line in codecs.iterdecode(file, "utf-8-sig"):
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        if not isinstance(row, dict):
+            raise ValueError("Every line must contain an object.")
+        yield row
+
+
+class ReagentCatalogueImporter:
+    """Import the reagents with a constant number of queries per batch of lines.
+
+    The dictionary values found in the database or created during the import are kept in lookup maps,
+    so every value is fetched once. The lines with errors are skipped and reported with their numbers.
+    """
+    batch_size = 1000
+
+    # Row field -> (model, field with a unique value). The values which don't exist are created.
+    dictionaries = {
+        "type": (models.ReagentType, "type"),
+        "concentration": (models.Concentration, "concentration"),
+        "unit": (models.Unit, "unit"),
+        "purity_quality": (models.PurityQuality, "purity_quality"),
+        "storage_conditions": (models.StorageCondition, "storage_condition"),
+    }
+    # Row field -> (model, field). The statements are managed by admins and the files can't be given in a line,
+    # so these objects must already exist.
+    references = {
+        "hazard_statements": (models.HazardStatement, "code"),
+        "precautionary_statements": (models.PrecautionaryStatement, "code"),
+        "safety_data_sheet": (models.SafetyDataSheet, "name"),
+        "safety_instruction": (models.SafetyInstruction, "name"),
+    }
+    m2m_fields = ["storage_conditions", "hazard_statements", "precautionary_statements"]
+
+    def __init__(self, user):
+        self.user = user
+        self.lookups = {field_name: {} for field_name in [*self.dictionaries, *self.references, "producer"]}
+        # (producer abbreviation, catalog number) of the reagents imported so far
+        self.imported_reagents = set()
+        self.created = 0
+        self.errors = []
+
+    def run(self, rows):
+        rows = enumerate(rows, 1)
+        while batch := list(islice(rows, self.batch_size)):
+            self.import_batch(batch)
+        return {"created": self.created, "errors": self.errors}
+
+    def import_batch(self, batch):
+        errors_count = len(self.errors)
+        valid_rows = []
+        for row_no, data in batch:
+            serializer = serializers.ReagentCatalogueRowSerializer(data=data)
+            if serializer.is_valid():
+                valid_rows.append((row_no, self.clean(serializer.validated_data)))
+            else:
+                self.errors.append({"row": row_no, "errors": serializer.errors})
+
+        for field_name, (model, lookup_field_name) in self.references.items():
+            self.fetch(field_name, model, lookup_field_name, self.get_values(valid_rows, field_name))
+        self.fetch_producers(self.get_values(valid_rows, "producer"))
+        valid_rows = [(row_no, attrs) for row_no, attrs in valid_rows if self.validate(row_no, attrs)]
+        self.errors[errors_count:] = sorted(self.errors[errors_count:], key=lambda error: error["row"])
+
+        for field_name, (model, lookup_field_name) in self.dictionaries.items():
+            values = self.get_values(valid_rows, field_name)
+            self.fetch(field_name, model, lookup_field_name, values)
+            self.create(field_name, model, lookup_field_name, values)
+        self.create_producers(valid_rows)
+
+        if valid_rows:
+            self.create_reagents([attrs for _, attrs in valid_rows])
+
+    @classmethod
+    def clean(cls, attrs):
+        """Turn blank optional values into `None` and remove repeated items of the lists."""
+        attrs = {field_name: value if value != "" else None for field_name, value in attrs.items()}
+        for field_name in cls.m2m_fields:
+            attrs[field_name] = list(dict.fromkeys(attrs.get(field_name) or []))
+        return attrs
+
+    def get_values(self, rows, field_name):
+        values = set()
+        for _, attrs in rows:
+            value = attrs.get(field_name)
+            if field_name in self.m2m_fields:
+                values.update(value)
+            elif value is not None:
+                values.add(value)
+        return values - self.lookups[field_name].keys()
+
+    def fetch(self, field_name, model, lookup_field_name, values):
+        if not values:
+            return
+        queryset = model.objects.filter(**{f"{lookup_field_name}__in": values}).order_by("-id")
+        if model is models.HazardStatement:
+            # Needed for the hazard summary
+            queryset = queryset.select_related("clp_classification")
+        # The oldest object wins if the values aren't unique
+        self.lookups[field_name].update((getattr(obj, lookup_field_name), obj) for obj in queryset)
+
+    def fetch_producers(self, abbreviations):
+        self.fetch("producer", models.Producer, "abbreviation", abbreviations)
+        abbreviations &= self.lookups["producer"].keys()
+        if not abbreviations:
+            return
+        # Reagents already in the catalogue before the import
+        self.imported_reagents.update(
+            models.Reagent.objects.filter(
+                producer__abbreviation__in=abbreviations
+            ).values_list("producer__abbreviation", "catalog_no")
+        )
+
+    def create(self, field_name, model, lookup_field_name, values):
+        objs = [
+            model(**{lookup_field_name: value, "is_validated_by_admin": self.user.is_staff})
+            for value in sorted(values - self.lookups[field_name].keys())
+        ]
+        if objs:
+            bulk_create_with_history(objs, model, batch_size=self.batch_size, default_user=self.user)
+            versions.bump_versions(model)
+            self.lookups[field_name].update((getattr(obj, lookup_field_name), obj) for obj in objs)
+
+    def create_producers(self, rows):
+        objs = {}
+        for _, attrs in rows:
+            abbreviation = attrs["producer"]
+            if abbreviation not in self.lookups["producer"] and abbreviation not in objs:
+                objs[abbreviation] = models.Producer(
+                    producer_name=attrs.get("producer_name") or abbreviation,
+                    brand_name=attrs.get("brand_name") or abbreviation,
+                    abbreviation=abbreviation,
+                    is_validated_by_admin=self.user.is_staff,
+                )
+        if objs:
+            bulk_create_with_history(
+                list(objs.values()), models.Producer, batch_size=self.batch_size, default_user=self.user
+            )
+            versions.bump_versions(models.Producer)
+            self.lookups["producer"].update(objs)
+
+    def validate(self, row_no, attrs):
+        """Check that:
+            1. The statements, the safety data sheet and the safety instruction exist.
+            2. The pair of the producer and the catalog number is unique in the catalogue and in the file.
+        """
+        errors = {}
+        for field_name in self.references:
+            values = attrs[field_name] if field_name in self.m2m_fields else [attrs.get(field_name)]
+            if missing := [value for value in values if value is not None and value not in self.lookups[field_name]]:
+                errors[field_name] = [f"Nie znaleziono: {', '.join(missing)}."]
+
+        key = (attrs["producer"], attrs["catalog_no"])
+        if key in self.imported_reagents:
+            errors["catalog_no"] = ["Pola Producent oraz Numer katalogowy muszą tworzyć unikatową parę."]
+
+        if errors:
+            self.errors.append({"row": row_no, "errors": errors})
+            return False
+
+        self.imported_reagents.add(key)
+        return True
+
+    def create_reagents(self, rows):
+        """Insert the reagents, the rows of the m2m through tables and their historical records in bulk.
+        `bulk_create_with_history` doesn't record the m2m relations, so the historical m2m records are created here
+        the same way as `HistoricalRecords.create_historical_record_m2ms` does it.
+        """
+        reagents = []
+        for attrs in rows:
+            reagent = models.Reagent(
+                **{
+                    field_name: attrs.get(field_name) for field_name in [
+                        "name", "catalog_no", "volume", "cas_no", "other_info", "kit_contents",
+                        "is_usage_record_required",
+                    ]
+                },
+                **{
+                    field_name: self.lookups[field_name].get(attrs.get(field_name)) for field_name in [
+                        "type", "producer", "concentration", "unit", "purity_quality", "safety_data_sheet",
+                        "safety_instruction",
+                    ]
+                },
+                is_validated_by_admin=self.user.is_staff,
+            )
+            for field_name in ["cas_no", "other_info", "kit_contents"]:
+                if getattr(reagent, field_name) is None:
+                    setattr(reagent, field_name, "")
+            summary = models.get_hazard_summary(
+                [self.lookups["hazard_statements"][code] for code in attrs["hazard_statements"]],
+                [self.lookups["precautionary_statements"][code] for code in attrs["precautionary_statements"]],
+            )
+            for field_name, value in summary.items():
+                setattr(reagent, field_name, value)
+            reagents.append(reagent)
+
+        models.Reagent.objects.bulk_create(reagents, batch_size=self.batch_size)
+        historical_reagents = models.Reagent.history.bulk_history_create(  # pylint: disable=no-member
+            reagents, batch_size=self.batch_size, default_user=self.user
+        )
+
+        for field_name in self.m2m_fields:
+            field = models.Reagent._meta.get_field(field_name)  # pylint: disable=protected-access
+            through_model = field.remote_field.through
+            related_field_name = field.m2m_reverse_field_name()
+            through_objs = []
+            for reagent, attrs in zip(reagents, rows):
+                through_objs.extend(
+                    through_model(reagent=reagent, **{related_field_name: self.lookups[field_name][value]})
+                    for value in attrs[field_name]
+                )
+            through_model.objects.bulk_create(through_objs, batch_size=self.batch_size)
+
+            m2m_history_model = getattr(models.Reagent.history.model, field_name).model  # pylint: disable=no-member
+            histories = dict(zip((reagent.id for reagent in reagents), historical_reagents))
+            m2m_history_model.objects.bulk_create(
+                [
+                    m2m_history_model(
+                        id=through_obj.id,
+                        reagent_id=through_obj.reagent_id,
+                        history=histories[through_obj.reagent_id],
+                        **{f"{related_field_name}_id": getattr(through_obj, f"{related_field_name}_id")},
+                    ) for through_obj in through_objs
+                ],
+                batch_size=self.batch_size,
+            )
+
+        versions.bump_versions(models.Reagent)
+        self.created += len(reagents)
@@ -0,0 +1,63 @@
+"""Report jobs are queued in the `reagents_report_job` table and processed by `python manage.py process_report_jobs`."""
+
+import logging
+
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from reagents import models, views
+
+logger = logging.getLogger(__name__)
+
+
+def claim_report_job():
+    """Mark the oldest pending job as running and return it, or return `None` if there are no pending jobs.
+    Jobs locked by other workers are skipped, so several workers can process the queue at the same time."""
+    with transaction.atomic():
+        report_job = models.ReportJob.objects.select_for_update(
+            skip_locked=True
+        ).select_related(
+            "requester"
+        ).filter(
+            status=models.ReportJob.PENDING
+        ).order_by("id").first()
+
+        if report_job is None:
+            return None
+
+        report_job.status = models.ReportJob.RUNNING
+        report_job.started_date = timezone.now()
+        report_job.save(update_fields=["status", "started_date"])
+
+    return report_job
+
+
+def fail_stale_report_jobs(max_running_time):
+    """Mark the jobs which have been running for longer than `max_running_time` as failed and return their number.
+    Their worker has most likely died, so they would stay running forever. They aren't requeued,
+    because a job which kills its worker would do it again."""
+    now = timezone.now()
+    return models.ReportJob.objects.filter(
+        status=models.ReportJob.RUNNING,
+        started_date__lt=now - max_running_time,
+    ).update(
+        status=models.ReportJob.FAILED,
+        error="Przekroczono czas generowania raportu.",
+        finished_date=now,
+    )
+
+
+def run_report_job(report_job):
+    """Generate the report and store it with the default storage."""
+    try:
+        io_buffer, filename = views.PersonalReagentViewSet.generate_report_for_job(report_job)
+        report_job.report.save(filename, File(io_buffer), save=False)
+        report_job.status = models.ReportJob.DONE
+    except Exception as exception:  # pylint: disable=broad-exception-caught
+        logger.exception("Report job %s failed", report_job.id)
+        report_job.status = models.ReportJob.FAILED
+        report_job.error = str(exception)[:200]
+
+    report_job.finished_date = timezone.now()
+    report_job.save(update_fields=["report", "status", "error", "finished_date"])
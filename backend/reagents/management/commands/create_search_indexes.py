@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from reagents import filters
+
+
+class Command(BaseCommand):
+    help = "Creates the pg_trgm extension and the missing trigram indexes used by the search."
+
+    def handle(self, *args, **options):
+        try:
+            created_indexes = filters.create_trigram_indexes(connection)
+        except DatabaseError as exception:
+            raise CommandError(
+                f"The indexes can't be created, the pg_trgm extension is a part of the PostgreSQL contrib package. "
+                f"{exception}"
+            ) from exception
+
+        for _, index in created_indexes:
+            self.stdout.write(f"Created index {index.name}")
+        if not created_indexes:
+            self.stdout.write("All indexes already exist.")
@@ -0,0 +1,38 @@
+import time
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from reagents import jobs
+
+
+class Command(BaseCommand):
+    help = "Generates the reports enqueued with POST requests to `/personal-reagents/report/*`."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit when there are no pending jobs.")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds between polls of an empty queue.")
+        parser.add_argument(
+            "--stale-after", type=float, default=60,
+            help="Minutes after which a running job is considered abandoned by its worker and marked as failed.",
+        )
+
+    def handle(self, *args, **options):
+        max_running_time = timedelta(minutes=options["stale_after"])
+        while True:
+            if stale_jobs_count := jobs.fail_stale_report_jobs(max_running_time):
+                self.stdout.write(f"Stale report jobs marked as failed: {stale_jobs_count}")
+
+            report_job = jobs.claim_report_job()
+            if report_job is None:
+                if options["once"]:
+                    return
+                # Like after a request, so that the worker recovers from a dropped connection
+                close_old_connections()
+                time.sleep(options["interval"])
+                continue
+
+            jobs.run_report_job(report_job)
+            self.stdout.write(f"Report job {report_job.id}: {report_job.get_status_display()}")
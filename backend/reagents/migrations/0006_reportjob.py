@@ -0,0 +1,37 @@
+# Generated by Django 4.2.9 on 2026-10-18 19:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import reagents.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0005_historicalpersonalreagent_opening_date_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_type', models.CharField(choices=[('sanepid-pip', 'Raport SANEPID/PIP'), ('lab-manager', 'Raport kierownika laboratorium'), ('projects-procedures', 'Raport kierownika projektu/procedury'), ('all', 'Raport wszystkich odczynników osobistych'), ('personal-view', 'Raport moich odczynników osobistych')], max_length=20)),
+                ('query_string', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('PE', 'Oczekuje'), ('RU', 'W trakcie generowania'), ('DO', 'Gotowy'), ('FA', 'Błąd')], default='PE', max_length=2)),
+                ('report', models.FileField(blank=True, upload_to=reagents.models.report_job_upload_to)),
+                ('error', models.CharField(blank=True, max_length=200)),
+                ('created_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_date', models.DateTimeField(blank=True, default=None, null=True)),
+                ('finished_date', models.DateTimeField(blank=True, default=None, null=True)),
+                ('requester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'reagents_report_job',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='report_job_status_id_idx')],
+            },
+        ),
+    ]
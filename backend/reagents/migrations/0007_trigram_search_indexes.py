@@ -0,0 +1,45 @@
+# Generated by Django 4.2.9 on 2026-10-18 19:44
+
+from django.db import migrations
+
+# Index -> (table, column), the same as `filters.TRIGRAM_INDEXES` when the migration was written
+TRIGRAM_INDEXES = {
+    "producer_abbrev_trgm_idx": ("reagents_producer", "abbreviation"),
+    "reagent_name_trgm_idx": ("reagents_reagent", "name"),
+    "reagent_catalog_no_trgm_idx": ("reagents_reagent", "catalog_no"),
+    "safety_instr_name_trgm_idx": ("reagents_safety_instruction", "name"),
+    "user_username_trgm_idx": ("reagents_user", "username"),
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """The indexes need pg_trgm (a part of the PostgreSQL contrib package). If the server doesn't provide it,
+    they aren't created here and they aren't a part of the migration state, so they can be created later with
+    `python manage.py create_search_indexes` (the `reagents.W001` check reports them as missing)."""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+        if not cursor.fetchone()[0]:
+            return
+
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for index_name, (table, column) in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" USING gin ((UPPER("{column}")) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    # The extension is kept, other database objects may depend on it
+    for index_name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0006_reportjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.9 on 2026-10-18 19:59
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+def get_hazard_summary(hazard_statements, precautionary_statements):
+    """`models.get_hazard_summary()` as of this migration."""
+    def get_order(hazard_statement):
+        clp_classification = hazard_statement.clp_classification
+        # Hazard statements without the CLP classification go last
+        return (
+            clp_classification is None,
+            clp_classification.clp_classification if clp_classification is not None else "",
+            hazard_statement.code,
+        )
+
+    hazard_statements = sorted(hazard_statements, key=get_order)
+
+    clp_classifications = {}
+    signal_word = ""
+    for hazard_statement in hazard_statements:
+        if hazard_statement.clp_classification is not None:
+            clp_classifications[hazard_statement.clp_classification_id] = {
+                "id": hazard_statement.clp_classification_id,
+                "repr": hazard_statement.clp_classification.clp_classification,
+            }
+        # DANGER takes precedence over WARNING
+        if hazard_statement.signal_word == "DGR" or not signal_word:
+            signal_word = hazard_statement.signal_word
+
+    return {
+        "clp_classifications": list(clp_classifications.values()),
+        "signal_word": signal_word,
+        "hazard_statement_codes": [hazard_statement.code for hazard_statement in hazard_statements],
+        "precautionary_statement_codes": sorted(
+            precautionary_statement.code for precautionary_statement in precautionary_statements
+        ),
+    }
+
+
+def fill_hazard_summaries(apps, schema_editor):
+    Reagent = apps.get_model("reagents", "Reagent")
+    reagents = list(Reagent.objects.prefetch_related(
+        "hazard_statements__clp_classification",
+        "precautionary_statements",
+    ))
+    for reagent in reagents:
+        summary = get_hazard_summary(reagent.hazard_statements.all(), reagent.precautionary_statements.all())
+        for field_name, value in summary.items():
+            setattr(reagent, field_name, value)
+    Reagent.objects.bulk_update(
+        reagents,
+        ["clp_classifications", "signal_word", "hazard_statement_codes", "precautionary_statement_codes"],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0007_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reagent',
+            name='clp_classifications',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='reagent',
+            name='hazard_statement_codes',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=30), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='reagent',
+            name='precautionary_statement_codes',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=30), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='reagent',
+            name='signal_word',
+            field=models.CharField(blank=True, choices=[('DGR', 'Niebezpieczeństwo (danger)'), ('WRN', 'Uwaga')], editable=False, max_length=3),
+        ),
+        migrations.RunPython(fill_hazard_summaries, migrations.RunPython.noop),
+    ]
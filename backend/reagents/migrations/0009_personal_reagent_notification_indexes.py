@@ -0,0 +1,25 @@
+# Generated by Django 4.2.9 on 2026-10-18 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0008_reagent_hazard_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='personalreagent',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['main_owner', 'expiration_date'], name='personal_reagent_owner_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personalreagent',
+            index=models.Index(condition=models.Q(('is_usage_record_generated', False)), fields=['main_owner', 'id'], name='personal_reagent_owner_urg_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personalreagent',
+            index=models.Index(condition=models.Q(('is_critical', True)), fields=['main_owner', 'reagent'], name='personal_reagent_owner_crt_idx'),
+        ),
+    ]
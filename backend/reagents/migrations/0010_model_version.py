@@ -0,0 +1,24 @@
+# Generated by Django 4.2.9 on 2026-10-18 21:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0009_personal_reagent_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_label', models.CharField(max_length=100, unique=True)),
+                ('version', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'reagents_model_version',
+            },
+        ),
+    ]
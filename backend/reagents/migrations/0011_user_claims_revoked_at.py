@@ -0,0 +1,25 @@
+# Generated by Django 4.2.9 on 2026-10-18 21:31
+
+from django.db import migrations, models
+import reagents.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0010_model_version'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', reagents.models.UserManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='claims_revoked_at',
+            field=models.DateTimeField(blank=True, default=None, editable=False, null=True),
+        ),
+    ]
@@ -1,12 +1,36 @@
+import uuid
+
 from django.conf import settings
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
 from django.contrib.postgres.fields import ArrayField
 from django.db import models
+from django.dispatch import Signal
 from django.utils import timezone
 
 from simple_history.models import HistoricalRecords
 
-from reagents import validators
+from reagents import validators, versions
+
+
+# Sent with the ids of the users changed by `UserQuerySet.update()`, which doesn't send `post_save`
+users_updated = Signal()
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """Send `users_updated` (which revokes the claims of the tokens, see `reagents.signals`),
+        unless only `last_login` (updated by logins) or the revocation itself is updated."""
+        if set(kwargs) <= {"last_login", "claims_revoked_at"}:
+            return super().update(**kwargs)
+
+        user_ids = list(self.values_list("id", flat=True))
+        count = super().update(**kwargs)
+        users_updated.send(sender=self.model, user_ids=user_ids)
+        return count
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):  # pylint: disable=too-few-public-methods
+    pass
 
 
 class User(AbstractUser):
@@ -40,7 +64,11 @@ class User(AbstractUser):
         default=list,
         blank=True,
     )
-    history = HistoricalRecords(excluded_fields=["password"], user_db_constraint=False)
+    # The claims of the tokens issued until then aren't trusted (see `reagents.authentication`)
+    claims_revoked_at = models.DateTimeField(null=True, blank=True, default=None, editable=False)
+    history = HistoricalRecords(excluded_fields=["password", "claims_revoked_at"], user_db_constraint=False)
+
+    objects = UserManager()
 
     class Meta(AbstractUser.Meta):
         ordering = ["id"]
@@ -201,6 +229,43 @@ class PrecautionaryStatement(models.Model):
         ordering = ["id"]
 
 
+def get_hazard_summary(hazard_statements, precautionary_statements):
+    """Return the values of the hazard summary fields of a reagent with the given statements.
+    The hazard statements need their CLP classifications.
+    """
+    def get_order(hazard_statement):
+        clp_classification = hazard_statement.clp_classification
+        # Hazard statements without the CLP classification go last
+        return (
+            clp_classification is None,
+            clp_classification.clp_classification if clp_classification is not None else "",
+            hazard_statement.code,
+        )
+
+    hazard_statements = sorted(hazard_statements, key=get_order)
+
+    clp_classifications = {}
+    signal_word = ""
+    for hazard_statement in hazard_statements:
+        if hazard_statement.clp_classification is not None:
+            clp_classifications[hazard_statement.clp_classification_id] = {
+                "id": hazard_statement.clp_classification_id,
+                "repr": hazard_statement.clp_classification.clp_classification,
+            }
+        # DANGER takes precedence over WARNING
+        if hazard_statement.signal_word == HazardStatement.DANGER or not signal_word:
+            signal_word = hazard_statement.signal_word
+
+    return {
+        "clp_classifications": list(clp_classifications.values()),
+        "signal_word": signal_word,
+        "hazard_statement_codes": [hazard_statement.code for hazard_statement in hazard_statements],
+        "precautionary_statement_codes": sorted(
+            precautionary_statement.code for precautionary_statement in precautionary_statements
+        ),
+    }
+
+
 class SafetyDataSheet(models.Model):
     safety_data_sheet = models.FileField(upload_to="SafetyDataSheets")
 
@@ -256,14 +321,47 @@ class Reagent(models.Model):
     kit_contents = models.CharField(max_length=300, blank=True)
     is_usage_record_required = models.BooleanField()
     is_validated_by_admin = models.BooleanField()
+
+    # Hazard summary, maintained by signals when the statements of the reagent change (see `update_hazard_summaries`),
+    # so that lists and reports don't have to fetch the hazard statements for every reagent.
+    clp_classifications = models.JSONField(default=list, blank=True, editable=False)
+    signal_word = models.CharField(max_length=3, choices=HazardStatement.SIGNAL_WORDS, blank=True, editable=False)
+    hazard_statement_codes = ArrayField(models.CharField(max_length=30), default=list, blank=True, editable=False)
+    precautionary_statement_codes = ArrayField(
+        models.CharField(max_length=30), default=list, blank=True, editable=False
+    )
+    HAZARD_SUMMARY_FIELDS = ["clp_classifications", "signal_word", "hazard_statement_codes",
+                             "precautionary_statement_codes"]
+
     history = HistoricalRecords(
         m2m_fields=[storage_conditions, hazard_statements, precautionary_statements],
+        excluded_fields=HAZARD_SUMMARY_FIELDS,
         user_db_constraint=False,
     )
 
     def __str__(self):  # pylint: disable=invalid-str-returned
         return self.name
 
+    @classmethod
+    def update_hazard_summaries(cls, reagent_ids):
+        reagents = cls.objects.filter(pk__in=reagent_ids).only("id").prefetch_related(
+            models.Prefetch(
+                "hazard_statements",
+                queryset=HazardStatement.objects.select_related("clp_classification").only(
+                    "id", "code", "signal_word", "clp_classification__clp_classification",
+                ),
+            ),
+            models.Prefetch("precautionary_statements", queryset=PrecautionaryStatement.objects.only("id", "code")),
+        )
+        reagents = list(reagents)
+        for reagent in reagents:
+            summary = get_hazard_summary(reagent.hazard_statements.all(), reagent.precautionary_statements.all())
+            for field_name, value in summary.items():
+                setattr(reagent, field_name, value)
+        cls.objects.bulk_update(reagents, cls.HAZARD_SUMMARY_FIELDS)
+        # `bulk_update()` doesn't create historical records, which bump the version
+        versions.bump_versions(cls)
+
     class Meta:
         ordering = ["id"]
 
@@ -325,6 +423,24 @@ class PersonalReagent(models.Model):
     class Meta:
         db_table = "reagents_personal_reagent"
         ordering = ["id"]
+        indexes = [
+            # Notifications of the user (see `NotificationViewSet`)
+            models.Index(
+                fields=["main_owner", "expiration_date"],
+                condition=models.Q(is_archived=False),
+                name="personal_reagent_owner_exp_idx",
+            ),
+            models.Index(
+                fields=["main_owner", "id"],
+                condition=models.Q(is_usage_record_generated=False),
+                name="personal_reagent_owner_urg_idx",
+            ),
+            models.Index(
+                fields=["main_owner", "reagent"],
+                condition=models.Q(is_critical=True),
+                name="personal_reagent_owner_crt_idx",
+            ),
+        ]
 
 
 class ReagentRequest(models.Model):
@@ -356,3 +472,67 @@ class ReagentRequest(models.Model):
     class Meta:
         db_table = "reagents_reagent_request"
         ordering = ["id"]
+
+
+def report_job_upload_to(instance, filename):  # pylint: disable=unused-argument
+    # Media are served by the web server, so the path mustn't be guessable
+    return f"Reports/{uuid.uuid4().hex}/{filename}"
+
+
+class ReportJob(models.Model):
+    """A report generated in the background by `python manage.py process_report_jobs`."""
+    requester = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+
+    SANEPID_PIP = "sanepid-pip"
+    LAB_MANAGER = "lab-manager"
+    PROJECTS_PROCEDURES = "projects-procedures"
+    ALL = "all"
+    PERSONAL_VIEW = "personal-view"
+    REPORT_TYPES = [
+        (SANEPID_PIP, "Raport SANEPID/PIP"),
+        (LAB_MANAGER, "Raport kierownika laboratorium"),
+        (PROJECTS_PROCEDURES, "Raport kierownika projektu/procedury"),
+        (ALL, "Raport wszystkich odczynników osobistych"),
+        (PERSONAL_VIEW, "Raport moich odczynników osobistych"),
+    ]
+    report_type = models.CharField(max_length=20, choices=REPORT_TYPES)
+    query_string = models.TextField(blank=True)
+
+    PENDING = "PE"
+    RUNNING = "RU"
+    DONE = "DO"
+    FAILED = "FA"
+    STATUS_CHOICES = [
+        (PENDING, "Oczekuje"),
+        (RUNNING, "W trakcie generowania"),
+        (DONE, "Gotowy"),
+        (FAILED, "Błąd"),
+    ]
+    status = models.CharField(max_length=2, choices=STATUS_CHOICES, default=PENDING)
+    report = models.FileField(upload_to=report_job_upload_to, blank=True)
+    error = models.CharField(max_length=200, blank=True)
+    created_date = models.DateTimeField(default=timezone.now)
+    started_date = models.DateTimeField(null=True, blank=True, default=None)
+    finished_date = models.DateTimeField(null=True, blank=True, default=None)
+
+    def __str__(self):
+        return f"[{self.created_date}] {self.report_type} {self.status}"
+
+    class Meta:
+        db_table = "reagents_report_job"
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "id"], name="report_job_status_id_idx"),
+        ]
+
+
+class ModelVersion(models.Model):
+    """The change version of a model which keeps historical records (see `reagents.versions`)."""
+    model_label = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.model_label} {self.version}"
+
+    class Meta:
+        db_table = "reagents_model_version"
@@ -0,0 +1,187 @@
+import base64
+import binascii
+import json
+import operator
+
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q, QuerySet
+from django.db.models.query import ModelIterable
+
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from reagents import exceptions
+
+
+class KeysetPagination(BasePagination):
+    """Keyset (seek) pagination based on the ordering of the already filtered queryset.
+
+    The position of the last (or the first, when going back) row of the page is encoded in the cursor
+    and the next page is fetched with a `WHERE (k1, ..., kn) > (v1, ..., vn)` condition instead of OFFSET.
+    There's no COUNT(*) either, so page N costs the same as page 1.
+    The primary key is appended to the ordering as a tiebreaker to make every position unique.
+    Only local fields of the model can be used as ordering keys.
+    """
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    default_limit = api_settings.PAGE_SIZE
+    max_limit = 1000
+
+    invalid_cursor_message = "Nieprawidłowy parametr `cursor`."
+
+    # The state of the page, set by `paginate_queryset`
+    request = None
+    limit = None
+    ordering = None
+    has_next = False
+    has_previous = False
+    first_position = None
+    last_position = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not isinstance(queryset, QuerySet) or not issubclass(
+            queryset._iterable_class, ModelIterable  # pylint: disable=protected-access
+        ):
+            raise exceptions.QueryParamError(
+                "Parametr `cursor` jest obsługiwany wyłącznie dla list obiektów pobieranych z bazy danych."
+            )
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.ordering = self.get_ordering(queryset)
+        is_reversed, position = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if is_reversed:
+            ordering = [(attname, not descending, null) for attname, descending, null in ordering]
+
+        queryset = queryset.order_by(*[
+            f"-{attname}" if descending else attname for attname, descending, _ in ordering
+        ])
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(ordering, position))
+
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+
+        if is_reversed:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.first_position = self.get_position(results[0]) if results else None
+        self.last_position = self.get_position(results[-1]) if results else None
+
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(request.query_params[self.limit_query_param], strict=True, cutoff=self.max_limit)
+        except (KeyError, ValueError):
+            return self.default_limit
+
+    def get_ordering(self, queryset):
+        """Return a list of `(attname, descending, null)` tuples describing the ordering of the queryset."""
+        opts = queryset.model._meta  # pylint: disable=protected-access
+        ordering = []
+        for order_by in queryset.query.order_by or opts.ordering:
+            if not isinstance(order_by, str) or order_by == "?":
+                raise exceptions.QueryParamError("To sortowanie nie jest obsługiwane w trybie kursora.")
+
+            descending = order_by.startswith("-")
+            field_name = order_by.lstrip("-")
+            if field_name == "pk":
+                field_name = opts.pk.name
+            try:
+                field = opts.get_field(field_name)
+            except FieldDoesNotExist as exception:
+                raise exceptions.QueryParamError(
+                    f"Sortowanie po polu `{field_name}` nie jest obsługiwane w trybie kursora."
+                ) from exception
+            if not field.concrete or field.many_to_many:
+                raise exceptions.QueryParamError(
+                    f"Sortowanie po polu `{field_name}` nie jest obsługiwane w trybie kursora."
+                )
+
+            ordering.append((field.attname, descending, field.null))
+            if field.primary_key:
+                return ordering
+
+        descending = ordering[0][1] if ordering else False
+        ordering.append((opts.pk.attname, descending, False))
+        return ordering
+
+    @staticmethod
+    def get_keyset_filter(ordering, position):
+        """Build a lexicographic "comes after the position" condition.
+        PostgreSQL treats NULLs as larger than any other value,
+        so they go last when ascending and first when descending.
+        """
+        conditions = []
+        equal_prefix = Q()
+        for (attname, descending, null), value in zip(ordering, position):
+            if value is None:
+                after = Q(**{f"{attname}__isnull": False}) if descending else None
+                equal = Q(**{f"{attname}__isnull": True})
+            else:
+                after = Q(**{f"{attname}__{'lt' if descending else 'gt'}": value})
+                if null and not descending:
+                    after |= Q(**{f"{attname}__isnull": True})
+                equal = Q(**{attname: value})
+
+            if after is not None:
+                conditions.append(equal_prefix & after)
+            equal_prefix &= equal
+
+        if not conditions:
+            return Q(pk__in=[])
+        return reduce(operator.or_, conditions)
+
+    def get_position(self, instance):
+        return [getattr(instance, attname) for attname, _, _ in self.ordering]
+
+    def decode_cursor(self, request):
+        """Return a `(is_reversed, position)` tuple. An empty cursor points at the first page."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            is_reversed, position = bool(cursor["r"]), cursor["p"]
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, binascii.Error) as exception:
+            raise exceptions.QueryParamError(self.invalid_cursor_message) from exception
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise exceptions.QueryParamError(self.invalid_cursor_message)
+
+        return is_reversed, position
+
+    def encode_cursor(self, is_reversed, position):
+        # `str` keeps the full precision of datetimes, which is needed for the equality part of the condition
+        cursor = json.dumps({"r": is_reversed, "p": position}, default=str)
+        encoded = base64.urlsafe_b64encode(cursor.encode("ascii")).decode("ascii")
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(False, self.last_position)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self.encode_cursor(True, self.first_position)
@@ -65,6 +65,13 @@ class ReagentFilePermission(BasePermission):
         return False
 
 
+class ReferenceDataPermission(BasePermission):
+    """Common class for ReferenceDataView and VersionsView."""
+    def has_permission(self, request, view):
+        user = request.user
+        return user.is_staff or (user.is_authenticated and has_lab_role(user))
+
+
 class ReagentPermission(BasePermission):
     def has_permission(self, request, view):
         user = request.user
@@ -125,12 +132,14 @@ class PersonalReagentPermission(BasePermission):
                 "retrieve",
                 "update",
                 "partial_update",
+                "bulk_partial_update",
                 "destroy",
                 "get_personal_view",
                 "generate_usage_record",
                 "generate_all_personal_reagents_report",
                 "generate_personal_view_report",
                 "generate_statistics",
+                "get_facets",
             ):
                 return has_lab_role(user)
 
@@ -183,6 +192,7 @@ class NotificationPermission(BasePermission):
             "get_reagents_with_not_generated_usage_records",
             "get_few_critical_reagents",
             "get_reagent_requests",
+            "get_notifications_summary",
         ):
             return user.is_authenticated and has_lab_role(user)
 
@@ -222,6 +232,22 @@ class ReagentRequestPermission(BasePermission):
         return False
 
 
+class ReportJobPermission(BasePermission):
+    def has_permission(self, request, view):
+        user = request.user
+        if user.is_staff:
+            return True
+
+        if view.action in ("list", "retrieve", "download_report"):
+            return user.is_authenticated and has_lab_role(user)
+
+        return False
+
+    def has_object_permission(self, request, view, obj):
+        user = request.user
+        return user.is_staff or user == obj.requester
+
+
 class UserManualPermission(BasePermission):
     def has_permission(self, request, view):
         user = request.user
@@ -2,15 +2,23 @@
 # so we silent the warning for the whole module.
 # pylint: disable=abstract-method
 
+from collections import defaultdict
+
 from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.storage import default_storage
+from django.db.models import Exists, F, Manager, OuterRef, Prefetch, Q
 from django.utils import timezone
 
 from rest_framework import serializers
 from rest_framework.serializers import raise_errors_on_nested_writes
 from rest_framework.validators import UniqueTogetherValidator
 
-from reagents import models
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
+
+from simple_history.utils import bulk_create_with_history
+
+from reagents import authentication, models, versions
 
 
 def get_attr_value_for_validation(serializer, attrs, attr_name):
@@ -20,6 +28,142 @@ def get_attr_value_for_validation(serializer, attrs, attr_name):
                 else attrs.get(attr_name, getattr(serializer.instance, attr_name)))
 
 
+def get_historical_m2m_records(historical_model, m2m_fields, history_ids):
+    """Fetch historical many-to-many records for all given history IDs with one query per relation.
+
+    `m2m_fields` maps a relation name to a pair of the related model name and the field used as its representation.
+    Return a `{relation_name: {history_id: [{"id": ..., "repr": ...}, ...]}}` mapping.
+    """
+    m2m_records = {}
+    for field_name, (related_name, repr_field_name) in m2m_fields.items():
+        m2m_history_model = getattr(historical_model, field_name).model
+        records = m2m_history_model.objects.filter(
+            history_id__in=history_ids
+        ).order_by(
+            "history_id", f"{related_name}__id"
+        ).values_list(
+            "history_id", f"{related_name}__id", f"{related_name}__{repr_field_name}"
+        )
+
+        m2m_records[field_name] = defaultdict(list)
+        for history_id, related_id, related_repr in records:
+            m2m_records[field_name][history_id].append({"id": related_id, "repr": related_repr})
+
+    return m2m_records
+
+
+class HistoricalM2MRecordsListSerializer(serializers.ListSerializer):
+    """Preload historical many-to-many records of the whole list (e.g. a page) before serializing its items."""
+
+    def to_representation(self, data):
+        iterable = list(data.all() if isinstance(data, Manager) else data)
+        self.child.m2m_records = get_historical_m2m_records(
+            self.child.Meta.model,
+            self.child.historical_m2m_fields,
+            [item.history_id for item in iterable],
+        )
+        try:
+            return [self.child.to_representation(item) for item in iterable]
+        finally:
+            self.child.m2m_records = None
+
+
+class HistoricalM2MRecordsSerializerMixin:
+    """Serialize historical many-to-many relations listed in `historical_m2m_fields`.
+    The records are taken from the map preloaded by `HistoricalM2MRecordsListSerializer`
+    or, for a single object, fetched on demand.
+    """
+    historical_m2m_fields = {}
+    m2m_records = None
+
+    def get_historical_m2m_field(self, obj, field_name):
+        m2m_records = self.m2m_records
+        if m2m_records is None:
+            m2m_records = get_historical_m2m_records(
+                self.Meta.model,
+                {field_name: self.historical_m2m_fields[field_name]},
+                [obj.history_id],
+            )
+        return m2m_records[field_name].get(obj.history_id, [])
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Look the objects up in `prefetched_objects` preloaded by `BulkCreateListSerializer` instead of the database."""
+    prefetched_objects = None
+    invalid_pk_errors = (TypeError, ValueError, DjangoValidationError)
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            raise TypeError
+        return self.get_queryset().model._meta.pk.to_python(data)  # pylint: disable=protected-access
+
+    def to_internal_value(self, data):
+        prefetched_objects = self.prefetched_objects
+        if prefetched_objects is None:
+            return super().to_internal_value(data)
+
+        try:
+            pk = self.to_pk(data)
+        except self.invalid_pk_errors:
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if (obj := prefetched_objects.get(pk)) is None:
+            self.fail("does_not_exist", pk_value=data)
+        return obj
+
+
+class BulkCreateListSerializer(serializers.ListSerializer):
+    """Validate the items with a constant number of queries and insert them with `bulk_create_with_history`.
+
+    The objects of the related fields of the whole list are fetched before validating its items,
+    `Meta.bulk_prefetch_related` of the child maps a field to the lookups prefetched for them.
+    Since the objects aren't saved one by one, no `post_save` signals are sent and the version of the model
+    is bumped here (see `reagents.versions`).
+    """
+    batch_size = 1000
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+
+        related_fields = {
+            field_name: field for field_name, field in self.child.fields.items()
+            if isinstance(field, PrefetchedPrimaryKeyRelatedField) and not field.read_only
+        }
+        bulk_prefetch_related = getattr(self.child.Meta, "bulk_prefetch_related", {})
+        for field_name, field in related_fields.items():
+            pks = set()
+            for item in data:
+                if isinstance(item, dict) and item.get(field_name) is not None:
+                    try:
+                        pks.add(field.to_pk(item[field_name]))
+                    except field.invalid_pk_errors:
+                        pass  # Reported by the field during the validation of the item
+            field.prefetched_objects = field.get_queryset().prefetch_related(
+                *bulk_prefetch_related.get(field_name, [])
+            ).in_bulk(pks)
+
+        try:
+            return super().to_internal_value(data)
+        finally:
+            for field in related_fields.values():
+                field.prefetched_objects = None
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        objs = bulk_create_with_history(
+            [model(**attrs) for attrs in validated_data],
+            model,
+            batch_size=self.batch_size,
+        )
+        versions.bump_versions(model)
+        return objs
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    # Tokens with the claims used by `authentication.JWTClaimsAuthentication`
+    token_class = authentication.RefreshToken
+
+
 class UserReadAsAdminLabManagerProjectManagerOwnLabWorkerOwnSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.User
@@ -564,13 +708,13 @@ class ReagentReadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Reagent
-        fields = "__all__"
+        exclude = models.Reagent.HAZARD_SUMMARY_FIELDS
 
 
 class ReagentModifySerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Reagent
-        fields = "__all__"
+        exclude = models.Reagent.HAZARD_SUMMARY_FIELDS
         validators = [
             UniqueTogetherValidator(
                 queryset=model.objects.all(),
@@ -615,61 +759,79 @@ class ReagentCreateWithLabRoleSerializer(ReagentModifySerializer):
         pass
 
 
-class ReagentHistoricalRecordsSerializer(ReagentReadSerializer):
+class ReagentHistoricalRecordsSerializer(HistoricalM2MRecordsSerializerMixin, ReagentReadSerializer):
     id = serializers.IntegerField(source="history_id", read_only=True)
     pk = serializers.IntegerField(source="id", read_only=True)
     storage_conditions = serializers.SerializerMethodField()
     hazard_statements = serializers.SerializerMethodField()
     precautionary_statements = serializers.SerializerMethodField()
 
+    historical_m2m_fields = {
+        "storage_conditions": ("storagecondition", "storage_condition"),
+        "hazard_statements": ("hazardstatement", "code"),
+        "precautionary_statements": ("precautionarystatement", "code"),
+    }
+
     class Meta:
         model = models.Reagent.history.model  # pylint: disable=no-member
         exclude = ["history_id"]
+        list_serializer_class = HistoricalM2MRecordsListSerializer
 
     def get_storage_conditions(self, obj):
-        storage_conditions = obj.storage_conditions.filter(
-            history_id=obj.history_id
-        ).order_by(
-            "storagecondition__id"
-        ).values(
-            "storagecondition__id", "storagecondition__storage_condition"
-        )
-        return [
-            {
-                "id": storage_condition["storagecondition__id"],
-                "repr": storage_condition["storagecondition__storage_condition"],
-            } for storage_condition in storage_conditions
-        ]
+        return self.get_historical_m2m_field(obj, "storage_conditions")
 
     def get_hazard_statements(self, obj):
-        hazard_statements = obj.hazard_statements.filter(
-            history_id=obj.history_id
-        ).order_by(
-            "hazardstatement__id"
-        ).values(
-            "hazardstatement__id", "hazardstatement__code"
-        )
-        return [
-            {
-                "id": hazard_statement["hazardstatement__id"],
-                "repr": hazard_statement["hazardstatement__code"],
-            } for hazard_statement in hazard_statements
-        ]
+        return self.get_historical_m2m_field(obj, "hazard_statements")
 
     def get_precautionary_statements(self, obj):
-        precautionary_statements = obj.precautionary_statements.filter(
-            history_id=obj.history_id
-        ).order_by(
-            "precautionarystatement__id"
-        ).values(
-            "precautionarystatement__id", "precautionarystatement__code"
-        )
-        return [
-            {
-                "id": precautionary_statement["precautionarystatement__id"],
-                "repr": precautionary_statement["precautionarystatement__code"],
-            } for precautionary_statement in precautionary_statements
-        ]
+        return self.get_historical_m2m_field(obj, "precautionary_statements")
+
+
+class SeparatedListField(serializers.ListField):
+    """A list which can also be given as a string with the items separated by `separator` (e.g. in a CSV file)."""
+    separator = "|"
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [item.strip() for item in data.split(self.separator) if item.strip()]
+        return super().to_internal_value(data)
+
+
+class ReagentCatalogueRowSerializer(serializers.Serializer):
+    """A line of the imported catalogue. The related objects are given by their names or codes instead of ids."""
+    type = serializers.CharField(max_length=50)
+    producer = serializers.CharField(max_length=25)
+    producer_name = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    brand_name = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    name = serializers.CharField(max_length=100)
+    catalog_no = serializers.CharField(max_length=50)
+    concentration = serializers.CharField(max_length=20, required=False, allow_blank=True)
+    volume = serializers.IntegerField(min_value=0)
+    unit = serializers.CharField(max_length=5)
+    purity_quality = serializers.CharField(max_length=30, required=False, allow_blank=True)
+    storage_conditions = SeparatedListField(child=serializers.CharField(max_length=30), allow_empty=False)
+    hazard_statements = SeparatedListField(child=serializers.CharField(max_length=30), required=False)
+    precautionary_statements = SeparatedListField(child=serializers.CharField(max_length=30), required=False)
+    safety_data_sheet = serializers.CharField(max_length=7)
+    safety_instruction = serializers.CharField(max_length=6, required=False, allow_blank=True)
+    cas_no = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    other_info = serializers.CharField(max_length=200, required=False, allow_blank=True)
+    kit_contents = serializers.CharField(max_length=300, required=False, allow_blank=True)
+    is_usage_record_required = serializers.BooleanField()
+
+
+class ReagentCatalogueImportSerializer(serializers.Serializer):
+    FORMATS = ("csv", "jsonl")
+
+    file = serializers.FileField(write_only=True)
+
+    def validate_file(self, value):
+        extension = value.name.rsplit(".", 1)[-1].lower()
+        if extension not in self.FORMATS:
+            raise serializers.ValidationError(
+                f"Obsługiwane są wyłącznie pliki w formatach: {', '.join(self.FORMATS)}."
+            )
+        return value
 
 
 class ReagentFieldUserSerializer(serializers.ModelSerializer):
@@ -735,29 +897,22 @@ class ProjectProcedureCreateAsProjectManagerSerializer(ProjectProcedureUpdateSer
         pass
 
 
-class ProjectProcedureHistoricalRecordsSerializer(ProjectProcedureReadSerializer):
+class ProjectProcedureHistoricalRecordsSerializer(HistoricalM2MRecordsSerializerMixin, ProjectProcedureReadSerializer):
     id = serializers.IntegerField(source="history_id", read_only=True)
     pk = serializers.IntegerField(source="id", read_only=True)
     workers = serializers.SerializerMethodField()
 
+    historical_m2m_fields = {
+        "workers": ("user", "username"),
+    }
+
     class Meta:
         model = models.ProjectProcedure.history.model  # pylint: disable=no-member
         exclude = ["history_id"]
+        list_serializer_class = HistoricalM2MRecordsListSerializer
 
     def get_workers(self, obj):
-        workers = obj.workers.filter(
-            history_id=obj.history_id
-        ).order_by(
-            "user__id"
-        ).values(
-            "user__id", "user__username"
-        )
-        return [
-            {
-                "id": worker["user__id"],
-                "repr": worker["user__username"],
-            } for worker in workers
-        ]
+        return self.get_historical_m2m_field(obj, "workers")
 
 
 class LaboratorySerializer(serializers.ModelSerializer):
@@ -811,27 +966,37 @@ class PersonalReagentReadSerializer(serializers.ModelSerializer):
         allow_null=True,
     )
     laboratory = ReagentFieldLaboratorySerializer(read_only=True)
-    clp_classifications = serializers.SerializerMethodField()
+    clp_classifications = serializers.JSONField(source="reagent.clp_classifications", read_only=True)
     is_usage_record_required = serializers.BooleanField(source="reagent.is_usage_record_required", read_only=True)
 
     class Meta:
         model = models.PersonalReagent
         fields = "__all__"
 
-    def get_clp_classifications(self, obj):
-        clp_classifications = {}
-        for hazard_statement in obj.reagent.hazard_statements.all():
-            clp_classifications[hazard_statement.clp_classification_id] = {
-                "id": hazard_statement.clp_classification_id,
-                "repr": str(hazard_statement.clp_classification),
-            }
-        return list(clp_classifications.values())
+
+PROJECT_PROCEDURE_WORKER_ERROR = {
+    "project_procedure": "Użytkownik musi być pracownikiem projektu/procedury, "
+                         "aby dodać lub modyfikować należący tam odczynnik osobisty."
+}
+DETAILED_LOCATION_REQUIRED_ERROR = {
+    "detailed_location": "Lokalizacja szczegółowa jest wymagana dla odczynników, "
+                         "które przypisane są do procedur badawczych, których nazwa zaczyna się na PB."
+}
+OPENING_DATE_ERROR = {
+    "opening_date": "Data otwarcia nie może być wcześniejsza niż data zakupu odczynnika."
+}
 
 
 class PersonalReagentCreateAsAdminSerializer(serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta:
         model = models.PersonalReagent
         exclude = ["disposal_utilization_date", "is_usage_record_generated", "is_archived"]
+        list_serializer_class = BulkCreateListSerializer
+        bulk_prefetch_related = {
+            "project_procedure": [Prefetch("workers", queryset=models.User.objects.only("id"))],
+        }
 
     def validate(self, attrs):
         """Check that:
@@ -847,24 +1012,42 @@ class PersonalReagentCreateAsAdminSerializer(serializers.ModelSerializer):
 
         if project_procedure is not None:
             if main_owner not in project_procedure.workers.all():
-                raise serializers.ValidationError(detail={
-                    "project_procedure": "Użytkownik musi być pracownikiem projektu/procedury, "
-                                         "aby dodać lub modyfikować należący tam odczynnik osobisty."
-                })
+                raise serializers.ValidationError(detail=PROJECT_PROCEDURE_WORKER_ERROR)
             if not detailed_location and project_procedure.name.startswith("PB"):
-                raise serializers.ValidationError(detail={
-                    "detailed_location": "Lokalizacja szczegółowa jest wymagana dla odczynników, "
-                                         "które przypisane są do procedur badawczych, których nazwa zaczyna się na PB."
-                })
+                raise serializers.ValidationError(detail=DETAILED_LOCATION_REQUIRED_ERROR)
 
         if opening_date is not None and opening_date < receipt_purchase_date:
-                raise serializers.ValidationError(detail={
-                    "opening_date": "Data otwarcia nie może być wcześniejsza niż data zakupu odczynnika."
-                })
+                raise serializers.ValidationError(detail=OPENING_DATE_ERROR)
 
         return attrs
 
 
+def validate_personal_reagents_changes(personal_reagents, changes):
+    """The set-based equivalent of `PersonalReagentCreateAsAdminSerializer.validate` for the same `changes`
+    (of the fields of `PersonalReagentBulkChangesSerializer`) applied to every personal reagent of the queryset."""
+    main_owner = changes["main_owner"].id if "main_owner" in changes else OuterRef("main_owner")
+    if personal_reagents.filter(project_procedure__isnull=False).exclude(Exists(
+        models.ProjectProcedure.workers.through.objects.filter(
+            projectprocedure=OuterRef("project_procedure"), user=main_owner
+        )
+    )).exists():
+        raise serializers.ValidationError(detail=PROJECT_PROCEDURE_WORKER_ERROR)
+
+    if "detailed_location" not in changes:
+        missing_detailed_location = Q(detailed_location__isnull=True) | Q(detailed_location="")
+    elif not changes["detailed_location"]:
+        missing_detailed_location = Q()
+    else:
+        missing_detailed_location = None
+    if missing_detailed_location is not None and personal_reagents.filter(
+        missing_detailed_location, project_procedure__name__startswith="PB"
+    ).exists():
+        raise serializers.ValidationError(detail=DETAILED_LOCATION_REQUIRED_ERROR)
+
+    if personal_reagents.filter(opening_date__lt=F("receipt_purchase_date")).exists():
+        raise serializers.ValidationError(detail=OPENING_DATE_ERROR)
+
+
 class PersonalReagentCreateWithLabRoleSerializer(PersonalReagentCreateAsAdminSerializer):
     main_owner = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
@@ -895,6 +1078,23 @@ class PersonalReagentUpdateAsLabManagerProjectManagerNotFromProjectLabWorkerSeri
         pass
 
 
+class PersonalReagentBulkChangesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.PersonalReagent
+        fields = ["is_archived", "room", "detailed_location", "laboratory", "main_owner"]
+        extra_kwargs = {field_name: {"required": False} for field_name in fields}
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("Należy podać co najmniej jedną zmianę.")
+        return attrs
+
+
+class PersonalReagentBulkUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    changes = PersonalReagentBulkChangesSerializer()
+
+
 class PersonalViewSerializer(serializers.ModelSerializer):
     reagent = ReagentFieldReagentSerializer(read_only=True)
     producer = ReagentFieldProducerSerializer(source="reagent.producer", read_only=True)
@@ -910,34 +1110,13 @@ class PersonalViewSerializer(serializers.ModelSerializer):
     precautionary_statements = ReagentFieldPrecautionaryStatementSerializer(
         source="reagent.precautionary_statements", read_only=True, many=True
     )
-    clp_classifications = serializers.SerializerMethodField()
-    signal_word = serializers.SerializerMethodField()
+    clp_classifications = serializers.JSONField(source="reagent.clp_classifications", read_only=True)
+    signal_word = serializers.CharField(source="reagent.signal_word", read_only=True)
 
     class Meta:
         model = models.PersonalReagent
         exclude = ["main_owner"]
 
-    def get_clp_classifications(self, obj):
-        clp_classifications = {}
-        for hazard_statement in obj.reagent.hazard_statements.all():
-            clp_classifications[hazard_statement.clp_classification_id] = {
-                "id": hazard_statement.clp_classification_id,
-                "repr": str(hazard_statement.clp_classification),
-            }
-        return list(clp_classifications.values())
-
-    def get_signal_word(self, obj):
-        # DANGER takes precedence over WARNING
-        signal_word = ""
-        signal_words = map(lambda x: x.signal_word, obj.reagent.hazard_statements.all())
-        for sw in signal_words:
-            if sw == models.HazardStatement.DANGER:
-                return sw
-            if sw == models.HazardStatement.WARNING:
-                signal_word = sw
-
-        return signal_word
-
 
 class PersonalReagentHistoricalRecordsSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source="history_id", read_only=True)
@@ -1071,6 +1250,13 @@ class ReagentRequestHistoricalRecordsSerializer(serializers.ModelSerializer):
         exclude = ["history_id"]
 
 
+class ReportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.ReportJob
+        # The report is downloaded with `/report-jobs/{id}/download/`
+        exclude = ["report"]
+
+
 class UserManualGetSerializer(serializers.Serializer):
     user_manual = serializers.CharField(read_only=True)
 
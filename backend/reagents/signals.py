@@ -0,0 +1,155 @@
+from django.apps import apps
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from simple_history.signals import post_create_historical_record
+
+from reagents import authentication, filters, generators, models, versions
+
+
+@receiver(post_save, sender=models.PersonalReagent)
+@receiver(post_delete, sender=models.PersonalReagent)
+@receiver(post_save, sender=models.Reagent)
+@receiver(post_delete, sender=models.Reagent)
+@receiver(post_save, sender=models.Laboratory)
+@receiver(post_delete, sender=models.Laboratory)
+@receiver(post_save, sender=models.ProjectProcedure)
+@receiver(post_delete, sender=models.ProjectProcedure)
+@receiver(post_delete, sender=models.User)
+def invalidate_statistics(sender, **kwargs):  # pylint: disable=unused-argument
+    generators.invalidate_statistics()
+
+
+@receiver(post_save, sender=models.User)
+def invalidate_statistics_on_user_save(sender, update_fields=None, **kwargs):  # pylint: disable=unused-argument
+    # Usernames are a part of the statistics, but logins (which update `last_login`) shouldn't invalidate them
+    if update_fields is None or set(update_fields) != {"last_login"}:
+        generators.invalidate_statistics()
+
+
+@receiver(post_save, sender=models.User)
+def revoke_claims_on_user_save(  # pylint: disable=unused-argument
+    sender, instance, created, update_fields=None, **kwargs
+):
+    if created:
+        # The claims of new users haven't been revoked, so their first tokens are trusted without loading them
+        authentication.cache_revocations({instance.id: None}, only_missing=True)
+    # Logins (which update `last_login`) don't change the claims
+    elif update_fields is None or set(update_fields) != {"last_login"}:
+        authentication.revoke_claims([instance.id])
+
+
+@receiver(post_delete, sender=models.User)
+def revoke_claims_on_user_delete(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    authentication.revoke_claims([instance.id])
+
+
+@receiver(models.users_updated, sender=models.User)
+def revoke_claims_on_users_update(sender, user_ids, **kwargs):  # pylint: disable=unused-argument
+    authentication.revoke_claims(user_ids)
+
+
+# The names of the related objects (laboratories, producers etc.) are a part of the facets as well
+@receiver(post_save, sender=models.PersonalReagent)
+@receiver(post_delete, sender=models.PersonalReagent)
+@receiver(post_save, sender=models.Reagent)
+@receiver(post_delete, sender=models.Reagent)
+@receiver(m2m_changed, sender=models.Reagent.hazard_statements.through)
+@receiver(post_save, sender=models.Laboratory)
+@receiver(post_delete, sender=models.Laboratory)
+@receiver(post_save, sender=models.ProjectProcedure)
+@receiver(post_delete, sender=models.ProjectProcedure)
+@receiver(post_delete, sender=models.User)
+@receiver(post_save, sender=models.ReagentType)
+@receiver(post_delete, sender=models.ReagentType)
+@receiver(post_save, sender=models.Producer)
+@receiver(post_delete, sender=models.Producer)
+@receiver(post_save, sender=models.HazardStatement)
+@receiver(post_delete, sender=models.HazardStatement)
+@receiver(post_save, sender=models.ClpClassification)
+@receiver(post_delete, sender=models.ClpClassification)
+def invalidate_facets(sender, **kwargs):  # pylint: disable=unused-argument
+    filters.invalidate_facets()
+
+
+@receiver(post_save, sender=models.User)
+def invalidate_facets_on_user_save(sender, update_fields=None, **kwargs):  # pylint: disable=unused-argument
+    # Usernames are a part of the facets, but logins (which update `last_login`) shouldn't invalidate them
+    if update_fields is None or set(update_fields) != {"last_login"}:
+        filters.invalidate_facets()
+
+
+@receiver(m2m_changed, sender=models.Reagent.hazard_statements.through)
+@receiver(m2m_changed, sender=models.Reagent.precautionary_statements.through)
+def update_hazard_summaries_on_statements_change(  # pylint: disable=unused-argument
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if reverse and action == "pre_clear":
+        remember_reagents_of_statement(sender, instance)
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if not reverse:
+            reagent_ids = [instance.pk]
+        elif action == "post_clear":
+            reagent_ids = instance.hazard_summary_reagent_ids
+        else:
+            reagent_ids = pk_set
+        models.Reagent.update_hazard_summaries(reagent_ids)
+
+
+@receiver(post_save, sender=models.Reagent)
+def update_hazard_summary_on_reagent_save(  # pylint: disable=unused-argument
+    sender, instance, created, update_fields=None, **kwargs
+):
+    # An instance loaded before a change of the statements saves a stale summary, so it's computed again
+    if not created and (update_fields is None or set(update_fields) & set(sender.HAZARD_SUMMARY_FIELDS)):
+        sender.update_hazard_summaries([instance.pk])
+
+
+@receiver(post_save, sender=models.HazardStatement)
+@receiver(post_save, sender=models.PrecautionaryStatement)
+def update_hazard_summaries_on_statement_save(sender, instance, created, **kwargs):  # pylint: disable=unused-argument
+    if not created:
+        models.Reagent.update_hazard_summaries(instance.reagent_set.values("id"))
+
+
+@receiver(post_save, sender=models.ClpClassification)
+def update_hazard_summaries_on_clp_classification_save(  # pylint: disable=unused-argument
+    sender, instance, created, **kwargs
+):
+    if not created:
+        models.Reagent.update_hazard_summaries(
+            models.Reagent.objects.filter(hazard_statements__clp_classification=instance).values("id")
+        )
+
+
+@receiver(pre_delete, sender=models.HazardStatement)
+@receiver(pre_delete, sender=models.PrecautionaryStatement)
+def remember_reagents_of_statement(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    # The relations to the reagents are gone after clearing or deleting the statement
+    instance.hazard_summary_reagent_ids = list(instance.reagent_set.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=models.HazardStatement)
+@receiver(post_delete, sender=models.PrecautionaryStatement)
+def update_hazard_summaries_on_statement_delete(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    models.Reagent.update_hazard_summaries(instance.hazard_summary_reagent_ids)
+
+
+@receiver(post_create_historical_record)
+def bump_version(sender, history_instance, **kwargs):  # pylint: disable=unused-argument
+    # Logins update only `last_login`, which is served only with the users (see `views.UserViewSet`),
+    # so they don't change the ETags of everything which refers to the users
+    if sender.instance_type is models.User and (previous_record := history_instance.prev_record) is not None:
+        if history_instance.diff_against(previous_record).changed_fields == ["last_login"]:
+            return
+    versions.bump_versions(sender.instance_type)
+
+
+@receiver(post_migrate, sender=apps.get_app_config("reagents"))
+def create_versions(sender, **kwargs):  # pylint: disable=unused-argument
+    try:
+        kwargs["apps"].get_model("reagents", "ModelVersion")
+    except LookupError:
+        # Migrated back to before the table of the versions was created
+        return
+    versions.create_versions(versions.get_versioned_models())
@@ -5,6 +5,7 @@ from itertools import chain
 from PIL import Image
 
 from django.conf import settings
+from django.core.cache import caches
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
 
@@ -13,9 +14,9 @@ import pytest
 from reportlab.pdfgen import canvas
 
 from rest_framework.test import APIClient
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from reagents import models
+from reagents.authentication import RefreshToken
 
 # Mock the current date(time)
 mock_timezone_now = timezone.now()
@@ -29,6 +30,26 @@ def media_settings(settings):  # pylint: disable=redefined-outer-name
     settings.MEDIA_URL = 'media/'
 
 
+@pytest.fixture(autouse=True)
+def shared_cache_settings(settings, tmp_path):  # pylint: disable=redefined-outer-name
+    """A file based cache is a stand-in for a shared backend (e.g. Redis), all processes of a machine can use it."""
+    settings.CACHES = {
+        **settings.CACHES,
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": str(tmp_path / "cache"),
+            "KEY_PREFIX": "lab_flow",
+        },
+    }
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(shared_cache_settings):  # pylint: disable=redefined-outer-name,unused-argument
+    """The caches aren't rolled back with the database."""
+    for cache in caches.all():
+        cache.clear()
+
+
 def assert_timezone_now_gte_datetime(date_time):
     assert date_time is not None
     if isinstance(date_time, str):
@@ -96,7 +117,7 @@ def mock_files():
 def model_to_dict(instance, fields=None, exclude=None):
     """A modified version of the django.forms.models.model_to_dict function.
     Allows to retrieve primary keys of both ForeignKey and ManyToMany fields.
-    Also, it doesn't remove non-editable fields.
+    Like the original, it skips the non-editable fields, which are computed rather than sent in requests.
     """
     opts = instance._meta
     data = {}
@@ -105,6 +126,8 @@ def model_to_dict(instance, fields=None, exclude=None):
             continue
         if exclude and f.name in exclude:
             continue
+        if not f.editable:
+            continue
         data[f.name] = f.value_from_object(instance)
     for f in opts.many_to_many:
         data[f.name] = [i.id for i in f.value_from_object(instance)]
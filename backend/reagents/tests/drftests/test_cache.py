@@ -0,0 +1,71 @@
+from django.apps import apps
+from django.core.cache import caches
+
+import pytest
+
+from reagents import cache, models, versions
+
+
+@pytest.mark.django_db
+def test_cache_namespace(django_capture_on_commit_callbacks):
+    generated = []
+
+    def generate(value):
+        generated.append(value)
+        return value
+
+    namespace = cache.Namespace("test", timeout=60)
+
+    assert 1 == namespace.get_or_set("key", generate, 1)
+    assert 1 == namespace.get_or_set("key", generate, 2)
+    assert [1] == generated
+
+    # The keys of other namespaces and of other versions don't collide
+    assert 3 == cache.Namespace("other", timeout=60).get_or_set("key", generate, 3)
+    assert 4 == namespace.get_or_set("key", generate, 4, version=cache.make_version(1, "a"))
+    assert 4 == namespace.get_or_set("key", generate, 5, version=cache.make_version(1, "a"))
+    assert 6 == namespace.get_or_set("key", generate, 6, version=cache.make_version(1, "b"))
+    assert [1, 3, 4, 6] == generated
+
+    # The version is kept in the shared cache, so another process sees the invalidation
+    version = namespace.get_version()
+    other_process_cache = caches.create_connection(cache.SHARED_CACHE_ALIAS)
+    assert version == other_process_cache.get(namespace.version_key)
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        namespace.invalidate()
+        version_before_commit = other_process_cache.get(namespace.version_key)
+
+    assert version != version_before_commit
+    # Changed again after the commit, a value generated during the transaction isn't used later
+    assert 1 == len(callbacks)
+    assert other_process_cache.get(namespace.version_key) not in (version, version_before_commit)
+    assert 7 == namespace.get_or_set("key", generate, 7)
+    # The values are kept in the local cache of the process only
+    assert other_process_cache.get(namespace.make_key("key")) is None
+
+
+@pytest.mark.django_db
+def test_change_versions_in_database(django_capture_on_commit_callbacks):
+    version = versions.get_version(models.Unit)
+    # Not kept in the cache, so another process (with its own cache) sees the same versions
+    cache.get_shared_cache().clear()
+
+    assert version == versions.get_version(models.Unit)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        versions.bump_versions(models.Unit)
+        # Bumped after the commit
+        assert version == versions.get_version(models.Unit)
+
+    assert version + 1 == versions.get_version(models.Unit)
+
+
+def test_get_versioned_models():
+    versioned_models = versions.get_versioned_models()
+
+    assert models.Reagent in versioned_models
+    assert models.ReportJob not in versioned_models
+    # The historical models of many-to-many fields have a `history` field too
+    assert hasattr(apps.get_model("reagents", "HistoricalReagent_storage_conditions"), "history")
+    assert not [model for model in versioned_models if model.__name__.startswith("Historical")]
@@ -5,12 +5,15 @@ import pytest
 
 from dateutil.relativedelta import relativedelta
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 
 from reagents import models
 from reagents.tests.drftests.conftest import mock_datetime_date_today
+from reagents.views import NotificationViewSet
 
 
 @pytest.mark.django_db
@@ -133,6 +136,15 @@ def test_get_reagents_with_pending_approval(api_client_admin, api_client_lab_man
     reagent2.is_validated_by_admin = False
     reagent2.save()
 
+    # The values computed in the database are the same as `__str__()`, also with empty fields
+    producer1.brand_name = ""
+    producer1.save()
+
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert str(producer1) == next(row["value"] for row in response.data["results"] if row["table_name"] == "Producer")
+
     client, _ = api_client_lab_manager
 
     response = client.get(url)
@@ -328,7 +340,8 @@ def test_get_reagents_with_close_expiration_date(api_client_lab_worker, personal
 
     assert response.status_code == status.HTTP_200_OK
 
-    actual = json.loads(json.dumps(response.data))
+    # The response is streamed
+    actual = json.loads(b"".join(response.streaming_content))
 
     assert expected == actual
 
@@ -613,3 +626,197 @@ def test_get_reagent_requests(api_client_lab_worker, api_client_admin, api_clien
 
     personal_reagent1 = models.PersonalReagent.objects.get(pk=personal_reagent1.id)
     assert personal_reagent1.main_owner == admin
+
+
+@pytest.mark.django_db
+def test_get_reagents_with_pending_approval_paginated(api_client_admin, reagent_types, producers, concentrations,
+                                                      units, purities_qualities, storage_conditions, reagents,
+                                                      django_assert_max_num_queries):
+    client, _ = api_client_admin
+    url = reverse("notifications-get-reagent-fields-with-pending-validation")
+
+    response = client.get(f"{url}?limit=100")
+    expected = json.loads(json.dumps(response.data["results"]))
+
+    # Versions, count and page (the user comes from the token)
+    with django_assert_max_num_queries(3):
+        response = client.get(f"{url}?limit=2&offset=2")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(expected) == response.data["count"]
+    assert expected[2:4] == json.loads(json.dumps(response.data["results"]))
+    assert [3, 4] == [reagent_field["id"] for reagent_field in response.data["results"]]
+
+    response = client.get(f"{url}?no_pagination")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert expected == json.loads(b"".join(response.streaming_content))
+
+
+@pytest.mark.django_db
+def test_get_notifications_summary(api_client_admin, api_client_lab_worker, api_client_anon, personal_reagents,
+                                   django_assert_max_num_queries, django_capture_on_commit_callbacks):
+    client, _ = api_client_admin
+    url = reverse("notifications-get-notifications-summary")
+
+    sections = {
+        "reagents_with_close_expiration_date": "notifications-get-reagents-with-close-expiration-date",
+        "reagents_with_not_generated_usage_records": "notifications-get-reagents-with-not-generated-usage-records",
+        "few_critical_reagents": "notifications-get-few-critical-reagents",
+        "reagent_requests": "notifications-get-reagent-requests",
+        "reagent_fields_with_pending_validation": "notifications-get-reagent-fields-with-pending-validation",
+    }
+    expected = {}
+    for name, url_name in sections.items():
+        response = client.get(f"{reverse(url_name)}?limit=2")
+        expected[name] = {
+            "count": response.data["count"],
+            "results": json.loads(json.dumps(response.data["results"])),
+        }
+
+    # The versions, the counts of personal reagents, few critical reagents, reagent requests
+    # and reagent fields with pending validation (the user comes from the token)
+    with django_assert_max_num_queries(5):
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert {name: {"count": section["count"], "results": []} for name, section in expected.items()} == response.data
+
+    response = client.get(f"{url}?limit=2")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert expected == json.loads(json.dumps(response.data))
+
+    # Cached, only the versions are queried
+    with django_assert_max_num_queries(1):
+        response = client.get(f"{url}?limit=2")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert expected == json.loads(json.dumps(response.data))
+
+    response = client.get(f"{url}?limit=abc")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.get(f"{url}?limit=101")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    client, lab_worker = api_client_lab_worker
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert "reagent_fields_with_pending_validation" not in response.data
+    expected_count = models.PersonalReagent.objects.filter(main_owner=lab_worker, is_archived=False).count()
+    assert expected_count == response.data["reagents_with_close_expiration_date"]["count"]
+
+    # Any change of the personal reagents invalidates the cached summary (after the commit)
+    personal_reagent = models.PersonalReagent.objects.filter(main_owner=lab_worker, is_archived=False).first()
+    personal_reagent.is_archived = True
+    with django_capture_on_commit_callbacks(execute=True):
+        personal_reagent.save()
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert expected_count - 1 == response.data["reagents_with_close_expiration_date"]["count"]
+
+    client = api_client_anon
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_notifications_use_indexes(api_client_lab_worker, reagents, laboratories):
+    _, lab_worker = api_client_lab_worker
+    reagent1, reagent2 = reagents
+    laboratory1, _ = laboratories
+
+    users = models.User.objects.bulk_create([
+        models.User(username=f"U{idx}", email=f"u{idx}@u.pl") for idx in range(50)
+    ])
+    models.PersonalReagent.objects.bulk_create([
+        models.PersonalReagent(
+            reagent=reagent1 if idx % 2 else reagent2,
+            is_critical=idx % 10 == 0,
+            main_owner=user,
+            lot_no=str(idx),
+            receipt_purchase_date=mock_datetime_date_today - datetime.timedelta(days=idx),
+            expiration_date=mock_datetime_date_today + datetime.timedelta(days=idx),
+            laboratory=laboratory1,
+            room="315",
+            is_usage_record_generated=idx % 10 != 0,
+            is_archived=idx % 10 != 0,
+        ) for user in [*users, lab_worker] for idx in range(100)
+    ])
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {models.PersonalReagent._meta.db_table}")  # pylint: disable=protected-access
+
+    personal_reagents = models.PersonalReagent.objects.select_related("reagent").order_by("id")
+    close_expiration_date = NotificationViewSet.filter_reagents_with_close_expiration_date(
+        personal_reagents.filter(
+            expiration_date__gte=mock_datetime_date_today,
+            expiration_date__lt=mock_datetime_date_today + datetime.timedelta(days=30),
+        ),
+        lab_worker,
+    )
+    not_generated_usage_records = NotificationViewSet.filter_reagents_with_not_generated_usage_records(
+        personal_reagents, lab_worker
+    )
+    few_critical = NotificationViewSet.filter_few_critical_reagents(personal_reagents, lab_worker)
+
+    assert "personal_reagent_owner_exp_idx" in close_expiration_date.explain()
+    assert "personal_reagent_owner_urg_idx" in not_generated_usage_records.explain()
+    assert "personal_reagent_owner_crt_idx" in few_critical.explain()
+
+
+@pytest.mark.django_db
+def test_get_reagents_with_close_expiration_date_ranges(api_client_lab_worker, personal_reagents):
+    client, _ = api_client_lab_worker
+    personal_reagent1, personal_reagent2, _, _ = personal_reagents
+    url = reverse("notifications-get-reagents-with-close-expiration-date")
+
+    personal_reagent1.expiration_date = datetime.date(mock_datetime_date_today.year + 1, 12, 31)
+    personal_reagent1.save()
+    personal_reagent2.expiration_date = datetime.date(mock_datetime_date_today.year + 2, 1, 1)
+    personal_reagent2.save()
+
+    # December ends at the first day of the next year
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(f"{url}?month=12&year={mock_datetime_date_today.year + 1}")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [personal_reagent1.id] == [personal_reagent["id"] for personal_reagent in response.data["results"]]
+    assert not [query for query in context.captured_queries if "EXTRACT" in query["sql"]]
+
+    # A month without a year is a single condition, also when the expiration dates are years apart
+    personal_reagent1.expiration_date = datetime.date(mock_datetime_date_today.year + 500, 1, 15)
+    personal_reagent1.save()
+
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(f"{url}?month=1")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert {personal_reagent1.id, personal_reagent2.id} == {
+        personal_reagent["id"] for personal_reagent in response.data["results"]
+    }
+    assert not [query for query in context.captured_queries if " OR " in query["sql"]]
+
+    # `days_ahead` limits the expiration date to the window starting today
+    personal_reagent1.expiration_date = mock_datetime_date_today + datetime.timedelta(days=7)
+    personal_reagent1.save()
+    personal_reagent2.expiration_date = mock_datetime_date_today + datetime.timedelta(days=8)
+    personal_reagent2.save()
+
+    response = client.get(f"{url}?days_ahead=7")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [personal_reagent1.id] == [personal_reagent["id"] for personal_reagent in response.data["results"]]
+
+    response = client.get(f"{url}?days_ahead=-1")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.get(f"{url}?days_ahead=abc")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
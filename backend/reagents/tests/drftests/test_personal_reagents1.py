@@ -5389,7 +5389,7 @@ def test_create_personal_reagents(api_client_admin, api_client_lab_manager, api_
 
         assert post_data == model_to_dict(db_personal_reagent)
 
-    # We can't anything over 50 though
+    # We can't add anything over 5000 though
     post_data = {
         "reagent": reagent1.id,
         "is_critical": True,
@@ -5400,7 +5400,7 @@ def test_create_personal_reagents(api_client_admin, api_client_lab_manager, api_
         "room": "314",
     }
 
-    response = client.post(url, [post_data] * 51)
+    response = client.post(url, [post_data] * 5001)
 
     assert response.status_code == status.HTTP_400_BAD_REQUEST
 
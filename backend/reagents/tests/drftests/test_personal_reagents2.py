@@ -2385,7 +2385,7 @@ def test_generate_sanepid_pip_report_data(personal_reagents):
             reagent4.safety_instruction.name,
         ],
     ]
-    actual = generators.generate_sanepid_pip_report_data(PersonalReagent.objects.all())
+    actual = list(generators.generate_sanepid_pip_report_data(PersonalReagent.objects.all()))
 
     assert expected == actual
 
@@ -2550,7 +2550,7 @@ def test_generate_lab_manager_report_data(personal_reagents):
             reagent4.type,
         ],
     ]
-    actual = generators.generate_lab_manager_report_data(PersonalReagent.objects.all())
+    actual = list(generators.generate_lab_manager_report_data(PersonalReagent.objects.all()))
 
     assert expected == actual
 
@@ -2715,7 +2715,7 @@ def test_generate_projects_procedures_report_data(personal_reagents):
             personal_reagent4_clp_classifications,
         ],
     ]
-    actual = generators.generate_projects_procedures_report_data(PersonalReagent.objects.all())
+    actual = list(generators.generate_projects_procedures_report_data(PersonalReagent.objects.all()))
 
     assert expected == actual
 
@@ -2938,7 +2938,7 @@ def test_generate_all_personal_reagents_report_data(personal_reagents):
             personal_reagent4.user_comment,
         ],
     ]
-    actual = generators.generate_all_personal_reagents_report_data(PersonalReagent.objects.all())
+    actual = list(generators.generate_all_personal_reagents_report_data(PersonalReagent.objects.all()))
 
     assert expected == actual
 
@@ -3163,9 +3163,9 @@ def test_generate_personal_view_report_data(personal_reagents):
             personal_reagent3.user_comment,
         ],
     ]
-    actual = generators.generate_personal_view_report_data(
+    actual = list(generators.generate_personal_view_report_data(
         PersonalReagent.objects.filter(main_owner=personal_reagent1.main_owner).order_by("id")
-    )
+    ))
 
     assert expected == actual
 
@@ -0,0 +1,1008 @@
+"""This file tests PersonalReagent and ProjectProcedure."""
+
+import csv
+import datetime
+import io
+import json
+import re
+
+import pytest
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import FileResponse, StreamingHttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from openpyxl import load_workbook
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.platypus import Paragraph, Table, TableStyle
+
+from rest_framework import status
+
+from reagents import checks, filters, generators
+from reagents.models import PersonalReagent, ProjectProcedure, ReportJob
+from reagents.views import PersonalReagentViewSet
+
+
+@pytest.mark.django_db
+def test_list_personal_reagents_with_cursor(api_client_admin, api_client_anon, personal_reagents):
+    client, _ = api_client_admin
+    personal_reagent1, personal_reagent2, personal_reagent3, personal_reagent4 = personal_reagents
+
+    url = f"{reverse('personal_reagents-list')}?cursor=&limit=3"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert "count" not in response.data
+    assert response.data["previous"] is None
+    assert [personal_reagent1.id, personal_reagent2.id, personal_reagent3.id] == [
+        personal_reagent["id"] for personal_reagent in response.data["results"]
+    ]
+
+    response = client.get(response.data["next"])
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["next"] is None
+    assert [personal_reagent4.id] == [personal_reagent["id"] for personal_reagent in response.data["results"]]
+
+    response = client.get(response.data["previous"])
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["previous"] is None
+    assert [personal_reagent1.id, personal_reagent2.id, personal_reagent3.id] == [
+        personal_reagent["id"] for personal_reagent in response.data["results"]
+    ]
+
+    # Ordering by a date field (with equal values resolved by `id`)
+    personal_reagent3.expiration_date = personal_reagent2.expiration_date
+    personal_reagent3.save()
+
+    url = f"{reverse('personal_reagents-list')}?cursor=&limit=2&ordering=-expiration_date"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [personal_reagent3.id, personal_reagent2.id] == [
+        personal_reagent["id"] for personal_reagent in response.data["results"]
+    ]
+
+    response = client.get(response.data["next"])
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["next"] is None
+    assert [personal_reagent1.id, personal_reagent4.id] == [
+        personal_reagent["id"] for personal_reagent in response.data["results"]
+    ]
+
+    # NULLs go last when ascending
+    url = f"{reverse('personal_reagents-list')}?cursor=&limit=1&ordering=opening_date"
+    response = client.get(url)
+    actual = [personal_reagent["id"] for personal_reagent in response.data["results"]]
+    while response.data["next"] is not None:
+        response = client.get(response.data["next"])
+        actual += [personal_reagent["id"] for personal_reagent in response.data["results"]]
+
+    assert [personal_reagent1.id, personal_reagent2.id, personal_reagent3.id, personal_reagent4.id] == actual
+
+    # Filters are applied before the cursor
+    url = f"{reverse('personal_reagents-list')}?cursor=&is_archived=true"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [personal_reagent4.id] == [personal_reagent["id"] for personal_reagent in response.data["results"]]
+
+    # History is ordered by `-history_id`
+    url = f"{reverse('personal_reagents-get-historical-records')}?cursor=&limit=2"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    expected = list(PersonalReagent.history.order_by("-history_id").values_list("history_id", flat=True)[:2])
+    assert expected == [history_record["id"] for history_record in response.data["results"]]
+
+    response = client.get(response.data["next"])
+
+    assert response.status_code == status.HTTP_200_OK
+    expected = list(PersonalReagent.history.order_by("-history_id").values_list("history_id", flat=True)[2:4])
+    assert expected == [history_record["id"] for history_record in response.data["results"]]
+
+    # Only local fields can be used for ordering
+    url = f"{reverse('personal_reagents-list')}?cursor=&ordering=reagent"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    url = f"{reverse('personal_reagents-list')}?cursor=abc"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    client = api_client_anon
+    response = client.get(f"{reverse('personal_reagents-list')}?cursor=")
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_list_personal_reagents_without_pagination(api_client_admin, personal_reagents, monkeypatch):
+    client, _ = api_client_admin
+
+    url = f"{reverse('personal_reagents-list')}?limit=100"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+
+    expected = json.loads(json.dumps(response.data["results"]))
+
+    url = f"{reverse('personal_reagents-list')}?no_pagination"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.streaming
+    assert response["Content-Type"] == "application/json"
+
+    actual = json.loads(b"".join(response.streaming_content))
+
+    assert expected == actual
+
+    # The results are serialized in chunks
+    url = f"{reverse('personal_reagents-get-historical-records')}?limit=100"
+    response = client.get(url)
+    expected = json.loads(json.dumps(response.data["results"]))
+
+    monkeypatch.setattr(PersonalReagentViewSet, "streaming_chunk_size", 3)
+    url = f"{reverse('personal_reagents-get-historical-records')}?no_pagination"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+
+    actual = json.loads(b"".join(response.streaming_content))
+
+    assert len(expected) == len(personal_reagents)
+    assert expected == actual
+
+    # Empty results
+    url = f"{reverse('personal_reagents-list')}?no_pagination&is_archived=true&is_critical=true"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [] == json.loads(b"".join(response.streaming_content))
+
+
+@pytest.mark.django_db
+def test_get_projects_procedures_historical_records_workers(api_client_admin, api_client_lab_manager,
+                                                            projects_procedures, django_assert_max_num_queries):
+    client, _ = api_client_admin
+    _, lab_manager = api_client_lab_manager
+    project_procedure1, project_procedure2 = projects_procedures
+
+    project_procedure1.workers.add(lab_manager.id)
+    project_procedure2.workers.remove(lab_manager.id)
+
+    expected = [
+        {
+            "id": historical_record.history_id,
+            "workers": [
+                {
+                    "id": worker["user__id"],
+                    "repr": worker["user__username"],
+                } for worker in historical_record.workers.filter(
+                    history_id=historical_record.history_id
+                ).order_by(
+                    "user__id"
+                ).values(
+                    "user__id", "user__username"
+                )
+            ],
+        } for historical_record in ProjectProcedure.history.order_by("-history_id")
+    ]
+
+    # Versions, count, page and one query for workers of all historical records (the user comes from the token)
+    with django_assert_max_num_queries(4):
+        response = client.get(f"{reverse('projectprocedure-get-historical-records')}?limit=100")
+
+    assert response.status_code == status.HTTP_200_OK
+
+    actual = [
+        {
+            "id": historical_record["id"],
+            "workers": historical_record["workers"],
+        } for historical_record in response.data["results"]
+    ]
+
+    assert expected == actual
+
+
+@pytest.mark.django_db
+def test_generate_report_in_background(api_client_admin, api_client_lab_manager, api_client_lab_worker,
+                                       api_client_anon, personal_reagents):
+    client, lab_worker = api_client_lab_worker
+    url = f"{reverse('personal_reagents-generate-all-personal-reagents-report')}?is_archived=false"
+
+    response = client.post(url)
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.data["status"] == ReportJob.PENDING
+    assert response.data["report_type"] == ReportJob.ALL
+    assert response.data["query_string"] == "is_archived=false"
+    assert response.data["requester"] == lab_worker.id
+
+    report_job_url = reverse("reportjob-detail", kwargs={"pk": response.data["id"]})
+    download_url = reverse("reportjob-download-report", kwargs={"pk": response.data["id"]})
+
+    response = client.get(download_url)
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    call_command("process_report_jobs", "--once", stdout=io.StringIO())
+
+    response = client.get(report_job_url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["status"] == ReportJob.DONE
+    assert response.data["started_date"] is not None
+    assert response.data["finished_date"] is not None
+
+    response = client.get(download_url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert isinstance(response, FileResponse)
+    assert response.as_attachment
+    assert get_valid_filename(f"raport_wszystkie_odczynniki_osobiste_{lab_worker.username}.pdf") == response.filename
+    assert b"".join(response.streaming_content).startswith(b"%PDF")
+
+    # Other users can't see the job, except for admins
+    client, _ = api_client_lab_manager
+
+    assert client.get(report_job_url).status_code == status.HTTP_404_NOT_FOUND
+    assert client.get(reverse("reportjob-list")).data["count"] == 0
+
+    client, _ = api_client_admin
+
+    assert client.get(report_job_url).status_code == status.HTTP_200_OK
+
+    # Permissions of the report actions apply to POST too
+    client, _ = api_client_lab_worker
+    response = client.post(reverse("personal_reagents-generate-sanepid-pip-report"))
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    url = f"{reverse('personal_reagents-generate-all-personal-reagents-report')}?expiration_date_lt=abc"
+    response = client.post(url)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert ReportJob.objects.count() == 1
+
+    # A job which can't be generated is marked as failed
+    ReportJob.objects.create(requester=lab_worker, report_type=ReportJob.ALL, query_string="expiration_date_lt=abc")
+    call_command("process_report_jobs", "--once", stdout=io.StringIO())
+
+    report_job = ReportJob.objects.get(query_string="expiration_date_lt=abc")
+    assert report_job.status == ReportJob.FAILED
+    assert report_job.error != ""
+
+    # The permissions are checked again when the job runs
+    report_job = ReportJob.objects.create(requester=lab_worker, report_type=ReportJob.SANEPID_PIP)
+    call_command("process_report_jobs", "--once", stdout=io.StringIO())
+
+    report_job.refresh_from_db()
+    assert report_job.status == ReportJob.FAILED
+
+    report_job = ReportJob.objects.create(requester=lab_worker, report_type=ReportJob.ALL)
+    lab_worker.is_active = False
+    lab_worker.save()
+    call_command("process_report_jobs", "--once", stdout=io.StringIO())
+
+    report_job.refresh_from_db()
+    assert report_job.status == ReportJob.FAILED
+    assert report_job.error == "Konto zlecającego raport jest nieaktywne."
+
+    # The jobs abandoned by a dead worker don't stay running forever
+    stale_report_job = ReportJob.objects.create(
+        requester=lab_worker,
+        report_type=ReportJob.ALL,
+        status=ReportJob.RUNNING,
+        started_date=timezone.now() - datetime.timedelta(hours=2),
+    )
+    running_report_job = ReportJob.objects.create(
+        requester=lab_worker, report_type=ReportJob.ALL, status=ReportJob.RUNNING, started_date=timezone.now()
+    )
+    call_command("process_report_jobs", "--once", stdout=io.StringIO())
+
+    stale_report_job.refresh_from_db()
+    running_report_job.refresh_from_db()
+    assert stale_report_job.status == ReportJob.FAILED
+    assert stale_report_job.finished_date is not None
+    assert running_report_job.status == ReportJob.RUNNING
+
+    client = api_client_anon
+    response = client.get(reverse("reportjob-list"))
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_generate_report_in_chunks(personal_reagents, monkeypatch):
+    report_data = list(generators.generate_all_personal_reagents_report_data(PersonalReagent.objects.order_by("id")))
+    header, *rows = report_data
+    data_font_size = 3
+
+    # The widths of the columns are the same as for a single table
+    table = Table(report_data)
+    table.setStyle(TableStyle([
+        ("FONTNAME", (0, 0), (-1, 0), generators.BOLD_FONT),
+        ("FONTNAME", (0, 1), (-1, -1), generators.REGULAR_FONT),
+        ("FONTSIZE", (0, 0), (-1, -1), data_font_size),
+    ]))
+    table.wrap(10000, 10000)
+    actual = generators.get_report_column_widths(header, rows, data_font_size)
+
+    assert table._colWidths == pytest.approx(actual)  # pylint: disable=protected-access
+
+    monkeypatch.setattr(generators, "REPORT_TABLE_CHUNK_SIZE", 3)
+    tables = list(generators.generate_report_tables(header, iter(rows), actual, data_font_size))
+
+    # Each table repeats the header
+    assert [4, 2] == [table._nrows for table in tables]  # pylint: disable=protected-access
+    assert all(table._argW == actual for table in tables)  # pylint: disable=protected-access
+
+    io_buffer = generators.generate_report("Raport", "admin", iter(report_data), data_font_size)
+
+    assert io_buffer.getvalue().startswith(b"%PDF")
+
+    # Only the header and a sample of the rows are read before the tables are built
+    monkeypatch.setattr(generators, "REPORT_COLUMN_WIDTHS_SAMPLE_SIZE", 1)
+    consumed = []
+    consumed_before_widths = []
+
+    def stream_rows():
+        for row in report_data:
+            consumed.append(row)
+            yield row
+
+    def get_report_column_widths(*args):
+        consumed_before_widths.append(len(consumed))
+        return actual
+
+    monkeypatch.setattr(generators, "get_report_column_widths", get_report_column_widths)
+    io_buffer = generators.generate_report("Raport", "admin", stream_rows(), data_font_size)
+
+    assert [2] == consumed_before_widths
+    assert report_data == consumed
+    assert io_buffer.getvalue().startswith(b"%PDF")
+
+    io_buffer = generators.generate_report("Raport", "admin", iter([header]), data_font_size)
+
+    assert io_buffer.getvalue().startswith(b"%PDF")
+
+
+def test_generate_report_with_wide_values_after_sample(monkeypatch):
+    monkeypatch.setattr(generators, "REPORT_COLUMN_WIDTHS_SAMPLE_SIZE", 1)
+    data_font_size = 3
+    header = ["Nazwa", "Komentarz"]
+    rows = [["Kwas", "Brak"], ["Zasada", "Bardzo długi komentarz <dodany> & zapisany\nw dwóch liniach " * 10]]
+    column_widths = generators.get_report_column_widths(header, rows[:1], data_font_size)
+
+    wrapped_rows = list(generators.wrap_wide_values(rows, column_widths, data_font_size))
+
+    # Only the values wider than their columns are wrapped, and they fit the columns
+    assert rows[0] == wrapped_rows[0]
+    name, comment = wrapped_rows[1]
+    assert "Zasada" == name
+    assert isinstance(comment, Paragraph)
+    available_width = column_widths[1] - generators.REPORT_CELL_PADDING
+    comment.wrap(available_width, 10000)
+    assert len(comment.blPara.lines) > 20
+    assert all(line_width <= available_width for line_width in comment.getActualLineWidths0())
+
+    io_buffer = generators.generate_report("Raport", "admin", iter([header, *rows]), data_font_size)
+
+    assert io_buffer.getvalue().startswith(b"%PDF")
+
+
+def test_page_count_footer():
+    io_buffer = io.BytesIO()
+    pdf_canvas = generators.ReportCanvas(io_buffer, pagesize=(A4[1], A4[0]), pageCompression=0)
+    pdf_canvas.showPage()
+    pdf_canvas.showPage()
+    pdf_canvas.save()
+    content = io_buffer.getvalue().decode("latin-1")
+
+    # Every page places the form with its own text at the right margin
+    for page_number in (1, 2):
+        match = re.search(rf"1 0 0 1 (\S+) \S+ cm\n/FormXob.page_number_{page_number} Do", content)
+        assert match is not None
+        assert A4[1] - generators.MARGIN == pytest.approx(float(match.group(1)), abs=1e-4)
+
+    # The text ends at the origin of the form, so it's flush with the margin whatever the number of pages is
+    for page_number in (1, 2):
+        text = f"Strona {page_number} z 2"
+        match = re.search(rf"BT 1 0 0 1 (\S+) 0 Tm [^\n]*\({text}\) Tj", content)
+        assert match is not None
+        width = pdfmetrics.stringWidth(text, generators.REGULAR_FONT, generators.ReportCanvas.page_count_font_size)
+        assert -width == pytest.approx(float(match.group(1)), abs=1e-4)
+
+
+@pytest.mark.django_db
+def test_generate_report_csv_xlsx(api_client_lab_worker, personal_reagents):
+    client, lab_worker = api_client_lab_worker
+    url = reverse("personal_reagents-generate-all-personal-reagents-report")
+    expected = [
+        [generators.get_export_value(value) for value in row]
+        for row in generators.generate_all_personal_reagents_report_data(PersonalReagent.objects.order_by("id"))
+    ]
+    assert "Nazwa odczynnika" == expected[0][1]
+    assert len(expected) == 5
+
+    response = client.get(f"{url}?format=csv")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert isinstance(response, StreamingHttpResponse)
+    assert response["Content-Type"] == "text/csv; charset=utf-8"
+    filename = get_valid_filename(f"raport_wszystkie_odczynniki_osobiste_{lab_worker.username}.csv")
+    assert f'attachment; filename="{filename}"' == response["Content-Disposition"]
+    content = b"".join(response.streaming_content).decode("utf-8-sig")
+    assert [[str(value) for value in row] for row in expected] == list(csv.reader(io.StringIO(content)))
+
+    response = client.get(f"{url}?format=xlsx")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert isinstance(response, FileResponse)
+    assert get_valid_filename(f"raport_wszystkie_odczynniki_osobiste_{lab_worker.username}.xlsx") == response.filename
+    workbook = load_workbook(io.BytesIO(b"".join(response.streaming_content)), read_only=True)
+    actual = [
+        [value.date() if isinstance(value, datetime.datetime) else value or "" for value in row]
+        for row in workbook.active.iter_rows(values_only=True)
+    ]
+    assert expected == actual
+
+    response = client.get(f"{url}?format=doc")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    # The filters are validated before the response starts
+    response = client.get(f"{url}?format=csv&expiration_date_lt=abc")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    # The format is kept in the query string of the background job
+    response = client.post(f"{url}?format=csv")
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+    call_command("process_report_jobs", "--once", stdout=io.StringIO())
+
+    response = client.get(reverse("reportjob-download-report", kwargs={"pk": response.data["id"]}))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert filename == response.filename
+    assert content == b"".join(response.streaming_content).decode("utf-8-sig")
+
+
+@pytest.mark.django_db
+def test_conditional_get_personal_view(api_client_admin, api_client_lab_worker, personal_reagents,
+                                       django_assert_max_num_queries, django_capture_on_commit_callbacks):
+    client, lab_worker = api_client_lab_worker
+    url = reverse("personal_reagents-get-personal-view")
+
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["count"] > 0
+    etag = response["ETag"]
+    assert "no-cache" in response["Cache-Control"]
+
+    # Only the versions are queried, the user comes from the token
+    with django_assert_max_num_queries(1):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response["ETag"] == etag
+
+    # The ETag depends on the query params and the user
+    response = client.get(f"{url}?ordering=room", HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == status.HTTP_200_OK
+
+    admin_client, _ = api_client_admin
+    response = admin_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == status.HTTP_200_OK
+
+    # A change of a related object changes the ETag (after the commit)
+    personal_reagent = PersonalReagent.objects.filter(main_owner=lab_worker).first()
+    producer = personal_reagent.reagent.producer
+    producer.abbreviation = "NEW"
+    with django_capture_on_commit_callbacks(execute=True):
+        producer.save()
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["ETag"] != etag
+    etag = response["ETag"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.patch(
+            reverse("personal_reagents-detail", kwargs={"pk": personal_reagent.id}),
+            {"room": "999"},
+            format="json",
+            HTTP_IF_NONE_MATCH=etag,
+        )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert "ETag" not in response
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["ETag"] != etag
+
+    # Made up ETags don't match
+    response = client.get(url, HTTP_IF_NONE_MATCH='"abc"')
+
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_generate_statistics_cached(api_client_admin, api_client_lab_worker, personal_reagents,
+                                    django_assert_max_num_queries):
+    client, admin = api_client_admin
+    url = reverse("personal_reagents-generate-statistics")
+
+    expected = client.get(url).data
+
+    # No queries, the user comes from the token
+    with django_assert_max_num_queries(0):
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert expected == response.data
+
+    # Statistics of a lab worker are cached separately
+    client, lab_worker = api_client_lab_worker
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert lab_worker.username == response.data["worker_personal_reagents"][0]["agg_fields"]["username"]
+
+    # Changes of personal reagents invalidate the statistics
+    personal_reagent1 = personal_reagents[0]
+    personal_reagent1.main_owner = admin
+    personal_reagent1.save()
+
+    client, _ = api_client_admin
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert expected != response.data
+    assert expected["global_personal_reagents"] != response.data["global_personal_reagents"]
+
+
+@pytest.mark.django_db
+def test_search_personal_reagents(api_client_admin, personal_reagents):
+    client, admin = api_client_admin
+    personal_reagent1, personal_reagent2, personal_reagent3, _ = personal_reagents
+    reagent1 = personal_reagent1.reagent
+    reagent2 = personal_reagent3.reagent
+
+    url = f"{reverse('personal_reagents-list')}?search={reagent1.name[1:-1].upper()}"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [personal_reagent1.id, personal_reagent2.id] == [
+        personal_reagent["id"] for personal_reagent in response.data["results"]
+    ]
+
+    url = f"{reverse('personal_reagents-list')}?search={reagent2.producer.abbreviation.lower()}"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    expected = [
+        personal_reagent.id for personal_reagent in personal_reagents
+        if personal_reagent.reagent.producer == reagent2.producer
+    ]
+    assert expected == [personal_reagent["id"] for personal_reagent in response.data["results"]]
+
+    # Every term has to match one of the fields
+    url = f"{reverse('personal_reagents-list')}?search={reagent2.name} {admin.username}"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [personal_reagent3.id] == [personal_reagent["id"] for personal_reagent in response.data["results"]]
+
+    url = f"{reverse('personal_reagents-get-historical-records')}?search={admin.username}"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert {personal_reagent3.id} == {personal_reagent["pk"] for personal_reagent in response.data["results"]}
+
+    url = f"{reverse('reagent-list')}?search={reagent2.producer.abbreviation}"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [reagent2.id] == [reagent["id"] for reagent in response.data["results"]]
+
+
+@pytest.mark.django_db
+def test_create_search_indexes():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+        is_trigram_extension_available = cursor.fetchone()[0]
+
+    # The missing indexes are reported by the check and can be created later
+    missing_indexes = filters.get_missing_trigram_indexes(connection)
+    errors = checks.check_trigram_indexes(None, databases=["default"])
+    assert (["reagents.W001"] if missing_indexes else []) == [error.id for error in errors]
+
+    if is_trigram_extension_available:
+        call_command("create_search_indexes", stdout=io.StringIO())
+        call_command("create_search_indexes", stdout=io.StringIO())
+
+        assert [] == filters.get_missing_trigram_indexes(connection)
+        assert [] == checks.check_trigram_indexes(None, databases=["default"])
+    else:
+        with pytest.raises(CommandError):
+            call_command("create_search_indexes", stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+def test_search_uses_trigram_indexes():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+        if not cursor.fetchone()[0]:
+            pytest.skip("pg_trgm isn't available")
+
+        filters.create_trigram_indexes(connection)
+        # The test tables are too small for the planner to choose the indexes on its own
+        cursor.execute("SET LOCAL enable_seqscan = off")
+
+    search_filter = filters.TrigramSearchFilter()
+    index_names = {
+        "reagent__name": "reagent_name_trgm_idx",
+        "reagent__producer__abbreviation": "producer_abbrev_trgm_idx",
+        "main_owner__username": "user_username_trgm_idx",
+    }
+    assert set(index_names) == set(PersonalReagentViewSet.search_fields)
+    for search_field, index_name in index_names.items():
+        related_model = search_filter.get_search_field_model(PersonalReagent, search_field)
+        queryset = PersonalReagent.objects.filter(
+            search_filter.get_search_condition(search_field, related_model, "kot")
+        )
+
+        assert index_name in queryset.explain()
+
+
+@pytest.mark.django_db
+def test_get_personal_reagents_facets(api_client_admin, api_client_anon, personal_reagents,
+                                      django_assert_max_num_queries):
+    client, _ = api_client_admin
+    personal_reagent1, _, _, personal_reagent4 = personal_reagents
+    url = reverse("personal_reagents-get-facets")
+
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    rooms = sorted({personal_reagent.room for personal_reagent in personal_reagents})
+    assert [
+        {
+            "value": room,
+            "count": len([personal_reagent for personal_reagent in personal_reagents if personal_reagent.room == room]),
+        } for room in rooms
+    ] == response.data["room"]
+    assert sum(facet["count"] for facet in response.data["main_owner"]) == len(personal_reagents)
+    expected = {}
+    for personal_reagent in personal_reagents:
+        expected[personal_reagent.laboratory.id] = expected.get(personal_reagent.laboratory.id, 0) + 1
+    assert expected == {facet["id"]: facet["count"] for facet in response.data["laboratory"]}
+
+    # The counts match the other query params
+    response = client.get(f"{url}?is_archived=true")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [{"value": personal_reagent4.room, "count": 1}] == response.data["room"]
+
+    # Cached
+    with django_assert_max_num_queries(1):
+        response = client.get(f"{url}?is_archived=true")
+
+    assert response.status_code == status.HTTP_200_OK
+
+    # Invalidated by changes of personal reagents
+    personal_reagent1.room = "999"
+    personal_reagent1.save()
+    response = client.get(url)
+
+    assert "999" in [facet["value"] for facet in response.data["room"]]
+
+    # Invalidated by changes of the names of the related objects
+    laboratory = personal_reagent1.laboratory
+    laboratory.laboratory = "nowa nazwa"
+    laboratory.save()
+    response = client.get(url)
+
+    assert "nowa nazwa" in [facet["repr"] for facet in response.data["laboratory"]]
+
+    # The values of the filters aren't queried
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(f"{reverse('personal_reagents-list')}?room=999&detailed_location=Lodówka D17")
+
+    assert response.status_code == status.HTTP_200_OK
+    distinct_values_sql = 'SELECT DISTINCT "reagents_personal_reagent"."room"'
+    assert not [query for query in context.captured_queries if query["sql"].startswith(distinct_values_sql)]
+
+    # Also values saved without the signals which invalidate the facets can be used
+    PersonalReagent.objects.filter(id=personal_reagent1.id).update(room="998")
+    response = client.get(f"{reverse('personal_reagents-list')}?room=998")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [personal_reagent1.id] == [personal_reagent["id"] for personal_reagent in response.data["results"]]
+
+    response = client.get(f"{reverse('personal_reagents-list')}?room=997")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [] == response.data["results"]
+
+    client = api_client_anon
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_filter_personal_reagents_by_ids(api_client_admin, personal_reagents):
+    client, _ = api_client_admin
+    personal_reagent1, _, personal_reagent3, _ = personal_reagents
+    laboratory_ids = {personal_reagent1.laboratory.id, personal_reagent3.laboratory.id}
+    url = reverse("personal_reagents-list")
+
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(f"{url}?{'&'.join(f'laboratory={id}' for id in laboratory_ids)}")
+
+    assert response.status_code == status.HTTP_200_OK
+    expected = [
+        personal_reagent.id for personal_reagent in personal_reagents
+        if personal_reagent.laboratory.id in laboratory_ids
+    ]
+    assert expected == [personal_reagent["id"] for personal_reagent in response.data["results"]]
+    # The submitted ids are validated with one query which fetches only the primary keys
+    laboratory_queries = [
+        query["sql"] for query in context.captured_queries
+        if query["sql"].startswith('SELECT "reagents_laboratory"."id" FROM "reagents_laboratory"')
+    ]
+    assert len(laboratory_queries) == 1
+    assert '"reagents_laboratory"."laboratory"' not in laboratory_queries[0]
+
+    response = client.get(f"{url}?producer={personal_reagent3.reagent.producer.id}")
+
+    assert response.status_code == status.HTTP_200_OK
+    expected = [
+        personal_reagent.id for personal_reagent in personal_reagents
+        if personal_reagent.reagent.producer == personal_reagent3.reagent.producer
+    ]
+    assert expected == [personal_reagent["id"] for personal_reagent in response.data["results"]]
+
+    response = client.get(f"{url}?laboratory={personal_reagent1.laboratory.id}&laboratory=0")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.get(f"{url}?laboratory=abc")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_filter_personal_reagents_by_clp_classification(api_client_admin, personal_reagents, clp_classifications):
+    client, _ = api_client_admin
+    clp_classification1, clp_classification2 = clp_classifications
+    url = (
+        f"{reverse('personal_reagents-list')}"
+        f"?clp_classification={clp_classification1.id}&clp_classification={clp_classification2.id}"
+    )
+
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    # Both hazard statements of the reagent match, but every personal reagent is returned once
+    expected = [
+        personal_reagent.id for personal_reagent in personal_reagents
+        if personal_reagent.reagent.hazard_statements.filter(
+            clp_classification__in=clp_classifications
+        ).exists()
+    ]
+    assert len(expected) > 0
+    assert expected == [personal_reagent["id"] for personal_reagent in response.data["results"]]
+    assert len(expected) == response.data["count"]
+    personal_reagents_queries = [
+        query["sql"] for query in context.captured_queries
+        if 'FROM "reagents_personal_reagent"' in query["sql"] and "WHERE" in query["sql"]
+    ]
+    assert len(personal_reagents_queries) == 2
+    assert all("EXISTS" in sql and "DISTINCT" not in sql for sql in personal_reagents_queries)
+
+    url = f"{reverse('personal_reagents-get-historical-records')}?clp_classification={clp_classification2.id}"
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert {personal_reagent.id for personal_reagent in personal_reagents if personal_reagent.id in expected} == {
+        personal_reagent["pk"] for personal_reagent in response.data["results"]
+    }
+
+
+@pytest.mark.django_db
+def test_bulk_create_personal_reagents(api_client_admin, api_client_lab_worker, api_client_lab_manager, reagents,
+                                       projects_procedures, laboratories, django_assert_max_num_queries):
+    client, admin = api_client_admin
+    _, lab_worker = api_client_lab_worker
+    _, lab_manager = api_client_lab_manager
+    reagent1, reagent2 = reagents
+    project_procedure1, _ = projects_procedures
+    laboratory1, laboratory2 = laboratories
+    url = reverse("personal_reagents-list")
+
+    post_data = [
+        {
+            "reagent": reagent1.id if idx % 2 else reagent2.id,
+            "project_procedure": project_procedure1.id,
+            "is_critical": False,
+            "main_owner": lab_worker.id,
+            "lot_no": str(idx),
+            "receipt_purchase_date": "2024-01-01",
+            "expiration_date": "2025-01-01",
+            "laboratory": laboratory1.id if idx % 2 else laboratory2.id,
+            "room": "315",
+            "detailed_location": "Lodówka A1",
+        } for idx in range(300)
+    ]
+    # The number of queries doesn't depend on the number of items
+    with django_assert_max_num_queries(15):
+        response = client.post(url, post_data, format="json")
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert [str(idx) for idx in range(300)] == [personal_reagent["lot_no"] for personal_reagent in response.data]
+    personal_reagents = PersonalReagent.objects.filter(id__in=[item["id"] for item in response.data])
+    assert 300 == personal_reagents.filter(main_owner=lab_worker, project_procedure=project_procedure1).count()
+    history = PersonalReagent.history.filter(id__in=[item["id"] for item in response.data])  # pylint: disable=no-member
+    assert 300 == history.filter(history_type="+", history_user=admin).count()
+
+    # Errors are reported per item
+    post_data[1]["main_owner"] = lab_manager.id
+    post_data[2]["reagent"] = 0
+    post_data[3]["laboratory"] = "abc"
+    response = client.post(url, post_data[:4], format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert ["1.project_procedure", "2.reagent", "3.laboratory"] == [
+        error["attr"] for error in response.data["errors"]
+    ]
+
+
+@pytest.mark.django_db
+def test_bulk_partial_update_personal_reagents(api_client_admin, api_client_lab_manager, api_client_lab_worker,
+                                               api_client_project_manager, personal_reagents, laboratories,
+                                               django_assert_max_num_queries):
+    _, admin = api_client_admin
+    _, lab_manager = api_client_lab_manager
+    _, project_manager = api_client_project_manager
+    personal_reagent1, personal_reagent2, personal_reagent3, personal_reagent4 = personal_reagents
+    _, laboratory2 = laboratories
+    url = reverse("personal_reagents-bulk-partial-update")
+
+    client, lab_worker = api_client_lab_worker
+    response = client.patch(
+        url, {"ids": [personal_reagent1.id, personal_reagent2.id], "changes": {"is_archived": True}}, format="json"
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert {"count": 2} == response.data
+    for personal_reagent in (personal_reagent1, personal_reagent2):
+        personal_reagent.refresh_from_db()
+        assert personal_reagent.is_archived
+        assert datetime.date.today() == personal_reagent.disposal_utilization_date
+        assert "~" == personal_reagent.history.first().history_type
+        assert lab_worker == personal_reagent.history.first().history_user
+
+    # The personal reagents of others can't be changed
+    response = client.patch(
+        url, {"ids": [personal_reagent1.id, personal_reagent3.id], "changes": {"room": "999"}}, format="json"
+    )
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    personal_reagent1.refresh_from_db()
+    assert "999" != personal_reagent1.room
+
+    response = client.patch(
+        url, {"ids": [personal_reagent1.id], "changes": {"main_owner": admin.id}}, format="json"
+    )
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    # Lab managers can give the personal reagents of others to someone else, but only to a worker of the project
+    client, _ = api_client_lab_manager
+    response = client.patch(
+        url, {"ids": [personal_reagent1.id, personal_reagent2.id], "changes": {"main_owner": admin.id}}, format="json"
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.patch(
+        url,
+        {"ids": [personal_reagent1.id, personal_reagent2.id], "changes": {"main_owner": project_manager.id}},
+        format="json",
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    personal_reagent2.refresh_from_db()
+    assert project_manager == personal_reagent2.main_owner
+
+    response = client.patch(url, {"ids": [personal_reagent4.id], "changes": {"main_owner": admin.id}}, format="json")
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    # A manager of the project without the project manager role can change its personal reagents like one by one,
+    # but not their owner
+    client, _ = api_client_lab_worker
+    project_procedure = personal_reagent4.project_procedure
+    project_procedure.manager = lab_worker
+    project_procedure.save()
+    # The owner has to be a worker of the project, as for the changes of single personal reagents
+    project_procedure.workers.add(personal_reagent4.main_owner)
+    response = client.patch(
+        url, {"ids": [personal_reagent1.id, personal_reagent4.id], "changes": {"room": "316"}}, format="json"
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    personal_reagent4.refresh_from_db()
+    assert "316" == personal_reagent4.room
+
+    response = client.patch(
+        url, {"ids": [personal_reagent4.id], "changes": {"main_owner": lab_worker.id}}, format="json"
+    )
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    # The same rules as for the changes of single personal reagents: a reagent of a PB procedure
+    # can't be moved without a detailed location
+    PersonalReagent.objects.filter(id=personal_reagent4.id).update(detailed_location="")
+    client, _ = api_client_admin
+    response = client.patch(url, {"ids": [personal_reagent4.id], "changes": {"room": "317"}}, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "detailed_location" in response.data["errors"][0]["attr"]
+    personal_reagent4.refresh_from_db()
+    assert "316" == personal_reagent4.room
+
+    response = client.patch(
+        url, {"ids": [personal_reagent4.id], "changes": {"room": "317", "detailed_location": "Lodówka D18"}},
+        format="json",
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+
+    # Relocation of everything with a constant number of queries
+    ids = [personal_reagent.id for personal_reagent in personal_reagents]
+    with django_assert_max_num_queries(20):
+        response = client.patch(
+            url, {"ids": ids, "changes": {"laboratory": laboratory2.id, "room": "999"}}, format="json"
+        )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert {"count": 4} == response.data
+    assert 4 == PersonalReagent.objects.filter(id__in=ids, laboratory=laboratory2, room="999").count()
+
+    response = client.patch(url, {"ids": [*ids, 0], "changes": {"room": "998"}}, format="json")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert not PersonalReagent.objects.filter(room="998").exists()
+
+    response = client.patch(url, {"ids": ids, "changes": {}}, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.patch(url, {"ids": ids, "changes": {"detailed_location": ""}}, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
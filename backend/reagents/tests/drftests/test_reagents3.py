@@ -0,0 +1,337 @@
+"""This file tests Producer, ReagentType, Concentration, Unit, PurityQuality, StorageCondition and Reagent."""
+
+import json
+
+import pytest
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+
+from reagents.models import Producer, Reagent
+
+
+def get_expected_historical_m2m_field(historical_record, field_name, related_name, repr_field_name):
+    return [
+        {
+            "id": record[f"{related_name}__id"],
+            "repr": record[f"{related_name}__{repr_field_name}"],
+        } for record in getattr(historical_record, field_name).filter(
+            history_id=historical_record.history_id
+        ).order_by(
+            f"{related_name}__id"
+        ).values(
+            f"{related_name}__id", f"{related_name}__{repr_field_name}"
+        )
+    ]
+
+
+@pytest.mark.django_db
+def test_get_reagents_historical_records_m2m_fields(api_client_admin, reagents, storage_conditions,
+                                                    django_assert_max_num_queries):
+    client, _ = api_client_admin
+    reagent1, reagent2 = reagents
+    _, storage_condition2 = storage_conditions
+
+    reagent1.storage_conditions.add(storage_condition2.id)
+    reagent2.hazard_statements.clear()
+
+    history = Reagent.history.order_by("-history_id")
+    expected = [
+        {
+            "id": historical_record.history_id,
+            "storage_conditions": get_expected_historical_m2m_field(
+                historical_record, "storage_conditions", "storagecondition", "storage_condition"
+            ),
+            "hazard_statements": get_expected_historical_m2m_field(
+                historical_record, "hazard_statements", "hazardstatement", "code"
+            ),
+            "precautionary_statements": get_expected_historical_m2m_field(
+                historical_record, "precautionary_statements", "precautionarystatement", "code"
+            ),
+        } for historical_record in history
+    ]
+    assert len(expected) > 2
+
+    # The number of queries doesn't depend on the number of historical records:
+    # versions, count, page and one query per m2m relation (the user comes from the token).
+    with django_assert_max_num_queries(6):
+        response = client.get(f"{reverse('reagent-get-historical-records')}?limit=100")
+
+    assert response.status_code == status.HTTP_200_OK
+
+    actual = [
+        {
+            "id": historical_record["id"],
+            "storage_conditions": historical_record["storage_conditions"],
+            "hazard_statements": historical_record["hazard_statements"],
+            "precautionary_statements": historical_record["precautionary_statements"],
+        } for historical_record in response.data["results"]
+    ]
+
+    assert expected == actual
+
+
+@pytest.mark.django_db
+def test_reagents_hazard_summary(api_client_admin, reagents, clp_classifications, hazard_statements,
+                                 precautionary_statements):
+    client, _ = api_client_admin
+    reagent1, reagent2 = reagents
+    clp_classification1, clp_classification2 = clp_classifications
+    hazard_statement1, hazard_statement2 = hazard_statements
+    precautionary_statement1, _ = precautionary_statements
+
+    reagent1.refresh_from_db()
+    assert [
+        {"id": clp_classification1.id, "repr": "GHS02"},
+        {"id": clp_classification2.id, "repr": "GHS07"},
+    ] == reagent1.clp_classifications
+    assert "DGR" == reagent1.signal_word
+    assert ["H200", "H302"] == reagent1.hazard_statement_codes
+    assert ["P201", "P250"] == reagent1.precautionary_statement_codes
+
+    # Changes of the statements and the CLP classifications are reflected in the summary
+    clp_classification2.clp_classification = "GHS01"
+    clp_classification2.save()
+    hazard_statement2.code = "H301"
+    hazard_statement2.save()
+    reagent1.hazard_statements.remove(hazard_statement1.id)
+    precautionary_statement1.delete()
+
+    # An instance loaded before the changes doesn't overwrite the summary with the stale one
+    reagent1.other_info = "inne"
+    reagent1.save()
+
+    reagent1.refresh_from_db()
+    assert [{"id": clp_classification2.id, "repr": "GHS01"}] == reagent1.clp_classifications
+    assert "WRN" == reagent1.signal_word
+    assert ["H301"] == reagent1.hazard_statement_codes
+    assert ["P250"] == reagent1.precautionary_statement_codes
+    assert "inne" == reagent1.other_info
+
+    hazard_statement2.reagent_set.clear()
+
+    reagent2.refresh_from_db()
+    assert [] == reagent2.clp_classifications
+    assert "" == reagent2.signal_word
+    assert [] == reagent2.hazard_statement_codes
+
+    # Also when the statements are set through the API
+    response = client.patch(
+        reverse("reagent-detail", kwargs={"pk": reagent2.id}),
+        {"hazard_statements": [hazard_statement1.id, hazard_statement2.id]},
+        format="json",
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert "clp_classifications" not in response.data
+    reagent2.refresh_from_db()
+    # Ordered by the CLP classification (GHS01, GHS02) first
+    assert ["H301", "H200"] == reagent2.hazard_statement_codes
+    assert "DGR" == reagent2.signal_word
+
+
+@pytest.mark.django_db
+def test_import_reagent_catalogue(api_client_admin, api_client_lab_manager, reagents, hazard_statements,
+                                  precautionary_statements):
+    client, admin = api_client_admin
+    hazard_statement1, hazard_statement2 = hazard_statements
+    precautionary_statement1, _ = precautionary_statements
+    url = reverse("reagent-import-catalogue")
+    header = ("type,producer,producer_name,brand_name,name,catalog_no,concentration,volume,unit,purity_quality,"
+              "storage_conditions,hazard_statements,precautionary_statements,safety_data_sheet,safety_instruction,"
+              "cas_no,other_info,kit_contents,is_usage_record_required")
+    content = "\n".join([
+        header,
+        "nowy typ,POCH,,,etanol,E-1,96%,500,mL,,RT|nowe warunki,H302|H200,P201,SDS0001,,64-17-5,,,true",
+        "zestaw odczynników,NEWP,New Producer,NP,zestaw,Z-1,,10,g,,RT,,,SDS0002,,,,,false",
+        # Errors: a reagent which already exists, missing objects, an invalid volume and a repeated line
+        "zestaw odczynników,POCH,,,alkohol,BA6480111,,1,mL,,RT,,,SDS0001,,,,,false",
+        "zestaw odczynników,THERMO,,,nieznany,N-1,,1,mL,,RT,H999,,SDS9999,,,,,false",
+        "zestaw odczynników,THERMO,,,zły,N-2,,abc,mL,,RT,,,SDS0001,,,,,false",
+        "zestaw odczynników,NEWP,,,zestaw,Z-1,,10,g,,RT,,,SDS0002,,,,,false",
+    ])
+
+    response = client.post(
+        url,
+        {"file": SimpleUploadedFile("catalogue.csv", content.encode("utf-8-sig"))},
+        format="multipart",
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["created"] == 2
+    assert [3, 4, 5, 6] == [error["row"] for error in response.data["errors"]]
+    assert ["catalog_no"] == list(response.data["errors"][0]["errors"])
+    assert {
+        "hazard_statements": ["Nie znaleziono: H999."],
+        "safety_data_sheet": ["Nie znaleziono: SDS9999."],
+    } == response.data["errors"][1]["errors"]
+    assert ["volume"] == list(response.data["errors"][2]["errors"])
+    assert ["catalog_no"] == list(response.data["errors"][3]["errors"])
+
+    reagent = Reagent.objects.get(catalog_no="E-1")
+    assert reagent.producer.abbreviation == "POCH"
+    assert reagent.type.type == "nowy typ"
+    assert reagent.type.is_validated_by_admin
+    assert reagent.concentration.concentration == "96%"
+    assert reagent.purity_quality is None
+    assert reagent.safety_instruction is None
+    assert reagent.cas_no == "64-17-5"
+    assert reagent.is_usage_record_required
+    assert ["RT", "nowe warunki"] == sorted(reagent.storage_conditions.values_list("storage_condition", flat=True))
+    assert {hazard_statement1.id, hazard_statement2.id} == set(reagent.hazard_statements.values_list("id", flat=True))
+    assert [precautionary_statement1] == list(reagent.precautionary_statements.all())
+    assert "DGR" == reagent.signal_word
+    assert ["H200", "H302"] == reagent.hazard_statement_codes
+
+    reagent = Reagent.objects.get(catalog_no="Z-1")
+    assert (reagent.producer.producer_name, reagent.producer.brand_name) == ("New Producer", "NP")
+    assert reagent.unit.unit == "g"
+
+    # The historical records include the m2m relations
+    historical_reagent = reagent.history.get()
+    assert historical_reagent.history_user == admin
+    assert ["RT"] == [
+        record.storagecondition.storage_condition for record in historical_reagent.storage_conditions.all()
+    ]
+
+    # JSON Lines files are supported as well, the number of queries doesn't depend on the number of lines
+    rows = [
+        {
+            "type": "nowy typ", "producer": "THERMO", "name": f"odczynnik {idx}", "catalog_no": f"J-{idx}",
+            "volume": idx, "unit": "mL", "storage_conditions": ["RT"], "hazard_statements": ["H200"],
+            "safety_data_sheet": "SDS0001", "is_usage_record_required": False,
+        } for idx in range(100)
+    ]
+    with CaptureQueriesContext(connection) as context:
+        response = client.post(
+            url,
+            {"file": SimpleUploadedFile("catalogue.jsonl", "\n".join(json.dumps(row) for row in rows).encode())},
+            format="multipart",
+        )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert {"created": 100, "errors": []} == response.data
+    assert len(context.captured_queries) < 30
+    assert 100 == Reagent.objects.filter(catalog_no__startswith="J-", hazard_statement_codes=["H200"]).count()
+
+    response = client.post(
+        url,
+        {"file": SimpleUploadedFile("catalogue.jsonl", b"[]")},
+        format="multipart",
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.post(
+        url,
+        {"file": SimpleUploadedFile("catalogue.txt", b"")},
+        format="multipart",
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    # Only admins can import the catalogue
+    client, _ = api_client_lab_manager
+    response = client.post(
+        url,
+        {"file": SimpleUploadedFile("catalogue.csv", content.encode())},
+        format="multipart",
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+def test_get_reference_data(api_client_admin, api_client_lab_worker, api_client_anon, reagents, laboratories,
+                            django_assert_max_num_queries, django_capture_on_commit_callbacks):
+    client, _ = api_client_lab_worker
+    url = reverse("reference_data")
+
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [
+        "reagent_types", "producers", "concentrations", "units", "purities_qualities", "storage_conditions",
+        "laboratories", "clp_classifications", "hazard_statements", "precautionary_statements",
+    ] == list(response.data)
+    assert [
+        {"id": producer.id, "repr": producer.abbreviation} for producer in Producer.objects.order_by("id")
+    ] == response.data["producers"]
+    assert [
+        {"id": laboratory.id, "repr": laboratory.laboratory} for laboratory in laboratories
+    ] == response.data["laboratories"]
+    etag = response["ETag"]
+    assert "no-cache" in response["Cache-Control"]
+
+    # Only the versions are queried, the user comes from the token
+    with django_assert_max_num_queries(1):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response["ETag"] == etag
+
+    # Any change of a dictionary changes the version (after the commit)
+    admin_client, _ = api_client_admin
+    with django_capture_on_commit_callbacks(execute=True):
+        response = admin_client.post(reverse("unit-list"), {"unit": "g"}, format="json")
+
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["ETag"] != etag
+    assert {"id": response.data["units"][-1]["id"], "repr": "g"} == response.data["units"][-1]
+
+    client = api_client_anon
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_get_versions(api_client_admin, api_client_lab_worker, api_client_anon, reagents, hazard_statements,
+                      django_assert_max_num_queries, django_capture_on_commit_callbacks):
+    client, _ = api_client_lab_worker
+    url = reverse("versions")
+
+    # A single query, the user comes from the token
+    with django_assert_max_num_queries(1):
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert {"reagent", "personalreagent", "unit", "hazardstatement", "user"} <= set(response.data)
+    assert "reportjob" not in response.data
+    versions = response.data
+
+    # Only the version of the changed model is bumped (after the commit)
+    admin_client, _ = api_client_admin
+    with django_capture_on_commit_callbacks(execute=True):
+        response = admin_client.post(reverse("unit-list"), {"unit": "g"}, format="json")
+
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = client.get(url)
+
+    assert response.data["unit"] > versions["unit"]
+    assert {
+        model_name: version for model_name, version in response.data.items() if model_name != "unit"
+    } == {model_name: version for model_name, version in versions.items() if model_name != "unit"}
+    versions = response.data
+
+    # Also by the changes which don't create the historical records one by one
+    hazard_statement, _ = hazard_statements
+    hazard_statement.code = "H301"
+    with django_capture_on_commit_callbacks(execute=True):
+        hazard_statement.save()
+
+    response = client.get(url)
+
+    assert response.data["hazardstatement"] > versions["hazardstatement"]
+    assert response.data["reagent"] > versions["reagent"]
+
+    client = api_client_anon
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
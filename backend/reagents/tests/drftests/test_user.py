@@ -1,11 +1,19 @@
 import json
+from datetime import timedelta
 
 import pytest
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
 from rest_framework import status
 
+from rest_framework_simplejwt.tokens import AccessToken
+
+from reagents import authentication, cache
+from reagents.authentication import RefreshToken
 from reagents.models import User
 
 from reagents.tests.drftests.conftest import assert_timezone_now_gte_datetime, mock_datetime_date_today, model_to_dict
@@ -2828,3 +2836,179 @@ def test_destroy_user(api_client_admin, api_client_lab_manager, api_client_proje
     response = client.delete(url)
 
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_jwt_claims_authentication(api_client_anon, django_assert_max_num_queries):
+    user = User.objects.create_user(
+        username="MK", email="mk@mk.pl", password="QWE7RTY8", lab_roles=[User.LAB_WORKER]
+    )
+    client = api_client_anon
+    response = client.post(reverse("token_obtain_pair"), {"username": "MK", "password": "QWE7RTY8"})
+
+    assert response.status_code == status.HTTP_200_OK
+    access_token = AccessToken(response.data["access"])
+    assert not access_token["is_staff"]
+    assert [User.LAB_WORKER] == access_token["lab_roles"]
+    # Logins don't revoke the claims
+    user.refresh_from_db()
+    assert user.last_login is not None
+
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+    url = reverse("versions")
+
+    # The user is built from the claims of the token, only the versions are queried
+    with django_assert_max_num_queries(1):
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+
+    # The other fields are loaded when they are needed
+    response = client.get(reverse("user-get-current-user-info"))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert "mk@mk.pl" == response.data["email"]
+
+    # A change of the user revokes the claims, so the user is loaded from the database
+    user.lab_roles = []
+    user.save()
+
+    with django_assert_max_num_queries(2):
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    # Also the claims of the tokens refreshed later
+    refresh_token = RefreshToken.for_user(user)
+    user.lab_roles = [User.LAB_MANAGER]
+    user.save()
+    response = client.post(reverse("token_refresh"), {"refresh": str(refresh_token)})
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    with django_assert_max_num_queries(2):
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+
+    user.delete()
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def get_user_queries(context):
+    return [query for query in context.captured_queries if 'FROM "reagents_user"' in query["sql"]]
+
+
+@pytest.mark.django_db
+def test_jwt_claims_revocation_across_processes(api_client_anon, settings):
+    user = User.objects.create_user(
+        username="MK", email="mk@mk.pl", password="QWE7RTY8", lab_roles=[User.LAB_WORKER]
+    )
+    client = api_client_anon
+    response = client.post(reverse("token_obtain_pair"), {"username": "MK", "password": "QWE7RTY8"})
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+    url = reverse("versions")
+
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert not get_user_queries(context)
+
+    # Bulk updates (which don't send the signals) revoke the claims too
+    User.objects.filter(id=user.id).update(lab_roles=[])
+
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    # The revocation is kept in the database, so it isn't lost when it's evicted from the shared cache
+    cache.get_shared_cache().clear()
+    for _ in range(2):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert get_user_queries(context)
+
+    # Every process has its own LocMem cache, so another process wouldn't see a revocation cached by this one.
+    # The claims are never trusted then.
+    user.lab_roles = [User.LAB_WORKER]
+    user.save()
+    settings.CACHES = {
+        **settings.CACHES,
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "process"},
+    }
+    response = client.post(reverse("token_obtain_pair"), {"username": "MK", "password": "QWE7RTY8"})
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+    for _ in range(2):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert get_user_queries(context)
+
+    user.lab_roles = []
+    user.save()
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+def test_jwt_claims_revocation_before_commit(api_client_anon, django_capture_on_commit_callbacks, monkeypatch):
+    user = User.objects.create_user(
+        username="MK", email="mk@mk.pl", password="QWE7RTY8", lab_roles=[User.LAB_WORKER]
+    )
+    client = api_client_anon
+    url = reverse("versions")
+    changed_at = timezone.now()
+    monkeypatch.setattr(authentication, "aware_utcnow", lambda: changed_at)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        old_user = User.objects.get(id=user.id)
+        user.lab_roles = []
+        user.save()
+        # Another process issues a token with the old claims a few seconds later, before the change is committed
+        refresh_token = RefreshToken.for_user(old_user)
+        refresh_token.set_iat(claim=authentication.CLAIMS_ISSUED_AT_CLAIM, at_time=changed_at + timedelta(seconds=3))
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh_token.access_token}")
+        response = client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+
+        monkeypatch.setattr(authentication, "aware_utcnow", lambda: changed_at + timedelta(seconds=5))
+
+    # Its claims are revoked again after the commit
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    user.refresh_from_db()
+    assert changed_at + timedelta(seconds=5) == user.claims_revoked_at
+
+
+@pytest.mark.django_db
+def test_conditional_get_after_login(api_client_admin, api_client_anon, personal_reagents,
+                                     django_capture_on_commit_callbacks):
+    client, admin = api_client_admin
+    User.objects.create_user(username="MK", email="mk@mk.pl", password="QWE7RTY8", lab_roles=[User.LAB_WORKER])
+    urls = [reverse("personal_reagents-list"), reverse("user-list"), reverse("user-get-historical-records")]
+    etags = [client.get(url)["ETag"] for url in urls]
+
+    # A login changes only the users, which include `last_login`
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client_anon.post(reverse("token_obtain_pair"), {"username": "MK", "password": "QWE7RTY8"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [status.HTTP_304_NOT_MODIFIED, status.HTTP_200_OK, status.HTTP_200_OK] == [
+        client.get(url, HTTP_IF_NONE_MATCH=etag).status_code for url, etag in zip(urls, etags)
+    ]
+
+    # Other changes of the users change the personal reagents which refer to them
+    with django_capture_on_commit_callbacks(execute=True):
+        User.objects.get(id=admin.id).save()
+
+    response = client.get(urls[0], HTTP_IF_NONE_MATCH=etags[0])
+
+    assert response.status_code == status.HTTP_200_OK
@@ -0,0 +1,93 @@
+"""Change versions of the models which keep historical records.
+
+Every historical record bumps the version of its model (see `reagents.signals`), so "has the table changed since
+version V" can be answered with a single small query instead of querying the tables. Operations which don't send
+the signals (`bulk_create_with_history()`, `bulk_update_with_history()`, `QuerySet.bulk_update()`) have to call
+`bump_versions()`. They are kept in the database (see `models.ModelVersion`), so all processes see the same versions
+whatever cache is configured.
+"""
+
+import time
+
+from functools import partial
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F
+
+
+def is_versioned_model(model):
+    # The historical models of many-to-many fields have a `history` field, so `hasattr(model, "history")` isn't enough
+    return hasattr(model._meta, "simple_history_manager_attribute")  # pylint: disable=protected-access
+
+
+def get_versioned_models():
+    return [model for model in apps.get_app_config("reagents").get_models() if is_versioned_model(model)]
+
+
+def get_related_versioned_models(model):
+    """Return the model and the models it refers to, also indirectly, which keep historical records."""
+    related_models = []
+    pending = [model]
+    while pending:
+        current = pending.pop()
+        if current in related_models or not is_versioned_model(current):
+            continue
+        related_models.append(current)
+        # Forward relations (foreign keys and many-to-many fields), the reverse ones are auto created
+        pending.extend(
+            field.related_model for field in current._meta.get_fields()  # pylint: disable=protected-access
+            if field.is_relation and not field.auto_created and field.related_model is not None
+        )
+    return related_models
+
+
+def get_version_label(model):
+    return model._meta.label_lower  # pylint: disable=protected-access
+
+
+def get_initial_version():
+    # Versions which start from the current time don't repeat the ones from before the table was cleared
+    return time.time_ns() // 1000
+
+
+def create_versions(models):
+    """Create the versions of the models which don't have them yet."""
+    model_version_model = apps.get_model("reagents", "ModelVersion")
+    model_version_model.objects.bulk_create(
+        [model_version_model(model_label=get_version_label(model), version=get_initial_version()) for model in models],
+        ignore_conflicts=True,
+    )
+
+
+def get_versions(models):
+    """Return the versions of the models (in the same order) with a single query.
+    The versions have to be read before the data they describe (see `bump_versions()`)."""
+    model_version_model = apps.get_model("reagents", "ModelVersion")
+    labels = [get_version_label(model) for model in models]
+    versions = dict(model_version_model.objects.filter(model_label__in=labels).values_list("model_label", "version"))
+    if len(versions) < len(set(labels)):
+        # Normally created after the migrations (see `reagents.signals`)
+        create_versions([model for model, label in zip(models, labels) if label not in versions])
+        versions = dict(
+            model_version_model.objects.filter(model_label__in=labels).values_list("model_label", "version")
+        )
+    return [versions[label] for label in labels]
+
+
+def get_version(model):
+    return get_versions([model])[0]
+
+
+def increment_versions(models):
+    # A version which hasn't been read yet doesn't have to be incremented, it's created when it's read
+    apps.get_model("reagents", "ModelVersion").objects.filter(
+        model_label__in=[get_version_label(model) for model in models]
+    ).update(version=F("version") + 1)
+
+
+def bump_versions(*models):
+    """Bump the versions after the current transaction is committed (at once outside of a transaction),
+    so that the rows of the versions aren't locked until the commit. A value read before the commit together
+    with the version from before it is still valid for that version, the next readers get the new one."""
+    transaction.on_commit(partial(increment_versions, models))
@@ -1,12 +1,21 @@
+import csv
 import datetime
-import io
+import json
 import os
+import tempfile
 
-from functools import wraps
+from functools import partial, wraps
+from itertools import islice
+from urllib.parse import urlencode
 
 from django.core.files.storage import default_storage
-from django.db.models import Count, F, Prefetch
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import CharField, Count, F, Max, Prefetch, Q, QuerySet, Value
+from django.db.models.functions import Concat
+from django.http import FileResponse, HttpRequest, QueryDict, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import salted_hmac
+from django.utils.http import content_disposition_header, quote_etag
 from django.utils.text import get_valid_filename
 
 from django_filters.rest_framework import DjangoFilterBackend
@@ -16,11 +25,18 @@ from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.parsers import MultiPartParser
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from reagents import exceptions, filters, generators, models, permissions, serializers
+from simple_history.utils import bulk_update_with_history
+
+from reagents import (
+    cache, exceptions, filters, generators, importers, models, pagination, permissions, serializers, versions,
+)
 
 
 def paginate(action_method):
@@ -34,8 +50,9 @@ def paginate(action_method):
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.get_unpaginated_response(queryset)
+    # Lists of objects support conditional GET (see `ConditionalGetMixin`)
+    inner.paginated = True
     return inner
 
 
@@ -49,9 +66,54 @@ def action_paginate(**kwargs):
     return merged_decorator
 
 
-class ModelViewSetWithHistoricalRecordsAndOptionalPagination(ModelViewSet):
-    model = None
-    filterset_fields = []
+def invalidate_statistics_and_facets():
+    """For the changes made with `bulk_create()` or `bulk_update()`,
+    which don't send the `post_save` signals that invalidate them (see `reagents.signals`)."""
+    generators.invalidate_statistics()
+    filters.invalidate_facets()
+
+
+class EnumeratedRows:
+    """Wraps a `.values()` QuerySet and adds the `id` field with the position of a row (starting from 1)
+    to every row, also when the QuerySet is sliced by a paginator."""
+
+    def __init__(self, queryset, chunk_size):
+        self.queryset = queryset
+        self.chunk_size = chunk_size
+
+    def count(self):
+        return self.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("Only slices are supported.")
+        start = key.start or 0
+        return [{"id": idx, **row} for idx, row in enumerate(self.queryset[key], start + 1)]
+
+    def __iter__(self):
+        for idx, row in enumerate(self.queryset.iterator(chunk_size=self.chunk_size), 1):
+            yield {"id": idx, **row}
+
+
+class OptionalPaginationMixin:
+    """Pagination can be disabled with the `no_pagination` query param
+    or switched to the keyset mode with the `cursor` query param."""
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            if self.pagination_class is None:
+                self._paginator = None
+            elif pagination.KeysetPagination.cursor_query_param in self.request.query_params:
+                self._paginator = pagination.KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    streaming_chunk_size = 500
 
     def paginate_queryset(self, queryset):
         """Return a single page of results, or `None` if pagination is disabled (also by a query param)."""
@@ -59,6 +121,125 @@ class ModelViewSetWithHistoricalRecordsAndOptionalPagination(ModelViewSet):
             return None
         return self.paginator.paginate_queryset(queryset, self.request, view=self)
 
+    def get_unpaginated_response(self, queryset):
+        """Return all results. When pagination is disabled by the query param, the results are streamed
+        as a JSON array and serialized in chunks, so memory usage doesn't grow with the number of rows.
+        """
+        if "no_pagination" not in self.request.query_params:
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
+
+        if isinstance(queryset, QuerySet):
+            # Since Django 4.1 `prefetch_related()` lookups are performed for every chunk
+            rows = queryset.iterator(chunk_size=self.streaming_chunk_size)
+        else:
+            rows = iter(queryset)
+
+        def stream_content():
+            yield "["
+            separator = ""
+            while chunk := list(islice(rows, self.streaming_chunk_size)):
+                serializer = self.get_serializer(chunk, many=True)
+                yield separator + ",".join(
+                    json.dumps(
+                        item,
+                        cls=encoders.JSONEncoder,
+                        ensure_ascii=not api_settings.UNICODE_JSON,
+                        allow_nan=not api_settings.STRICT_JSON,
+                        separators=(",", ":"),
+                    ) for item in serializer.data
+                )
+                separator = ","
+            yield "]"
+
+        return StreamingHttpResponse(stream_content(), content_type="application/json")
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        return self.get_unpaginated_response(queryset)
+
+
+class NotModified(Exception):
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """ETags for `list`, `retrieve` and the paginated actions. A request with a matching `If-None-Match` is answered
+    with `304 Not Modified` before anything is fetched or serialized.
+
+    The ETag is computed from the change versions (see `reagents.versions`) of the model of the queryset
+    and of the models it refers to, which are read with a single query. The path, the roles of the user and the date
+    (for notifications relative to today) are a part of it too.
+    """
+    etag_models = None
+
+    def is_conditional_get(self, request):
+        if request.method not in ("GET", "HEAD") or self.action is None:
+            return False
+        return self.action in ("list", "retrieve") or getattr(getattr(self, self.action, None), "paginated", False)
+
+    def get_etag_models(self):
+        if self.etag_models is not None:
+            return self.etag_models
+        model = self.get_queryset().model
+        # Historical models refer to the tracked model with `instance_type`
+        return versions.get_related_versioned_models(getattr(model, "instance_type", model))
+
+    def get_etag(self, request):
+        if not (etag_models := self.get_etag_models()):
+            return None
+
+        user = request.user
+        value = json.dumps([
+            self.get_versions(etag_models),
+            request.get_full_path(),
+            request.accepted_media_type,
+            user.pk,
+            user.is_staff,
+            sorted(getattr(user, "lab_roles", [])),
+            datetime.date.today().isoformat(),
+        ])
+        # Signed, so a client can't learn anything by sending made up ETags
+        return quote_etag(salted_hmac("reagents.views.ConditionalGetMixin", value).hexdigest())
+
+    def get_versions(self, etag_models):
+        return versions.get_versions(etag_models)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if self.is_conditional_get(request):
+            self.etag = self.get_etag(request)
+            if self.etag is not None and (response := get_conditional_response(request, etag=self.etag)) is not None:
+                raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, "etag", None) is not None and response.status_code in (200, 304):
+            response["ETag"] = self.etag
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class ModelViewSetWithHistoricalRecordsAndOptionalPagination(
+    ConditionalGetMixin, OptionalPaginationMixin, ModelViewSet
+):
+    model = None
+    filterset_fields = []
+
     def get_queryset(self):
         if self.action == "get_historical_records":
             return self.model.history.all()
@@ -81,12 +262,8 @@ class ModelViewSetWithHistoricalRecordsAndOptionalPagination(ModelViewSet):
         return history
 
 
-class ReadOnlyModelViewSetWithOptionalPagination(ReadOnlyModelViewSet):
-    def paginate_queryset(self, queryset):
-        """Return a single page of results, or `None` if pagination is disabled (also by a query param)."""
-        if self.paginator is None or "no_pagination" in self.request.query_params:
-            return None
-        return self.paginator.paginate_queryset(queryset, self.request, view=self)
+class ReadOnlyModelViewSetWithOptionalPagination(ConditionalGetMixin, OptionalPaginationMixin, ReadOnlyModelViewSet):
+    pass
 
 
 class UserViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPagination):
@@ -109,6 +286,11 @@ class UserViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPagination):
 
         return super().get_serializer_class()
 
+    def get_versions(self, etag_models):
+        # Logins don't bump the version of the users (see `reagents.signals`), but `last_login` is served with them
+        last_login = self.model.objects.aggregate(Max("last_login"))["last_login__max"]
+        return [*super().get_versions(etag_models), last_login and last_login.isoformat()]
+
     @action(
         detail=False,
         url_path="me",
@@ -387,7 +569,7 @@ class ReagentViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPagination):
     ).order_by("id")
     serializer_class = serializers.ReagentReadSerializer
     permission_classes = [permissions.ReagentPermission]
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, filters.TrigramSearchFilter]
     filterset_class = filters.ReagentFilter
     search_fields = [
         "name",
@@ -428,6 +610,9 @@ class ReagentViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPagination):
         if self.action in ("update", "partial_update"):
             return serializers.ReagentModifySerializer
 
+        if self.action == "import_catalogue":
+            return serializers.ReagentCatalogueImportSerializer
+
         return super().get_serializer_class()
 
     @action_paginate(
@@ -439,6 +624,33 @@ class ReagentViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPagination):
         history = self.filter_queryset(self.get_queryset().order_by("-history_id"))
         return history
 
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        parser_classes=[MultiPartParser],
+    )
+    def import_catalogue(self, request):
+        """Import the reagents from a CSV or JSON Lines file. The lines with errors are skipped and reported."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        file = serializer.validated_data["file"]
+        if file.name.lower().endswith(".csv"):
+            rows = importers.read_csv_rows(file)
+        else:
+            rows = importers.read_json_lines_rows(file)
+
+        try:
+            with transaction.atomic():
+                result = importers.ReagentCatalogueImporter(request.user).run(rows)
+        except (ValueError, csv.Error) as exception:
+            # `UnicodeDecodeError` and `JSONDecodeError` are subclasses of `ValueError`
+            raise exceptions.RequestDataError("Nieprawidłowy format pliku.") from exception
+
+        invalidate_statistics_and_facets()
+
+        return Response(result)
+
 
 class ProjectProcedureViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPagination):
     model = models.ProjectProcedure
@@ -512,13 +724,15 @@ class PersonalReagentViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPaginat
     queryset = model.objects.order_by("id")
     serializer_class = serializers.PersonalReagentReadSerializer
     permission_classes = [permissions.PersonalReagentPermission]
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, filters.TrigramSearchFilter]
     filterset_class = filters.PersonalReagentFilter
     search_fields = [
         "reagent__name",
         "reagent__producer__abbreviation",
         "main_owner__username",
     ]
+    bulk_create_max_size = 5000
+    bulk_update_max_size = 5000
 
     def get_queryset(self):
         queryset = super().get_queryset().select_related(
@@ -527,101 +741,53 @@ class PersonalReagentViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPaginat
         )
 
         if self.action in ("list", "retrieve", "generate_all_personal_reagents_report"):
-            queryset = queryset.select_related(
+            return queryset.select_related(
                 "reagent__type",
                 "project_procedure",
-            ).prefetch_related(
-                Prefetch(
-                    "reagent__hazard_statements",
-                    queryset=models.HazardStatement.objects.select_related(
-                        "clp_classification",
-                    ).order_by(
-                        "clp_classification__clp_classification",
-                    ),
-                ),
             )
 
-            return queryset
-
         if self.action == "get_historical_records":
             return self.model.history.select_related(  # pylint: disable=no-member
                 "reagent__producer",
                 "main_owner",
                 "reagent__type",
                 "project_procedure",
-            ).prefetch_related(
-                Prefetch(
-                    "reagent__hazard_statements",
-                    queryset=models.HazardStatement.objects.select_related(
-                        "clp_classification",
-                    ).order_by(
-                        "clp_classification__clp_classification",
-                    ),
-                ),
             )
 
-        if self.action in ("get_personal_view", "generate_personal_view_report"):
+        if self.action == "get_personal_view":
             return queryset.select_related(
                 "reagent__type",
                 "project_procedure",
             ).prefetch_related(
                 Prefetch(
                     "reagent__hazard_statements",
-                    queryset=models.HazardStatement.objects.select_related(
-                        "clp_classification",
-                    ).order_by(
+                    queryset=models.HazardStatement.objects.only("id", "code").order_by(
                         "clp_classification__clp_classification",
                         "code",
                     ),
                 ),
                 Prefetch(
                     "reagent__precautionary_statements",
-                    queryset=models.PrecautionaryStatement.objects.order_by("code"),
+                    queryset=models.PrecautionaryStatement.objects.only("id", "code").order_by("code"),
                 ),
             )
 
+        if self.action == "generate_personal_view_report":
+            return queryset.select_related(
+                "reagent__type",
+                "project_procedure",
+            )
+
         if self.action == "generate_usage_record":
             return queryset.select_related("reagent__unit")
 
-        if self.action == "generate_sanepid_pip_report":
-            return queryset.prefetch_related(
-                Prefetch(
-                    "reagent__hazard_statements",
-                    queryset=models.HazardStatement.objects.select_related(
-                        "clp_classification"
-                    ).order_by(
-                        "clp_classification__clp_classification"
-                    ),
-                ),
-            )
-
         if self.action == "generate_lab_manager_report":
-            return queryset.select_related(
-                "reagent__type",
-            ).prefetch_related(
-                Prefetch(
-                    "reagent__hazard_statements",
-                    queryset=models.HazardStatement.objects.select_related(
-                        "clp_classification"
-                    ).order_by(
-                        "clp_classification__clp_classification"
-                    ),
-                ),
-            )
+            return queryset.select_related("reagent__type")
 
         if self.action == "generate_projects_procedures_report":
             return queryset.select_related(
                 "reagent__type",
                 "project_procedure",
-            ).prefetch_related(
-                Prefetch(
-                    "reagent__hazard_statements",
-                    queryset=models.HazardStatement.objects.select_related(
-                        "clp_classification"
-                    ).order_by(
-                        "clp_classification__clp_classification"
-                    ),
-                ),
             )
 
         return queryset
@@ -658,8 +824,10 @@ class PersonalReagentViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPaginat
 
     def create(self, request, *args, **kwargs):
         many = isinstance(request.data, list)
-        if many and len(request.data) > 50:
-            raise exceptions.RequestDataError("Maksymalnie można dodać 50 odczynników osobistych.")
+        if many and len(request.data) > self.bulk_create_max_size:
+            raise exceptions.RequestDataError(
+                f"Maksymalnie można dodać {self.bulk_create_max_size} odczynników osobistych."
+            )
 
         serializer = self.get_serializer(data=request.data, many=many)
         serializer.is_valid(raise_exception=True)
@@ -667,6 +835,11 @@ class PersonalReagentViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPaginat
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        if isinstance(serializer, serializers.BulkCreateListSerializer):
+            invalidate_statistics_and_facets()
+
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
 
@@ -680,6 +853,89 @@ class PersonalReagentViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPaginat
 
         return super().update(request=request, *args, **kwargs)
 
+    @action(
+        detail=False,
+        methods=["patch"],
+        url_path="bulk",
+    )
+    def bulk_partial_update(self, request):
+        """Apply the same changes to all personal reagents with the given ids in a single transaction.
+        The permissions are the same as for updating the personal reagents one by one,
+        but they are checked for the whole set with a few queries.
+        """
+        serializer = serializers.PersonalReagentBulkUpdateSerializer(
+            data=request.data, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data["ids"])
+        changes = serializer.validated_data["changes"]
+        if len(ids) > self.bulk_update_max_size:
+            raise exceptions.RequestDataError(
+                f"Maksymalnie można zmienić {self.bulk_update_max_size} odczynników osobistych."
+            )
+
+        with transaction.atomic():
+            personal_reagents = list(self.model.objects.filter(id__in=ids).select_for_update().order_by("id"))
+            if missing_ids := ids - {personal_reagent.id for personal_reagent in personal_reagents}:
+                raise NotFound(
+                    f"Nie znaleziono odczynników osobistych: {', '.join(map(str, sorted(missing_ids)))}."
+                )
+
+            queryset = self.model.objects.filter(id__in=ids)
+            self.check_bulk_update_permissions(queryset, changes)
+            serializers.validate_personal_reagents_changes(queryset, changes)
+
+            fields = set(changes)
+            today = datetime.date.today()
+            for personal_reagent in personal_reagents:
+                if "is_archived" in changes and personal_reagent.is_archived != changes["is_archived"]:
+                    personal_reagent.disposal_utilization_date = today if changes["is_archived"] else None
+                    fields.add("disposal_utilization_date")
+                for field_name, value in changes.items():
+                    setattr(personal_reagent, field_name, value)
+
+            bulk_update_with_history(
+                personal_reagents,
+                self.model,
+                sorted(fields),
+                batch_size=serializers.BulkCreateListSerializer.batch_size,
+            )
+            versions.bump_versions(self.model)
+
+        invalidate_statistics_and_facets()
+
+        return Response({"count": len(personal_reagents)})
+
+    def check_bulk_update_permissions(self, personal_reagents, changes):
+        """The set-based equivalent of `PersonalReagentPermission.has_object_permission`
+        and of the fields of the serializer chosen by `get_serializer_class` for `partial_update`.
+        """
+        user = self.request.user
+        if user.is_staff:
+            return
+
+        own = Q(main_owner=user)
+        if models.User.LAB_MANAGER in user.lab_roles:
+            # Lab managers can change only the owner and archive personal reagents of others
+            if set(changes) - {"main_owner", "is_archived"} and personal_reagents.exclude(own).exists():
+                raise PermissionDenied(
+                    "Można zmieniać wyłącznie właściciela i archiwizować cudze odczynniki osobiste."
+                )
+            if "main_owner" in changes and personal_reagents.filter(own).exists():
+                raise PermissionDenied("Nie można zmienić właściciela własnych odczynników osobistych.")
+            return
+
+        managed = Q(project_procedure__manager=user)
+        if personal_reagents.exclude(own | managed).exists():
+            raise PermissionDenied("Nie masz uprawnień do zmiany wszystkich wybranych odczynników osobistych.")
+        # Only project managers get the serializer with `main_owner` for the personal reagents of their projects
+        if "main_owner" in changes and (
+            models.User.PROJECT_MANAGER not in user.lab_roles or personal_reagents.exclude(managed).exists()
+        ):
+            raise PermissionDenied(
+                "Właściciela można zmienić wyłącznie w odczynnikach z zarządzanych projektów/procedur."
+            )
+
     @action_paginate(
         detail=False,
         url_path="history",
@@ -720,111 +976,235 @@ class PersonalReagentViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPaginat
             ),
         )
 
+    # Filter name: the filtered field and the field which represents its values (if it's a relation)
+    facet_fields = {
+        "laboratory": ("laboratory", "laboratory__laboratory"),
+        "project_procedure": ("project_procedure", "project_procedure__name"),
+        "main_owner": ("main_owner", "main_owner__username"),
+        "reagent": ("reagent", "reagent__name"),
+        "type": ("reagent__type", "reagent__type__type"),
+        "producer": ("reagent__producer", "reagent__producer__abbreviation"),
+        "clp_classification": (
+            "reagent__hazard_statements__clp_classification",
+            "reagent__hazard_statements__clp_classification__clp_classification",
+        ),
+        "room": ("room", None),
+        "detailed_location": ("detailed_location", None),
+        "cas_no": ("reagent__cas_no", None),
+    }
+
     @action(
         detail=False,
-        url_path="report/sanepid-pip",
+        url_path="facets",
     )
-    def generate_sanepid_pip_report(self, request):
-        user = request.user
+    def get_facets(self, request):
+        """Values of the filters with the numbers of personal reagents matching the query params for each of them."""
+        query_string = urlencode(sorted(request.query_params.lists()), doseq=True)
+        facets = filters.get_cached_facets(
+            f"personal_reagents:{query_string}", self.generate_facets, self.filter_queryset(self.get_queryset())
+        )
+        return Response(facets)
+
+    def generate_facets(self, queryset):
+        queryset = queryset.order_by()
+        facets = {}
+        for name, (field, repr_field) in self.facet_fields.items():
+            if repr_field is None:
+                facets[name] = [
+                    {
+                        "value": facet[field],
+                        "count": facet["count"],
+                    } for facet in queryset.values(field).annotate(count=Count("id", distinct=True)).order_by(field)
+                ]
+            else:
+                facets[name] = [
+                    {
+                        "id": facet[field],
+                        "repr": facet[repr_field],
+                        "count": facet["count"],
+                    } for facet in queryset.values(
+                        field, repr_field
+                    ).annotate(
+                        count=Count("id", distinct=True)
+                    ).order_by(repr_field, field)
+                ]
+
+        return facets
+
+    # Report type, report data generator, data font size and filename prefix of each report action
+    reports = {
+        "generate_sanepid_pip_report": (
+            models.ReportJob.SANEPID_PIP,
+            generators.generate_sanepid_pip_report_data,
+            6,
+            "raport_sanepid_pip",
+        ),
+        "generate_lab_manager_report": (
+            models.ReportJob.LAB_MANAGER,
+            generators.generate_lab_manager_report_data,
+            5,
+            "raport_kierownika_laboratorium",
+        ),
+        "generate_projects_procedures_report": (
+            models.ReportJob.PROJECTS_PROCEDURES,
+            generators.generate_projects_procedures_report_data,
+            5,
+            "raport_kierownika_projektu_procedury",
+        ),
+        "generate_all_personal_reagents_report": (
+            models.ReportJob.ALL,
+            generators.generate_all_personal_reagents_report_data,
+            3,
+            "raport_wszystkie_odczynniki_osobiste",
+        ),
+        "generate_personal_view_report": (
+            models.ReportJob.PERSONAL_VIEW,
+            generators.generate_personal_view_report_data,
+            3,
+            "raport_moje_odczynniki_osobiste",
+        ),
+    }
+
+    report_formats = ["pdf", "csv", "xlsx"]
+
+    def perform_content_negotiation(self, request, force=False):
+        # For the reports the `format` query param chooses the type of the file, not the renderer
+        return super().perform_content_negotiation(request, force=force or self.action in self.reports)
+
+    def get_report_format(self):
+        report_format = self.request.query_params.get("format", "pdf")
+        if report_format not in self.report_formats:
+            raise exceptions.QueryParamError(
+                f"Parametr `format` musi mieć jedną z wartości: {', '.join(self.report_formats)}."
+            )
+        return report_format
+
+    def get_report_queryset(self):
+        queryset = self.get_queryset()
+        if self.action == "generate_personal_view_report":
+            queryset = queryset.filter(main_owner=self.request.user)
+        return self.filter_queryset(queryset)
+
+    def get_report_data(self):
+        """Return the rows of the report of the current action, fetched from the database in chunks."""
+        _, generate_report_data, *_ = self.reports[self.action]
+        return generate_report_data(self.get_report_queryset().iterator(chunk_size=self.streaming_chunk_size))
+
+    def get_report_filename(self, report_format):
+        _, _, _, filename_prefix = self.reports[self.action]
+        return get_valid_filename(f"{filename_prefix}_{self.request.user.username}.{report_format}")
+
+    def generate_report(self):
+        """Generate the report of the current action in the requested format. Return the buffer and the filename."""
+        user = self.request.user
+        report_format = self.get_report_format()
+        _, _, data_font_size, _ = self.reports[self.action]
 
         if (report_header := self.request.query_params.get("report_header")) is None:
             report_header = "SPIS ODCZYNNIKÓW LABORATORIUM"
 
-        report_data = generators.generate_sanepid_pip_report_data(self.filter_queryset(self.get_queryset()))
-        io_buffer = generators.generate_report(report_header, user, report_data, data_font_size=6)
+        report_data = self.get_report_data()
+        if report_format == "csv":
+            io_buffer = tempfile.TemporaryFile()
+            for line in generators.generate_csv_report(report_data):
+                io_buffer.write(line.encode("utf-8"))
+        elif report_format == "xlsx":
+            io_buffer = generators.generate_xlsx_report(report_header, user, report_data)
+        else:
+            io_buffer = generators.generate_report(report_header, user, report_data, data_font_size=data_font_size)
 
         io_buffer.seek(0)
-        return FileResponse(
-            io_buffer,
-            as_attachment=True,
-            filename=get_valid_filename(f"raport_sanepid_pip_{user.username}.pdf"),
+        return io_buffer, self.get_report_filename(report_format)
+
+    @classmethod
+    def generate_report_for_job(cls, report_job):
+        """Generate the report of the job as if its requester has sent a GET request with the job's query params."""
+        http_request = HttpRequest()
+        http_request.method = "GET"
+        http_request.GET = QueryDict(report_job.query_string)
+        request = Request(http_request)
+        request.user = report_job.requester
+
+        action_name = next(
+            action_name for action_name, (report_type, *_) in cls.reports.items()
+            if report_type == report_job.report_type
         )
+        view = cls(request=request, action=action_name, format_kwarg=None, args=(), kwargs={})
+        # The requester could have been deactivated or lost the roles since the job was enqueued
+        if not report_job.requester.is_active:
+            raise PermissionDenied("Konto zlecającego raport jest nieaktywne.")
+        view.check_permissions(request)
+        return view.generate_report()
+
+    def get_report_response(self, request):
+        """GET returns the report as a PDF, CSV or XLSX file (the `format` query param). CSV files are streamed
+        while the rows are fetched. POST enqueues a job which generates the report in the background
+        (see `python manage.py process_report_jobs`) and returns the job, whose status can be polled
+        at `/report-jobs/{id}/`."""
+        report_format = self.get_report_format()
+        if request.method == "POST":
+            # Invalid filters are reported now instead of failing the job later
+            self.get_report_queryset()
+            report_job = models.ReportJob.objects.create(
+                requester=request.user,
+                report_type=self.reports[self.action][0],
+                query_string=request.META.get("QUERY_STRING", ""),
+            )
+            serializer = serializers.ReportJobSerializer(report_job, context=self.get_serializer_context())
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+        if report_format == "csv":
+            # Invalid filters are reported before the response starts
+            report_data = self.get_report_data()
+            filename = self.get_report_filename(report_format)
+            return StreamingHttpResponse(
+                generators.generate_csv_report(report_data),
+                content_type="text/csv; charset=utf-8",
+                headers={"Content-Disposition": content_disposition_header(True, filename)},
+            )
+
+        io_buffer, filename = self.generate_report()
+        return FileResponse(io_buffer, as_attachment=True, filename=filename)
+
+    @action(
+        detail=False,
+        methods=["get", "post"],
+        url_path="report/sanepid-pip",
+    )
+    def generate_sanepid_pip_report(self, request):
+        return self.get_report_response(request)
 
     @action(
         detail=False,
+        methods=["get", "post"],
         url_path="report/lab-manager",
     )
     def generate_lab_manager_report(self, request):
-        user = request.user
-
-        if (report_header := self.request.query_params.get("report_header")) is None:
-            report_header = "SPIS ODCZYNNIKÓW LABORATORIUM"
-
-        io_buffer = io.BytesIO()
-
-        report_data = generators.generate_lab_manager_report_data(self.filter_queryset(self.get_queryset()))
-        io_buffer = generators.generate_report(report_header, user, report_data, data_font_size=5)
-
-        io_buffer.seek(0)
-        return FileResponse(
-            io_buffer,
-            as_attachment=True,
-            filename=get_valid_filename(f"raport_kierownika_laboratorium_{user.username}.pdf"),
-        )
+        return self.get_report_response(request)
 
     @action(
         detail=False,
+        methods=["get", "post"],
         url_path="report/projects-procedures",
     )
     def generate_projects_procedures_report(self, request):
-        user = request.user
-
-        if (report_header := self.request.query_params.get("report_header")) is None:
-            report_header = "SPIS ODCZYNNIKÓW LABORATORIUM"
-
-        report_data = generators.generate_projects_procedures_report_data(self.filter_queryset(self.get_queryset()))
-        io_buffer = generators.generate_report(report_header, user, report_data, data_font_size=5)
-
-        io_buffer.seek(0)
-        return FileResponse(
-            io_buffer,
-            as_attachment=True,
-            filename=get_valid_filename(f"raport_kierownika_projektu_procedury_{user.username}.pdf"),
-        )
+        return self.get_report_response(request)
 
     @action(
         detail=False,
+        methods=["get", "post"],
         url_path="report/all",
     )
     def generate_all_personal_reagents_report(self, request):
-        user = request.user
-
-        if (report_header := self.request.query_params.get("report_header")) is None:
-            report_header = "SPIS ODCZYNNIKÓW LABORATORIUM"
-
-        report_data = generators.generate_all_personal_reagents_report_data(
-            self.filter_queryset(self.get_queryset())
-        )
-
-        io_buffer = generators.generate_report(report_header, user, report_data, data_font_size=3)
-
-        io_buffer.seek(0)
-        return FileResponse(
-            io_buffer,
-            as_attachment=True,
-            filename=get_valid_filename(f"raport_wszystkie_odczynniki_osobiste_{user.username}.pdf"),
-        )
+        return self.get_report_response(request)
 
     @action(
         detail=False,
+        methods=["get", "post"],
         url_path="report/personal-view",
     )
     def generate_personal_view_report(self, request):
-        user = request.user
-
-        if (report_header := self.request.query_params.get("report_header")) is None:
-            report_header = "SPIS ODCZYNNIKÓW LABORATORIUM"
-
-        my_personal_reagents = self.get_queryset().filter(main_owner=user)
-        report_data = generators.generate_personal_view_report_data(self.filter_queryset(my_personal_reagents))
-        io_buffer = generators.generate_report(report_header, user, report_data, data_font_size=3)
-
-        io_buffer.seek(0)
-        return FileResponse(
-            io_buffer,
-            as_attachment=True,
-            filename=get_valid_filename(f"raport_moje_odczynniki_osobiste_{user.username}.pdf"),
-        )
+        return self.get_report_response(request)
 
     @action(
         detail=False,
@@ -834,29 +1214,44 @@ class PersonalReagentViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPaginat
         user = request.user
         user_personal_reagents = self.get_queryset().filter(main_owner=user)
 
+        admin_statistics = partial(generators.get_cached_statistics, "admin", generators.generate_admin_statistics)
+        lab_manager_statistics = partial(
+            generators.get_cached_statistics, "lab_manager", generators.generate_lab_manager_statistics
+        )
+        project_manager_statistics = partial(
+            generators.get_cached_statistics, "project_manager", generators.generate_project_manager_statistics
+        )
+        lab_worker_statistics = partial(
+            generators.get_cached_statistics,
+            f"lab_worker:{user.id}",
+            generators.generate_lab_worker_statistics,
+            user_personal_reagents,
+            user,
+        )
+
         if user.is_staff:
             return Response(
-                generators.generate_admin_statistics()
-                | generators.generate_lab_manager_statistics()
-                | generators.generate_project_manager_statistics()
-                | generators.generate_lab_worker_statistics(user_personal_reagents, user)
+                admin_statistics()
+                | lab_manager_statistics()
+                | project_manager_statistics()
+                | lab_worker_statistics()
             )
 
         if models.User.LAB_MANAGER in user.lab_roles:
             return Response(
-                generators.generate_lab_manager_statistics()
-                | generators.generate_project_manager_statistics()
-                | generators.generate_lab_worker_statistics(user_personal_reagents, user)
+                lab_manager_statistics()
+                | project_manager_statistics()
+                | lab_worker_statistics()
             )
 
         if models.User.PROJECT_MANAGER in user.lab_roles:
             return Response(
-                generators.generate_project_manager_statistics()
-                | generators.generate_lab_worker_statistics(user_personal_reagents, user)
+                project_manager_statistics()
+                | lab_worker_statistics()
             )
 
         if models.User.LAB_WORKER in user.lab_roles:
-            return Response(generators.generate_lab_worker_statistics(user_personal_reagents, user))
+            return Response(lab_worker_statistics())
 
         raise PermissionDenied()
 
@@ -866,6 +1261,10 @@ class NotificationViewSet(ReadOnlyModelViewSetWithOptionalPagination):
     permission_classes = [permissions.NotificationPermission]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = []
+    # The summary is cached per user until the change version of any of the models it depends on changes
+    summary_cache = cache.Namespace("notifications_summary", timeout=60 * 60)
+    summary_max_limit = 100
+    close_expiration_date_max_days_ahead = 3650
 
     def get_queryset(self):
         if self.action in (
@@ -873,6 +1272,7 @@ class NotificationViewSet(ReadOnlyModelViewSetWithOptionalPagination):
             "get_reagents_with_close_expiration_date",
             "get_reagents_with_not_generated_usage_records",
             "get_few_critical_reagents",
+            "get_notifications_summary",
         ):
             return models.PersonalReagent.objects.select_related("reagent").order_by("id")
         if self.action == "get_reagent_requests":
@@ -903,36 +1303,42 @@ class NotificationViewSet(ReadOnlyModelViewSetWithOptionalPagination):
         url_path="reagents/pending-validation-fields",
     )
     def get_reagent_fields_with_pending_validation(self, request):
+        # Additional field for easier display in the frontend grid
+        return EnumeratedRows(self.get_reagent_fields_with_pending_validation_queryset(), self.streaming_chunk_size)
+
+    @staticmethod
+    def get_reagent_fields_with_pending_validation_queryset():
+        # Expressions equivalent to `__str__()` of the models
         reagent_field_models_with_pending_validation = [
-            models.ReagentType,
-            models.Producer,
-            models.Concentration,
-            models.Unit,
-            models.PurityQuality,
-            models.StorageCondition,
-            models.SafetyDataSheet,
-            models.SafetyInstruction,
-            models.Reagent,
+            (models.ReagentType, F("type")),
+            (
+                models.Producer,
+                Concat(
+                    Value("["), "abbreviation", Value("] ["), "brand_name", Value("] "), "producer_name",
+                    output_field=CharField(),
+                ),
+            ),
+            (models.Concentration, F("concentration")),
+            (models.Unit, F("unit")),
+            (models.PurityQuality, F("purity_quality")),
+            (models.StorageCondition, F("storage_condition")),
+            (models.SafetyDataSheet, F("name")),
+            (models.SafetyInstruction, F("name")),
+            (models.Reagent, F("name")),
         ]
 
-        reagent_fields_with_pending_validation = []
-
-        # Additional field for easier display in the frontend grid
-        idx = 1
-        for reagent_field_model in reagent_field_models_with_pending_validation:
-            reagent_models_with_pending_validation = reagent_field_model.objects.filter(is_validated_by_admin=False)
-            for reagent_model in reagent_models_with_pending_validation:
-                reagent_fields_with_pending_validation.append(
-                    {
-                        "id": idx,
-                        "pk": reagent_model.id,
-                        "table_name": reagent_field_model.__name__,
-                        "value": str(reagent_model),
-                    },
-                )
-                idx += 1
-
-        return reagent_fields_with_pending_validation
+        # A single UNION ALL query which is paginated in the database
+        querysets = [
+            reagent_field_model.objects.filter(
+                is_validated_by_admin=False,
+            ).order_by().annotate(
+                table_order=Value(table_order),
+                table_name=Value(reagent_field_model.__name__, output_field=CharField()),
+                value=value,
+            ).values("table_order", "table_name", "value", pk=F("id"))
+            for table_order, (reagent_field_model, value) in enumerate(reagent_field_models_with_pending_validation)
+        ]
+        return querysets[0].union(*querysets[1:], all=True).order_by("table_order", "pk")
 
     @action_paginate(
         detail=False,
@@ -940,20 +1346,22 @@ class NotificationViewSet(ReadOnlyModelViewSetWithOptionalPagination):
     )
     def get_reagents_with_close_expiration_date(self, request):
         user = request.user
-        personal_reagents_with_close_expiration_date = self.get_queryset()
+        personal_reagents_with_close_expiration_date = self.filter_reagents_with_close_expiration_date(
+            self.get_queryset(), user
+        )
+
+        # A year is translated into a range of dates, so that the index on `expiration_date` can be used
+        month = year = None
         if (month_param := request.query_params.get("month")) is not None:
             wrong_month_exception = exceptions.QueryParamError(
                 "Parametr `month` musi być liczbą całkowitą w zakresie od 1 do 12."
             )
             try:
                 month = int(month_param)
-                if not 1 <= month <= 12:
-                    raise wrong_month_exception
-                personal_reagents_with_close_expiration_date = personal_reagents_with_close_expiration_date.filter(
-                    expiration_date__month=month
-                )
             except ValueError as exception:
                 raise wrong_month_exception from exception
+            if not 1 <= month <= 12:
+                raise wrong_month_exception
 
         if (year_param := request.query_params.get("year")) is not None:
             wrong_year_exception = exceptions.QueryParamError(
@@ -961,38 +1369,170 @@ class NotificationViewSet(ReadOnlyModelViewSetWithOptionalPagination):
             )
             try:
                 year = int(year_param)
-                if year < 1899:
-                    raise wrong_year_exception
-                personal_reagents_with_close_expiration_date = personal_reagents_with_close_expiration_date.filter(
-                    expiration_date__year=year
-                )
             except ValueError as exception:
                 raise wrong_year_exception from exception
+            if not 1899 <= year < datetime.MAXYEAR:
+                raise wrong_year_exception
+
+        if year is not None:
+            personal_reagents_with_close_expiration_date = personal_reagents_with_close_expiration_date.filter(
+                self.get_expiration_date_range(year, month)
+            )
+        elif month is not None:
+            # The month of every year. The rows are already narrowed down to the user's personal reagents
+            # by the index on `main_owner` (see `filter_reagents_with_close_expiration_date`).
+            personal_reagents_with_close_expiration_date = personal_reagents_with_close_expiration_date.filter(
+                expiration_date__month=month
+            )
+
+        if (days_ahead_param := request.query_params.get("days_ahead")) is not None:
+            wrong_days_ahead_exception = exceptions.QueryParamError(
+                "Parametr `days_ahead` musi być liczbą całkowitą w zakresie "
+                f"od 0 do {self.close_expiration_date_max_days_ahead}."
+            )
+            try:
+                days_ahead = int(days_ahead_param)
+            except ValueError as exception:
+                raise wrong_days_ahead_exception from exception
+            if not 0 <= days_ahead <= self.close_expiration_date_max_days_ahead:
+                raise wrong_days_ahead_exception
+
+            today = datetime.date.today()
+            personal_reagents_with_close_expiration_date = personal_reagents_with_close_expiration_date.filter(
+                expiration_date__gte=today,
+                expiration_date__lt=today + datetime.timedelta(days=days_ahead + 1),
+            )
 
-        personal_reagents_with_close_expiration_date = personal_reagents_with_close_expiration_date.filter(
-            main_owner=user,
-            is_archived=False,
-        )
         return personal_reagents_with_close_expiration_date
 
+    @staticmethod
+    def get_expiration_date_range(year, month=None):
+        """Return a condition for the half-open range of dates of the month of the year, or of the whole year."""
+        if month is None:
+            start, end = datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+        else:
+            start, end = datetime.date(year, month, 1), datetime.date(year + month // 12, month % 12 + 1, 1)
+        return Q(expiration_date__gte=start, expiration_date__lt=end)
+
     @action_paginate(
         detail=False,
         url_path="reagents/not-generated-usage-records",
     )
     def get_reagents_with_not_generated_usage_records(self, request):
-        user = request.user
-        reagents_with_usage_record_not_generated = self.get_queryset().filter(
-            main_owner=user, reagent__is_usage_record_required=True, is_usage_record_generated=False
-        )
-        return reagents_with_usage_record_not_generated
+        return self.filter_reagents_with_not_generated_usage_records(self.get_queryset(), request.user)
 
     @action_paginate(
         detail=False,
         url_path="reagents/few-critical",
     )
     def get_few_critical_reagents(self, request):
+        return self.filter_few_critical_reagents(self.get_queryset(), request.user)
+
+    @action_paginate(
+        detail=False,
+        url_path="reagent-requests",
+        filterset_fields=["status"],
+    )
+    def get_reagent_requests(self, request):
+        return self.filter_reagent_requests(self.filter_queryset(self.get_queryset()), request.user)
+
+    @action(
+        detail=False,
+        url_path="summary",
+    )
+    def get_notifications_summary(self, request):
+        """The numbers of notifications of all kinds (without filters) and optionally the first `limit` of them."""
         user = request.user
-        few_critical_personal_reagents = self.get_queryset().filter(
+        limit_param = request.query_params.get("limit", "0")
+        wrong_limit_exception = exceptions.QueryParamError(
+            f"Parametr `limit` musi być liczbą całkowitą w zakresie od 0 do {self.summary_max_limit}."
+        )
+        try:
+            limit = int(limit_param)
+        except ValueError as exception:
+            raise wrong_limit_exception from exception
+        if not 0 <= limit <= self.summary_max_limit:
+            raise wrong_limit_exception
+
+        # The expiration dates are compared with the current date
+        version = cache.make_version(
+            versions.get_versions(versions.get_related_versioned_models(models.ReagentRequest)),
+            datetime.date.today(),
+        )
+        summary = self.summary_cache.get_or_set(
+            f"{user.id}:{limit}", self.generate_notifications_summary, user, limit, version=version
+        )
+        return Response(summary)
+
+    def generate_notifications_summary(self, user, limit):
+        personal_reagents = self.get_queryset()
+        reagents_with_close_expiration_date = self.filter_reagents_with_close_expiration_date(personal_reagents, user)
+        reagents_with_not_generated_usage_records = self.filter_reagents_with_not_generated_usage_records(
+            personal_reagents, user
+        )
+        few_critical_reagents = self.filter_few_critical_reagents(personal_reagents, user)
+        reagent_requests = self.filter_reagent_requests(
+            models.ReagentRequest.objects.select_related("requester", "personal_reagent__reagent").order_by("id"),
+            user,
+        )
+
+        # Both counts of the user's personal reagents in a single query
+        counts = personal_reagents.filter(main_owner=user).aggregate(
+            reagents_with_close_expiration_date=Count(
+                "id", filter=Q(is_archived=False)
+            ),
+            reagents_with_not_generated_usage_records=Count(
+                "id", filter=Q(reagent__is_usage_record_required=True, is_usage_record_generated=False)
+            ),
+        )
+        counts["few_critical_reagents"] = few_critical_reagents.count()
+        counts["reagent_requests"] = reagent_requests.count()
+
+        sections = {
+            "reagents_with_close_expiration_date": (
+                reagents_with_close_expiration_date,
+                serializers.ReagentsWithCloseExpirationDateNotificationSerializer,
+            ),
+            "reagents_with_not_generated_usage_records": (
+                reagents_with_not_generated_usage_records,
+                serializers.ReagentsWithNotGeneratedUsageRecordsNotificationSerializer,
+            ),
+            "few_critical_reagents": (few_critical_reagents, serializers.ReagentsFewCriticalSerializer),
+            "reagent_requests": (reagent_requests, serializers.ReagentRequestsNotificationSerializer),
+        }
+
+        # Only admins can validate reagents and their fields
+        if user.is_staff:
+            reagent_fields_with_pending_validation = self.get_reagent_fields_with_pending_validation_queryset()
+            counts["reagent_fields_with_pending_validation"] = reagent_fields_with_pending_validation.count()
+            sections["reagent_fields_with_pending_validation"] = (
+                EnumeratedRows(reagent_fields_with_pending_validation, self.streaming_chunk_size),
+                serializers.ReagentFieldsWithPendingValidationNotificationSerializer,
+            )
+
+        summary = {}
+        for name, (queryset, serializer_class) in sections.items():
+            results = []
+            if limit and counts[name]:
+                serializer = serializer_class(queryset[:limit], many=True, context=self.get_serializer_context())
+                results = list(serializer.data)
+            summary[name] = {"count": counts[name], "results": results}
+
+        return summary
+
+    @staticmethod
+    def filter_reagents_with_close_expiration_date(personal_reagents, user):
+        return personal_reagents.filter(main_owner=user, is_archived=False)
+
+    @staticmethod
+    def filter_reagents_with_not_generated_usage_records(personal_reagents, user):
+        return personal_reagents.filter(
+            main_owner=user, reagent__is_usage_record_required=True, is_usage_record_generated=False
+        )
+
+    @staticmethod
+    def filter_few_critical_reagents(personal_reagents, user):
+        return personal_reagents.filter(
             main_owner=user, is_critical=True
         ).values(
             "reagent_id", reagent_name=F("reagent__name")
@@ -1001,20 +1541,10 @@ class NotificationViewSet(ReadOnlyModelViewSetWithOptionalPagination):
         ).filter(
             count__lt=3
         ).order_by("reagent_id")
-        return few_critical_personal_reagents
-
-    @action_paginate(
-        detail=False,
-        url_path="reagent-requests",
-        filterset_fields=["status"],
-    )
-    def get_reagent_requests(self, request):
-        responder = request.user
-        reagent_requests = self.filter_queryset(self.get_queryset()).filter(
-            personal_reagent__main_owner=responder
-        )
 
-        return reagent_requests
+    @staticmethod
+    def filter_reagent_requests(reagent_requests, user):
+        return reagent_requests.filter(personal_reagent__main_owner=user)
 
 
 class ReagentRequestViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPagination):
@@ -1085,6 +1615,65 @@ class ReagentRequestViewSet(ModelViewSetWithHistoricalRecordsAndOptionalPaginati
         return Response(serializer.data)
 
 
+class ReportJobViewSet(ReadOnlyModelViewSetWithOptionalPagination):
+    queryset = models.ReportJob.objects.order_by("-id")
+    serializer_class = serializers.ReportJobSerializer
+    permission_classes = [permissions.ReportJobPermission]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["status", "report_type"]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if not user.is_staff:
+            queryset = queryset.filter(requester=user)
+        return queryset
+
+    @action(
+        detail=True,
+        url_path="download",
+    )
+    def download_report(self, request, pk=None):  # pylint: disable=unused-argument
+        report_job = self.get_object()
+        if report_job.status != models.ReportJob.DONE:
+            raise NotFound("Raport nie został jeszcze wygenerowany.")
+
+        return FileResponse(
+            report_job.report.open("rb"),
+            as_attachment=True,
+            filename=os.path.basename(report_job.report.name),
+        )
+
+
+class ReferenceDataView(APIView):
+    """`{id, repr}` lists of all dictionaries used in the forms in a single response.
+    Its version is the ETag, so an unchanged bundle is answered with `304 Not Modified` to `If-None-Match`."""
+    permission_classes = [permissions.ReferenceDataPermission]
+
+    def get(self, request, *args, **kwargs):
+        version = generators.get_reference_data_version()
+        etag = quote_etag(version)
+        if (response := get_conditional_response(request, etag=etag)) is None:
+            response = Response(generators.get_cached_reference_data(version))
+
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class VersionsView(APIView):
+    """The change versions of the models which keep historical records (see `reagents.versions`).
+    A client compares them with the ones it has seen to find out which of its cached data is stale."""
+    permission_classes = [permissions.ReferenceDataPermission]
+
+    def get(self, request, *args, **kwargs):
+        versioned_models = versions.get_versioned_models()
+        return Response({
+            model._meta.model_name: version  # pylint: disable=protected-access
+            for model, version in zip(versioned_models, versions.get_versions(versioned_models))
+        })
+
+
 class UserManualView(APIView):
     parser_classes = [MultiPartParser]
     permission_classes = [permissions.UserManualPermission]